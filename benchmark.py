@@ -0,0 +1,280 @@
+"""Benchmarks do analisador de dados, executados offline com o cliente LLM simulado.
+
+Execute com `python benchmark.py` (cenários pequenos) ou escolha os tamanhos, por exemplo
+`python benchmark.py --linhas 10000 1000000 10000000 --colunas 10 100 1000 --saida resultados.json`.
+Os CSVs sintéticos ficam em cache no diretório temporário; cenários acima de LIMITE_CELULAS_MEMORIA
+são carregados pelo modo em blocos, como faria a interface com arquivos grandes.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from main import (
+    ANALISADOR_TEXTO, MARCADORES_CONCLUSAO, PALAVRAS_CLASSIFICACAO, PALAVRAS_INSIGHT,
+    AnalisadorDadosInteligente, ImagemGrafico, ler_csv
+)
+from simulacao import ClienteLLMSimulado
+
+LIMITE_CELULAS_MEMORIA = 50_000_000
+DIRETORIO_DADOS = os.path.join(tempfile.gettempdir(), "benchmark_analisador")
+PERGUNTAS = [
+    "Qual a distribuição dos dados?",
+    "Existe correlação entre as variáveis?",
+    "Quais são os outliers?",
+    "Compare as categorias",
+    "Mostre tendências temporais",
+]
+
+FRASES = [
+    "A coluna de vendas apresenta uma tendência de alta nos últimos meses",
+    "Existe uma correlação significante entre preço e quantidade",
+    "Portanto, sugere que o desconto influencia o volume vendido",
+    "O valor máximo observado foi muito maior que a mediana",
+    "Em resumo, a distribuição é assimétrica à direita",
+    "Foram encontrados vários outliers na região sul",
+    "Isso indica que o padrão sazonal se repete a cada trimestre",
+    "A média ficou estável ao longo do período analisado",
+    "Os dados evidenciam uma diminuição no mínimo mensal",
+    "Dessa forma, a categoria B demonstra um desempenho menor",
+]
+
+def gerar_corpus(quantidade=200, sentencas_por_resposta=60, semente=42):
+    """Gera respostas longas com as frases típicas do modelo em ordem aleatória."""
+    gerador = random.Random(semente)
+    perguntas = [
+        "Qual a distribuição das vendas?", "Existe correlação entre preço e quantidade?",
+        "Como foi a evolução no tempo?", "Compare as categorias", "Quais os principais números?"
+    ]
+    return [
+        (gerador.choice(perguntas), ". ".join(gerador.choice(FRASES) for _ in range(sentencas_por_resposta)) + ".")
+        for _ in range(quantidade)
+    ]
+
+def analisar_legado(pergunta, resposta):
+    """Implementação anterior: uma varredura por palavra-chave e uma divisão em sentenças por ocorrência."""
+    pergunta_lower = pergunta.lower()
+    tipo = "geral"
+    for candidato, grupo in PALAVRAS_CLASSIFICACAO:
+        if any(palavra in pergunta_lower for palavra in grupo):
+            tipo = candidato
+            break
+
+    insights = []
+    resposta_lower = resposta.lower()
+    for insight in PALAVRAS_INSIGHT:
+        if insight in resposta_lower:
+            resumo = resposta[:150] + "..."
+            for sentence in resposta.split('.'):
+                if insight in sentence.lower():
+                    resumo = sentence.strip()
+                    break
+            insights.append((insight, resumo))
+
+    conclusoes = []
+    resposta_lower = resposta.lower()
+    for marcador in MARCADORES_CONCLUSAO:
+        if marcador in resposta_lower:
+            for sentence in resposta.split('.'):
+                if marcador in sentence.lower():
+                    conclusoes.append(sentence.strip())
+                    break
+    return tipo, insights, conclusoes
+
+def medir(funcao, corpus, repeticoes=5):
+    """Menor tempo total entre as repetições, em segundos."""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for pergunta, resposta in corpus:
+            funcao(pergunta, resposta)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+def benchmark_analise_texto(corpus=None):
+    corpus = corpus or gerar_corpus()
+
+    def analisar_atual(pergunta, resposta):
+        resultado = ANALISADOR_TEXTO.analisar(pergunta, resposta)
+        return resultado.tipo_analise, resultado.insights, resultado.conclusoes
+
+    # As duas implementações precisam concordar antes de comparar tempos
+    for pergunta, resposta in corpus:
+        assert analisar_atual(pergunta, resposta) == analisar_legado(pergunta, resposta)
+
+    legado = medir(analisar_legado, corpus)
+    atual = medir(analisar_atual, corpus)
+    return {"respostas": len(corpus), "legado_s": legado, "atual_s": atual, "aceleracao": legado / atual}
+
+def gerar_bloco(linhas, colunas, gerador, deslocamento=0):
+    """Bloco com tipos misturados: decimais com ausentes, inteiros, categorias, datas e booleanos."""
+    dados = {}
+    for i in range(colunas):
+        tipo = i % 5
+        if tipo == 0:
+            valores = gerador.normal(100, 15, linhas)
+            valores[gerador.random(linhas) < 0.02] = np.nan
+            dados[f"decimal_{i}"] = valores
+        elif tipo == 1:
+            dados[f"inteiro_{i}"] = gerador.integers(0, 10_000, linhas)
+        elif tipo == 2:
+            dados[f"categoria_{i}"] = np.array([f"grupo_{k}" for k in range(20)])[gerador.integers(0, 20, linhas)]
+        elif tipo == 3:
+            dias = deslocamento + np.arange(linhas)
+            dados[f"data_{i}"] = (np.datetime64("2020-01-01") + dias // 1440).astype(str)
+        else:
+            dados[f"indicador_{i}"] = gerador.random(linhas) < 0.5
+    return pd.DataFrame(dados)
+
+def gerar_csv(linhas, colunas, semente=0, tamanho_bloco=100_000):
+    """Caminho de um CSV sintético com o formato pedido, gerado em blocos e reaproveitado entre execuções."""
+    os.makedirs(DIRETORIO_DADOS, exist_ok=True)
+    caminho = os.path.join(DIRETORIO_DADOS, f"sintetico_{linhas}x{colunas}_{semente}.csv")
+    if os.path.exists(caminho):
+        return caminho
+
+    gerador = np.random.default_rng(semente)
+    temporario = caminho + ".parcial"
+    with open(temporario, "w", newline="") as arquivo:
+        for inicio in range(0, linhas, tamanho_bloco):
+            bloco = gerar_bloco(min(tamanho_bloco, linhas - inicio), colunas, gerador, inicio)
+            bloco.to_csv(arquivo, index=False, header=inicio == 0)
+    os.replace(temporario, caminho)
+    return caminho
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+def benchmark_cenario(linhas, colunas, interacoes=20, latencia_por_token=0.0, repeticoes_prompt=20):
+    caminho = gerar_csv(linhas, colunas)
+    cliente = ClienteLLMSimulado(latencia_por_token=latencia_por_token)
+    analisador = AnalisadorDadosInteligente(None, cliente=cliente)
+    resultado = {"linhas": linhas, "colunas": colunas, "bytes_csv": os.path.getsize(caminho)}
+    etapas = resultado["etapas"] = {}
+
+    if linhas * colunas <= LIMITE_CELULAS_MEMORIA:
+        resultado["modo"] = "memoria"
+        with open(caminho, "rb") as arquivo:
+            conteudo = arquivo.read()
+        dados, etapas["ingestao_s"] = cronometrar(ler_csv, conteudo)
+        del conteudo
+        _, etapas["perfil_e_analise_inicial_s"] = cronometrar(analisador.carregar_informacoes, dados)
+    else:
+        resultado["modo"] = "blocos"
+        _, etapas["ingestao_s"] = cronometrar(analisador.carregar_informacoes_em_blocos, caminho)
+    _, etapas["analise_inicial_s"] = cronometrar(analisador._realizar_analise_inicial)
+
+    contexto = analisador._preparar_contexto_historico()
+    inicio = time.perf_counter()
+    for i in range(repeticoes_prompt):
+        _, tokens = analisador.construtor_prompt.construir(analisador.perfil_dados, PERGUNTAS[i % len(PERGUNTAS)], contexto)
+    etapas["prompt_s"] = (time.perf_counter() - inicio) / repeticoes_prompt
+    resultado["tokens_prompt"] = tokens
+
+    # Renderização sem passar pelo cache de gráficos
+    dados, indice = analisador.conjunto_dados, analisador.indice
+    especificacoes = [analisador._escolher_grafico(pergunta, dados, indice) for pergunta in PERGUNTAS]
+    # A tendência só é escolhida sem categóricas, que os dados sintéticos sempre têm: a redução
+    # da série (min-max e LTTB) é medida à parte, na primeira coluna numérica
+    if indice.numericas:
+        especificacoes.append(("tendencia", (indice.numericas[0],)))
+    graficos = etapas["graficos_s"] = {}
+    for especificacao in especificacoes:
+        if especificacao is None or especificacao[0] in graficos:
+            continue
+        tipo, colunas_grafico = especificacao
+        inicio = time.perf_counter()
+        figura = analisador._renderizar_grafico(tipo, colunas_grafico, dados, indice)
+        ImagemGrafico.a_partir_da_figura(figura, analisador.configuracao_graficos)
+        graficos[tipo] = time.perf_counter() - inicio
+
+    resultado["interacoes"] = benchmark_interacoes(analisador, interacoes)
+    return resultado
+
+def benchmark_interacoes(analisador, quantidade):
+    """Tempo por pergunta e crescimento da memória do processo ao longo da sessão.
+    
+    O tempo é medido numa primeira rodada sem tracemalloc, que deixaria tudo mais lento;
+    a memória, numa segunda rodada de mesmo tamanho que continua a mesma sessão.
+    """
+    def interagir(deslocamento):
+        duracoes = []
+        for i in range(deslocamento, deslocamento + quantidade):
+            pergunta = f"{PERGUNTAS[i % len(PERGUNTAS)]} (interação {i})"
+            _, duracao = cronometrar(analisador.obter_resposta, pergunta)
+            duracoes.append(duracao)
+        return duracoes
+
+    duracoes = np.array(interagir(0) or [0.0])
+    tracemalloc.start()
+    memoria_inicial = tracemalloc.get_traced_memory()[0]
+    interagir(quantidade)
+    memoria_final, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "quantidade": quantidade,
+        "tempo_medio_s": float(duracoes.mean()),
+        "tempo_p95_s": float(np.percentile(duracoes, 95)),
+        "memoria_inicial_bytes": memoria_inicial,
+        "memoria_final_bytes": memoria_final,
+        "pico_memoria_bytes": pico,
+        "crescimento_por_interacao_bytes": (memoria_final - memoria_inicial) / max(quantidade, 1),
+    }
+
+def metadados():
+    try:
+        versao = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        versao = None
+    return {
+        "versao": versao,
+        "data": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+    }
+
+def executar(linhas, colunas, interacoes, latencia_por_token):
+    resultados = {"metadados": metadados(), "analise_texto": benchmark_analise_texto(), "cenarios": []}
+    for quantidade_linhas in linhas:
+        for quantidade_colunas in colunas:
+            resultados["cenarios"].append(
+                benchmark_cenario(quantidade_linhas, quantidade_colunas, interacoes, latencia_por_token)
+            )
+    # ru_maxrss é informado em KiB no Linux
+    resultados["metadados"]["pico_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return resultados
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000], help="ex.: 10000 1000000 10000000")
+    parser.add_argument("--colunas", type=int, nargs="+", default=[10, 100], help="ex.: 10 100 1000")
+    parser.add_argument("--interacoes", type=int, default=20, help="perguntas simuladas por cenário")
+    parser.add_argument("--latencia-por-token", type=float, default=0.0, help="latência do cliente simulado (s)")
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: saída padrão)")
+    argumentos = parser.parse_args()
+
+    resultados = executar(argumentos.linhas, argumentos.colunas, argumentos.interacoes, argumentos.latencia_por_token)
+    texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.saida:
+        with open(argumentos.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto)
+    else:
+        print(texto)
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from simulacao import RESPOSTA_PADRAO, ClienteLLMSimulado
+
+@pytest.fixture
+def dados():
+    aleatorio = np.random.default_rng(0)
+    return pd.DataFrame({
+        "valor": aleatorio.normal(10, 2, 300),
+        "categoria": pd.Categorical(aleatorio.choice(["a", "b", "c"], 300)),
+        "data": pd.date_range("2024-01-01", periods=300, freq="D"),
+    })
+
+@pytest.fixture
+def persistencia(tmp_path):
+    return main.PersistenciaSessoes(str(tmp_path / "sessoes.sqlite3"))
+
+@pytest.fixture
+def criar_analisador(persistencia):
+    """Fábrica de analisadores com cliente simulado; com `id_sessao`, a memória é gravada em `persistencia`"""
+    def criar(respostas=RESPOSTA_PADRAO, id_sessao=None):
+        memoria = None
+        if id_sessao is not None:
+            memoria = main.SistemaMemoria(persistencia=persistencia, id_sessao=id_sessao)
+        return main.AnalisadorDadosInteligente("chave-teste", cliente=ClienteLLMSimulado(respostas), memoria=memoria)
+    return criar
+
+@pytest.fixture(params=[False, True], ids=["bloqueante", "fluxo"])
+def em_fluxo(request):
+    return request.param
+
+def _responder(analisador, pergunta, em_fluxo):
+    """Texto final e gráfico da resposta, consumindo o fluxo por inteiro quando `em_fluxo`"""
+    if not em_fluxo:
+        return analisador.obter_resposta(pergunta)
+    resposta = analisador.obter_resposta_em_fluxo(pergunta)
+    list(resposta)
+    return resposta.texto, resposta.visualizacao
+
+@pytest.fixture
+def responder():
+    return _responder
@@ -1,146 +1,2400 @@
 import os
+import re
 import streamlit as interface
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg")  # Backend sem janela: os gráficos são renderizados fora da thread principal
+from matplotlib.cbook import boxplot_stats
+from matplotlib.figure import Figure
 import seaborn as sns
-from groq import Groq
+from groq import APIConnectionError, APIStatusError, Groq
+import httpx
 import io
-import base64
+import copy
+import hashlib
+import importlib.util
 import json
+import logging
+import random
+import shutil
+import sqlite3
+import threading
+import time
+import tracemalloc
+import unicodedata
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
 from dotenv import load_dotenv
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # pyarrow é opcional; sem ele o pandas usa os tipos NumPy padrão
+    pa = pa_csv = pa_parquet = None
+
+# Sem o pyarrow, o pandas só descompacta zstd com o pacote zstandard
+TEM_ZSTANDARD = importlib.util.find_spec("zstandard") is not None
+
 # Configuração inicial
 load_dotenv()
 
-class SistemaMemoria:
+# Palavras-chave usadas para classificar perguntas e extrair insights e conclusões das respostas
+PALAVRAS_CLASSIFICACAO = (
+    ("distribuicao", ("distribuição", "histograma", "frequência")),
+    ("correlacao", ("correlação", "relação", "associação")),
+    ("tendencia", ("tendência", "evolução", "tempo")),
+    ("comparacao", ("comparação", "diferença", "categoria")),
+)
+PALAVRAS_INSIGHT = (
+    "alta", "baixa", "aumento", "diminuição", "correlação", "significante",
+    "outlier", "padrão", "tendência", "maior", "menor", "máximo", "mínimo"
+)
+MARCADORES_CONCLUSAO = (
+    "concluímos que", "portanto", "dessa forma", "em resumo",
+    "isso indica que", "sugere que", "evidencia", "demonstra"
+)
+
+class ResultadoAnaliseTexto:
+    __slots__ = ("tipo_analise", "insights", "conclusoes")
+    
+    def __init__(self, tipo_analise, insights, conclusoes):
+        self.tipo_analise = tipo_analise
+        self.insights = insights  # [(palavra-chave, sentença que a contém)]
+        self.conclusoes = conclusoes
+
+class AnalisadorTexto:
+    """Extrai classificação, insights e conclusões numa única etapa compartilhada.
+    
+    O texto é convertido para minúsculas uma vez e cada palavra-chave distinta é procurada uma
+    única vez (com `str.find`, em C); a sentença só é recortada na primeira ocorrência.
+    """
+    def __init__(self, classificacao=PALAVRAS_CLASSIFICACAO, insights=PALAVRAS_INSIGHT,
+                 conclusoes=MARCADORES_CONCLUSAO):
+        self.classificacao = classificacao
+        self.insights = insights
+        self.conclusoes = conclusoes
+        # Palavras presentes em mais de um grupo (ex.: "correlação") são procuradas uma vez só
+        self._palavras_resposta = tuple(dict.fromkeys(insights + conclusoes))
+    
+    def classificar(self, pergunta):
+        pergunta_lower = pergunta.lower()
+        for tipo, grupo in self.classificacao:
+            if any(palavra in pergunta_lower for palavra in grupo):
+                return tipo
+        return "geral"
+    
+    def analisar(self, pergunta, resposta):
+        resposta_lower = resposta.lower()
+        if len(resposta_lower) == len(resposta):
+            primeira_sentenca = self._localizar(resposta, resposta_lower)
+        else:
+            # Alguns caracteres mudam de tamanho ao passar para minúsculas; as posições deixam de valer
+            primeira_sentenca = self._localizar_por_sentenca(resposta)
+        
+        insights = [(palavra, primeira_sentenca[palavra]) for palavra in self.insights if palavra in primeira_sentenca]
+        conclusoes = [primeira_sentenca[marcador] for marcador in self.conclusoes if marcador in primeira_sentenca]
+        return ResultadoAnaliseTexto(self.classificar(pergunta), insights, conclusoes)
+    
+    def _localizar(self, resposta, resposta_lower):
+        primeira_sentenca = {}
+        for palavra in self._palavras_resposta:
+            posicao = resposta_lower.find(palavra)
+            if posicao >= 0:
+                inicio = resposta.rfind('.', 0, posicao) + 1
+                fim = resposta.find('.', posicao)
+                primeira_sentenca[palavra] = resposta[inicio:fim if fim >= 0 else None].strip()
+        return primeira_sentenca
+    
+    def _localizar_por_sentenca(self, resposta):
+        sentencas = [(sentenca, sentenca.lower()) for sentenca in resposta.split('.')]
+        primeira_sentenca = {}
+        for palavra in self._palavras_resposta:
+            for sentenca, sentenca_lower in sentencas:
+                if palavra in sentenca_lower:
+                    primeira_sentenca[palavra] = sentenca.strip()
+                    break
+        return primeira_sentenca
+
+ANALISADOR_TEXTO = AnalisadorTexto()
+
+class RegistroAnalise:
+    __slots__ = ("timestamp", "pergunta", "resposta", "metrica", "tipo_analise")
+    
+    def __init__(self, pergunta, resposta, metrica, tipo_analise, timestamp=None):
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.pergunta = pergunta
+        self.resposta = resposta
+        self.metrica = metrica
+        self.tipo_analise = tipo_analise
+
+class RegistroInsight:
+    __slots__ = ("timestamp", "insight", "contexto", "resumo", "sequencia")
+    
+    def __init__(self, insight, contexto, resumo, sequencia, timestamp=None):
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.insight = insight
+        self.contexto = contexto
+        self.resumo = resumo
+        self.sequencia = sequencia
+    
+    @property
+    def chave(self):
+        return (self.insight, self.contexto, self.resumo)
+
+class RegistroPadrao:
+    __slots__ = ("tipo", "descricao", "dados_suporte", "timestamp")
+    
+    def __init__(self, tipo, descricao, dados_suporte, timestamp=None):
+        self.tipo = tipo
+        self.descricao = descricao
+        self.dados_suporte = dados_suporte
+        self.timestamp = timestamp or datetime.now().isoformat()
+
+class RegistroConclusao:
+    __slots__ = ("conclusao", "nivel_confianca", "timestamp", "base_analise")
+    
+    def __init__(self, conclusao, nivel_confianca, base_analise, timestamp=None):
+        self.conclusao = conclusao
+        self.nivel_confianca = nivel_confianca
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.base_analise = base_analise
+
+class SistemaMemoria:
+    """Memória da sessão com capacidade limitada: os registros mais antigos saem primeiro.
+    
+    Insights são deduplicados por (palavra-chave, contexto, resumo) com um conjunto de hashes,
+    e as análises ficam indexadas por tipo, para que consultas não fiquem mais lentas com o tempo.
+    Com uma `PersistenciaSessoes`, cada registro também é anexado em disco e a sessão é
+    restaurada na criação, junto com a referência do dataset a que a memória se refere.
+    """
+    def __init__(self, capacidade_historico=200, capacidade_insights=500, capacidade_conclusoes=200,
+                 capacidade_padroes=100, persistencia=None, id_sessao=None):
+        self.historico_analises = deque(maxlen=capacidade_historico)
+        self.insights_coletados = deque(maxlen=capacidade_insights)
+        self.padroes_detectados = deque(maxlen=capacidade_padroes)
+        self.conclusoes_gerais = deque(maxlen=capacidade_conclusoes)
+        self.contador_interacoes = 0
+        self._chaves_insights = set()
+        self._insights_por_palavra = {}
+        self._analises_por_tipo = {}
+        self._sequencia_insights = 0
+        self.impressao_dataset = None
+        self.descricao_dataset = None
+        self.persistencia = persistencia
+        self.id_sessao = id_sessao
+        if persistencia is not None:
+            self._restaurar()
+    
+    def _persistir(self, tipo, registro):
+        if self.persistencia is not None:
+            dados = {campo: getattr(registro, campo) for campo in registro.__slots__}
+            self.persistencia.anexar_memoria(self.id_sessao, tipo, dados)
+    
+    def _restaurar(self):
+        """Recarrega só o que cabe nos buffers, sem gravar de novo"""
+        persistencia, id_sessao = self.persistencia, self.id_sessao
+        for dados in persistencia.carregar_memoria(id_sessao, "analise", self.historico_analises.maxlen):
+            self._indexar_analise(RegistroAnalise(**dados))
+        for dados in persistencia.carregar_memoria(id_sessao, "insight", self.insights_coletados.maxlen):
+            self._registrar_insight(**dados)
+        for dados in persistencia.carregar_memoria(id_sessao, "padrao", self.padroes_detectados.maxlen):
+            self.padroes_detectados.append(RegistroPadrao(**dados))
+        for dados in persistencia.carregar_memoria(id_sessao, "conclusao", self.conclusoes_gerais.maxlen):
+            self.conclusoes_gerais.append(RegistroConclusao(**dados))
+        self.contador_interacoes = persistencia.contar_memoria(id_sessao, "analise")
+        self.impressao_dataset, self.descricao_dataset = persistencia.obter_dataset(id_sessao)
+    
+    def associar_dataset(self, impressao_digital, descricao=None):
+        """Registra o dataset a que a memória se refere; a `descricao` permite recarregá-lo ao restaurar a sessão"""
+        self.impressao_dataset = impressao_digital
+        self.descricao_dataset = descricao
+        if self.persistencia is not None:
+            self.persistencia.gravar_dataset(self.id_sessao, impressao_digital, descricao)
+    
+    def registrar_analise(self, pergunta, resposta, metrica=None, analise_texto=None):
+        if analise_texto is None:
+            analise_texto = ANALISADOR_TEXTO.analisar(pergunta, resposta)
+        registro = RegistroAnalise(pergunta, resposta, metrica, analise_texto.tipo_analise)
+        self._indexar_analise(registro)
+        self._persistir("analise", registro)
+        self.contador_interacoes += 1
+        
+        # Registra os insights encontrados na resposta
+        for insight, resumo in analise_texto.insights:
+            self._registrar_insight(insight, pergunta[:100], resumo)  # Primeiros 100 caracteres
+        return analise_texto
+    
+    def _indexar_analise(self, registro):
+        # Com o histórico cheio, a análise mais antiga sai também do índice por tipo
+        if len(self.historico_analises) == self.historico_analises.maxlen:
+            removido = self.historico_analises[0]
+            do_mesmo_tipo = self._analises_por_tipo[removido.tipo_analise]
+            do_mesmo_tipo.popleft()
+            if not do_mesmo_tipo:
+                del self._analises_por_tipo[removido.tipo_analise]
+        
+        self.historico_analises.append(registro)
+        self._analises_por_tipo.setdefault(registro.tipo_analise, deque()).append(registro)
+    
+    def _registrar_insight(self, insight, contexto, resumo, sequencia=None, timestamp=None):
+        chave = (insight, contexto, resumo)
+        if chave in self._chaves_insights:
+            return
+        
+        # Com o buffer cheio, o insight mais antigo sai também dos índices
+        if len(self.insights_coletados) == self.insights_coletados.maxlen:
+            removido = self.insights_coletados[0]
+            self._chaves_insights.discard(removido.chave)
+            do_mesmo_tipo = self._insights_por_palavra[removido.insight]
+            do_mesmo_tipo.popleft()
+            if not do_mesmo_tipo:
+                del self._insights_por_palavra[removido.insight]
+        
+        # Registros restaurados já trazem sequência e horário; os novos são gravados em disco
+        novo = sequencia is None
+        self._sequencia_insights = sequencia if not novo else self._sequencia_insights + 1
+        registro = RegistroInsight(insight, contexto, resumo, self._sequencia_insights, timestamp)
+        self.insights_coletados.append(registro)
+        self._chaves_insights.add(chave)
+        self._insights_por_palavra.setdefault(insight, deque()).append(registro)
+        if novo:
+            self._persistir("insight", registro)
+    
+    def adicionar_padrao(self, tipo_padrao, descricao, dados_suporte):
+        registro = RegistroPadrao(tipo_padrao, descricao, dados_suporte)
+        self.padroes_detectados.append(registro)
+        self._persistir("padrao", registro)
+    
+    def adicionar_conclusao(self, conclusao, nivel_confianca="medio"):
+        registro = RegistroConclusao(conclusao, nivel_confianca, self.contador_interacoes)
+        self.conclusoes_gerais.append(registro)
+        self._persistir("conclusao", registro)
+    
+    def obter_resumo_conclusoes(self):
+        if not self.conclusoes_gerais and not self.insights_coletados:
+            return "Ainda não foram identificadas conclusões significativas. Faça mais análises para gerar insights."
+        
+        resumo = "## 📊 Conclusões e Insights Obtidos\n\n"
+        
+        if self.conclusoes_gerais:
+            resumo += "### Principais Conclusões:\n"
+            ultimas = list(islice(reversed(self.conclusoes_gerais), 5))[::-1]  # Últimas 5 conclusões
+            for i, conclusao in enumerate(ultimas, 1):
+                resumo += f"{i}. {conclusao.conclusao} (Confiança: {conclusao.nivel_confianca})\n"
+        
+        if self.insights_coletados:
+            resumo += "\n### Insights Detectados:\n"
+            # Primeiro registro ainda em memória de cada palavra-chave, na ordem em que apareceram
+            primeiros = sorted(
+                (registros[0] for registros in self._insights_por_palavra.values()),
+                key=lambda registro: registro.sequencia
+            )
+            for registro in primeiros[:5]:
+                resumo += f"• **{registro.insight.title()}**: {registro.resumo}\n"
+        
+        resumo += f"\n*Baseado em {self.contador_interacoes} análises realizadas*"
+        return resumo
+    
+    def obter_historico_recente(self, limite=5):
+        return list(islice(reversed(self.historico_analises), limite))[::-1]
+    
+    def obter_historico_por_tipo(self, tipo_analise, limite=5):
+        analises = self._analises_por_tipo.get(tipo_analise, ())
+        return list(islice(reversed(analises), limite))[::-1]
+    
+    def limpar_memoria(self):
+        self.historico_analises.clear()
+        self.insights_coletados.clear()
+        self.padroes_detectados.clear()
+        self.conclusoes_gerais.clear()
+        self.contador_interacoes = 0
+        self._chaves_insights.clear()
+        self._insights_por_palavra.clear()
+        self._analises_por_tipo.clear()
+        if self.persistencia is not None:
+            self.persistencia.limpar_memoria(self.id_sessao)
+
+def calcular_impressao_digital(dataframe):
+    """Gera uma assinatura estável do conteúdo do DataFrame (valores, colunas e tipos)"""
+    assinatura = hashlib.sha256()
+    assinatura.update(repr(list(dataframe.columns)).encode())
+    assinatura.update(repr([str(tipo) for tipo in dataframe.dtypes]).encode())
+    assinatura.update(pd.util.hash_pandas_object(dataframe, index=True).to_numpy().tobytes())
+    return assinatura.hexdigest()
+
+COLUNAS_PERFIL = ["q1", "q3", "limite_inferior", "limite_superior", "outliers", "taxa_ausentes"]
+
+def perfilar_colunas(dataframe, colunas_numericas=None, ausentes=None):
+    """Perfil de outliers (regra 1,5×IQR) das colunas numéricas e taxa de ausentes de todas as colunas.
+    
+    Os quartis saem de uma única chamada a quantile() sobre o bloco numérico e os outliers são
+    contados com reduções NumPy, sem criar DataFrames filtrados. `ausentes` (ex.: IndiceDataset.ausentes)
+    evita mais uma passada pelo DataFrame para contar os nulos.
+    """
+    total_linhas = len(dataframe)
+    taxa_ausentes = taxas_de_ausentes(dataframe, ausentes)
+    
+    if colunas_numericas is None:
+        colunas_numericas = particionar_colunas(dataframe)[0]
+    numericas = dataframe[colunas_numericas]
+    if numericas.shape[1] == 0:
+        return pd.DataFrame(columns=COLUNAS_PERFIL), taxa_ausentes
+    
+    quartis = numericas.quantile([0.25, 0.75])
+    q1, q3 = quartis.iloc[0], quartis.iloc[1]
+    inferior = q1 - 1.5 * (q3 - q1)
+    superior = q3 + 1.5 * (q3 - q1)
+    
+    outliers = {}
+    for coluna, limite_inferior, limite_superior in zip(numericas.columns, inferior.to_numpy(), superior.to_numpy()):
+        valores = numericas[coluna].to_numpy(dtype=float, na_value=np.nan)
+        outliers[coluna] = int(np.count_nonzero((valores < limite_inferior) | (valores > limite_superior)))
+    
+    perfil = pd.DataFrame({
+        "q1": q1,
+        "q3": q3,
+        "limite_inferior": inferior,
+        "limite_superior": superior,
+        "outliers": pd.Series(outliers),
+        "taxa_ausentes": taxa_ausentes[numericas.columns]
+    }, columns=COLUNAS_PERFIL)
+    return perfil, taxa_ausentes
+
+def taxas_de_ausentes(dataframe, ausentes=None):
+    """Fração de nulos por coluna, a partir das contagens em `ausentes` quando houver"""
+    if ausentes is None:
+        ausentes = len(dataframe) - dataframe.count()
+    else:
+        ausentes = pd.Series(ausentes, index=dataframe.columns, dtype=float)
+    return ausentes / len(dataframe) if len(dataframe) else ausentes * np.nan
+
+def particionar_colunas(dataframe):
+    """Separa as colunas em (numéricas, categóricas, datas) pelo tipo, sem percorrer os dados"""
+    numericas, categoricas, datas = [], [], []
+    for coluna, tipo in dataframe.dtypes.items():
+        if pd.api.types.is_bool_dtype(tipo):
+            continue
+        if pd.api.types.is_numeric_dtype(tipo):
+            numericas.append(coluna)
+        elif pd.api.types.is_datetime64_any_dtype(tipo):
+            datas.append(coluna)
+        elif (pd.api.types.is_object_dtype(tipo) or pd.api.types.is_string_dtype(tipo)
+              or isinstance(tipo, pd.CategoricalDtype)):
+            categoricas.append(coluna)
+    return numericas, categoricas, datas
+
+def otimizar_tipos(dataframe, limite_cardinalidade=0.5):
+    """Converte colunas de texto com poucos valores distintos para o tipo `category`"""
+    _, categoricas, _ = particionar_colunas(dataframe)
+    convertidas = {}
+    for coluna in categoricas:
+        serie = dataframe[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            continue
+        if serie.nunique() <= limite_cardinalidade * len(serie):
+            convertidas[coluna] = serie.astype("category")
+    return dataframe.assign(**convertidas) if convertidas else dataframe
+
+def alinhar_tipos(base, bloco):
+    """Põe `bloco` nas colunas e tipos de `base`, unindo as categorias; devolve (base, bloco) alinhados"""
+    if set(bloco.columns) != set(base.columns):
+        raise ValueError("As colunas dos novos dados não correspondem às do dataset carregado")
+    bloco = bloco[list(base.columns)]
+    base_convertidas, bloco_convertidas = {}, {}
+    for coluna, tipo in base.dtypes.items():
+        if bloco[coluna].dtype == tipo:
+            continue
+        if isinstance(tipo, pd.CategoricalDtype):
+            novas = pd.Index(bloco[coluna].dropna().unique()).difference(tipo.categories)
+            if len(novas):
+                tipo = pd.CategoricalDtype(tipo.categories.append(novas))
+                base_convertidas[coluna] = base[coluna].cat.set_categories(tipo.categories)
+        try:
+            bloco_convertidas[coluna] = bloco[coluna].astype(tipo)
+        except (TypeError, ValueError):
+            pass  # Tipos incompatíveis: o concat decide o tipo comum
+    return base.assign(**base_convertidas), bloco.assign(**bloco_convertidas)
+
+def combinar_limite(atual, novo, funcao):
+    """Combina dois mínimos (funcao=min) ou máximos (funcao=max), ignorando valores ausentes"""
+    if pd.isna(atual):
+        return novo
+    if pd.isna(novo):
+        return atual
+    return funcao(atual, novo)
+
+class IndiceDataset:
+    """Metadados por coluna calculados uma vez na carga, para consultas repetidas sem varrer o DataFrame.
+    
+    Guarda a partição de tipos, contagens de valores das categóricas do tipo `category`, mínimo e
+    máximo das numéricas e de datas, e a quantidade de nulos por coluna. Texto que otimizar_tipos
+    deixou como string tem alta cardinalidade (IDs, texto livre): contá-lo custaria quase o tamanho
+    da própria coluna.
+    """
+    def __init__(self, dataframe):
+        self.total_linhas = len(dataframe)
+        self.numericas, self.categoricas, self.datas = particionar_colunas(dataframe)
+        self.contagens = {
+            coluna: dataframe[coluna].value_counts() for coluna in self.categoricas
+            if isinstance(dataframe[coluna].dtype, pd.CategoricalDtype)
+        }
+        
+        self.limites = {}
+        for coluna in self.numericas + self.datas:
+            serie = dataframe[coluna]
+            self.limites[coluna] = {"minimo": serie.min(), "maximo": serie.max()}
+        
+        self.ausentes = self._contar_ausentes(dataframe)
+    
+    @staticmethod
+    def _contar_ausentes(dataframe):
+        return {coluna: int(quantidade) for coluna, quantidade in (len(dataframe) - dataframe.count()).items()}
+    
+    @property
+    def categoricas_contadas(self):
+        """Categóricas com contagens no índice (as do tipo `category`), na ordem do DataFrame"""
+        return [coluna for coluna in self.categoricas if coluna in self.contagens]
+    
+    @property
+    def tamanho_bytes(self):
+        return sum(int(contagem.memory_usage(deep=True)) for contagem in self.contagens.values())
+    
+    def anexar(self, bloco):
+        """Índice das linhas atuais mais `bloco`, sem revisitar as já indexadas.
+        
+        Devolve um novo índice: este pode estar compartilhado entre sessões pelo ArmazemDatasets.
+        """
+        novo = copy.copy(self)
+        novo.contagens, novo.limites = dict(self.contagens), dict(self.limites)
+        
+        for coluna, contagem in self.contagens.items():
+            contagem = contagem.add(bloco[coluna].value_counts(), fill_value=0)
+            novo.contagens[coluna] = contagem.astype("int64").sort_values(ascending=False)
+        
+        for coluna in self.numericas + self.datas:
+            serie, limites = bloco[coluna], self.limites[coluna]
+            novo.limites[coluna] = {
+                "minimo": combinar_limite(limites["minimo"], serie.min(), min),
+                "maximo": combinar_limite(limites["maximo"], serie.max(), max)
+            }
+        
+        ausentes_bloco = self._contar_ausentes(bloco)
+        novo.ausentes = {coluna: quantidade + ausentes_bloco[coluna] for coluna, quantidade in self.ausentes.items()}
+        novo.total_linhas += len(bloco)
+        return novo
+
+class EsbocoQuantis:
+    """Esboço de quantis mesclável com tamanho limitado (centróides ponderados)"""
+    def __init__(self, capacidade=512):
+        self.capacidade = capacidade
+        self.valores = np.empty(0)
+        self.pesos = np.empty(0)
+        self.minimo = np.inf
+        self.maximo = -np.inf
+    
+    @property
+    def total(self):
+        return float(self.pesos.sum())
+    
+    def adicionar(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[~np.isnan(valores)]
+        if valores.size == 0:
+            return
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+        self._comprimir(np.concatenate([self.valores, valores]),
+                        np.concatenate([self.pesos, np.ones(valores.size)]))
+    
+    def mesclar(self, outro):
+        if outro.valores.size == 0:
+            return
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        self._comprimir(np.concatenate([self.valores, outro.valores]),
+                        np.concatenate([self.pesos, outro.pesos]))
+    
+    def _comprimir(self, valores, pesos):
+        ordem = np.argsort(valores, kind="mergesort")
+        valores, pesos = valores[ordem], pesos[ordem]
+        if valores.size > self.capacidade:
+            # Agrupa centróides vizinhos em faixas de mesmo peso acumulado
+            acumulado = np.cumsum(pesos)
+            faixas = ((acumulado - pesos / 2) / acumulado[-1] * self.capacidade).astype(np.int64)
+            inicios = np.flatnonzero(np.r_[True, faixas[1:] != faixas[:-1]])
+            pesos_agrupados = np.add.reduceat(pesos, inicios)
+            valores = np.add.reduceat(valores * pesos, inicios) / pesos_agrupados
+            pesos = pesos_agrupados
+        self.valores, self.pesos = valores, pesos
+    
+    def fracao_abaixo(self, valor):
+        """Fração aproximada dos valores menores que `valor` (função de distribuição acumulada)"""
+        if self.valores.size == 0:
+            return np.nan
+        total = self.total
+        posicoes = np.cumsum(self.pesos) - self.pesos / 2
+        return float(np.interp(valor, np.r_[self.minimo, self.valores, self.maximo],
+                               np.r_[0.0, posicoes, total])) / total
+    
+    def quantil(self, q):
+        if self.valores.size == 0:
+            return np.nan
+        total = self.total
+        posicoes = np.cumsum(self.pesos) - self.pesos / 2
+        return float(np.interp(q * total, np.r_[0.0, posicoes, total],
+                               np.r_[self.minimo, self.valores, self.maximo]))
+
+class EsbocoCardinalidade:
+    """Estimativa do número de valores distintos com memória fixa (os `k` menores hashes vistos).
+    
+    A contagem é exata enquanto houver menos de `k` valores distintos; acima disso o erro
+    relativo fica em torno de 1/sqrt(k) (~3% com k=1024).
+    """
+    def __init__(self, k=1024):
+        self.k = k
+        self.menores = np.empty(0, dtype=np.uint64)
+    
+    def adicionar(self, serie):
+        hashes = pd.util.hash_pandas_object(serie.dropna(), index=False).to_numpy()
+        if len(self.menores) == self.k:
+            hashes = hashes[hashes < self.menores[-1]]
+        self._combinar(np.unique(hashes))
+    
+    def mesclar(self, outro):
+        self._combinar(outro.menores)
+    
+    def _combinar(self, hashes):
+        self.menores = np.union1d(self.menores, hashes)[:self.k]
+    
+    @property
+    def exato(self):
+        return len(self.menores) < self.k
+    
+    def estimar(self):
+        if self.exato:
+            return len(self.menores)
+        # Os k menores hashes cobrem uma fração do espaço de 64 bits proporcional a k / distintos
+        return int(round((self.k - 1) * 2.0 ** 64 / (float(self.menores[-1]) + 1)))
+
+class ContadorCategorias:
+    """Contagem aproximada das categorias mais frequentes com memória limitada"""
+    def __init__(self, capacidade=50):
+        self.capacidade = capacidade
+        self.contagens = {}
+        self.podado = False  # Depois da primeira poda, só as mais frequentes estão em `contagens`
+        self.distintos = EsbocoCardinalidade()  # `contagens` é podado e não serve para contar distintos
+    
+    def adicionar(self, serie):
+        for valor, quantidade in serie.value_counts(dropna=True).items():
+            self.contagens[valor] = self.contagens.get(valor, 0) + int(quantidade)
+        self.distintos.adicionar(serie)
+        if len(self.contagens) > 2 * self.capacidade:
+            self._podar()
+    
+    def mesclar(self, outro):
+        for valor, quantidade in outro.contagens.items():
+            self.contagens[valor] = self.contagens.get(valor, 0) + quantidade
+        self.distintos.mesclar(outro.distintos)
+        if len(self.contagens) > 2 * self.capacidade:
+            self._podar()
+    
+    def _podar(self):
+        self.contagens = dict(self.mais_frequentes(self.capacidade))
+        self.podado = True
+    
+    def mais_frequentes(self, limite=10):
+        return sorted(self.contagens.items(), key=lambda item: item[1], reverse=True)[:limite]
+
+class AmostraReservatorio:
+    """Amostra aleatória uniforme de tamanho fixo sobre um fluxo de blocos (algoritmo R)"""
+    def __init__(self, capacidade=50_000, semente=42):
+        self.capacidade = capacidade
+        self.vistos = 0
+        self.amostra = None
+        self._gerador = np.random.default_rng(semente)
+    
+    def adicionar(self, bloco):
+        if self.amostra is None:
+            self.amostra = bloco.iloc[:0].copy()
+        vagas = self.capacidade - len(self.amostra)
+        if vagas > 0:
+            self.amostra = pd.concat([self.amostra, bloco.iloc[:vagas]], ignore_index=True)
+            self.vistos += min(vagas, len(bloco))
+            bloco = bloco.iloc[vagas:]
+        if len(bloco) == 0:
+            return
+        
+        # Cada linha i do fluxo substitui uma posição aleatória com probabilidade k/i
+        indices = self.vistos + np.arange(1, len(bloco) + 1)
+        destinos = (self._gerador.random(len(bloco)) * indices).astype(np.int64)
+        self.vistos += len(bloco)
+        selecionados = np.flatnonzero(destinos < self.capacidade)
+        if selecionados.size == 0:
+            return
+        
+        # Quando duas linhas disputam a mesma posição, prevalece a mais recente
+        destinos_selecionados = destinos[selecionados][::-1]
+        _, primeiros = np.unique(destinos_selecionados, return_index=True)
+        posicoes = destinos_selecionados[primeiros]
+        linhas = selecionados[::-1][primeiros]
+        manter = np.ones(len(self.amostra), dtype=bool)
+        manter[posicoes] = False
+        self.amostra = pd.concat([self.amostra[manter], bloco.iloc[linhas]], ignore_index=True)
+
+class EstatisticasIncrementais:
+    """Estatísticas por coluna acumuladas bloco a bloco, sem manter o dataset inteiro em memória"""
+    def __init__(self, tamanho_amostra=50_000):
+        self.total_linhas = 0
+        self.colunas = []
+        self.tipos = {}
+        self.numericas = {}
+        self.categoricas = {}
+        self.datas = {}
+        self.ausentes = {}
+        self.primeiras_linhas = None
+        self.reservatorio = AmostraReservatorio(tamanho_amostra)
+        self._assinatura = hashlib.sha256()
+    
+    def adicionar_bloco(self, bloco):
+        if not self.colunas:
+            self._inicializar_colunas(bloco)
+        
+        # O tipo de cada coluna vem do primeiro bloco: uma coluna vazia nele chega como float64 e
+        # pode trazer texto depois. Com valores que não são números, ela passa a ser categórica
+        for coluna in list(self.numericas):
+            serie = bloco[coluna]
+            if not pd.api.types.is_numeric_dtype(serie) and (
+                    pd.to_numeric(serie, errors="coerce").isna() & serie.notna()).any():
+                self._tornar_categorica(coluna, serie.dtype)
+        
+        for coluna, acumulador in self.numericas.items():
+            valores = pd.to_numeric(bloco[coluna], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            validos = valores[~np.isnan(valores)]
+            self.ausentes[coluna] += len(valores) - validos.size
+            if validos.size == 0:
+                continue
+            # Combina média e variância do bloco com as acumuladas (Chan et al.)
+            n_bloco = validos.size
+            media_bloco = validos.mean()
+            m2_bloco = ((validos - media_bloco) ** 2).sum()
+            n_total = acumulador["contagem"] + n_bloco
+            delta = media_bloco - acumulador["media"]
+            acumulador["media"] += delta * n_bloco / n_total
+            acumulador["m2"] += m2_bloco + delta ** 2 * acumulador["contagem"] * n_bloco / n_total
+            acumulador["contagem"] = n_total
+            acumulador["esboco"].adicionar(validos)
+        
+        for coluna, contador in self.categoricas.items():
+            self.ausentes[coluna] += int(bloco[coluna].isna().sum())
+            contador.adicionar(bloco[coluna])
+        
+        # Datas têm quase sempre um valor por linha: só o intervalo interessa
+        for coluna, limites in self.datas.items():
+            serie = bloco[coluna]
+            self.ausentes[coluna] += int(serie.isna().sum())
+            limites["minimo"] = combinar_limite(limites["minimo"], serie.min(), min)
+            limites["maximo"] = combinar_limite(limites["maximo"], serie.max(), max)
+        
+        self._assinatura.update(pd.util.hash_pandas_object(bloco, index=True).to_numpy().tobytes())
+        self.reservatorio.adicionar(bloco)
+        self.total_linhas += len(bloco)
+    
+    def _inicializar_colunas(self, bloco):
+        self.colunas = list(bloco.columns)
+        self.tipos = {coluna: str(tipo) for coluna, tipo in bloco.dtypes.items()}
+        self.primeiras_linhas = bloco.head().copy()
+        self._assinatura.update(repr(self.colunas).encode())
+        for coluna in self.colunas:
+            self.ausentes[coluna] = 0
+            if pd.api.types.is_numeric_dtype(bloco[coluna]) and not pd.api.types.is_bool_dtype(bloco[coluna]):
+                self.numericas[coluna] = {"contagem": 0, "media": 0.0, "m2": 0.0, "esboco": EsbocoQuantis()}
+            elif pd.api.types.is_datetime64_any_dtype(bloco[coluna]):
+                self.datas[coluna] = {"minimo": pd.NaT, "maximo": pd.NaT}
+            else:
+                self.categoricas[coluna] = ContadorCategorias()
+    
+    def _tornar_categorica(self, coluna, tipo):
+        acumulador = self.numericas.pop(coluna)
+        contador = ContadorCategorias()
+        # Os números dos blocos anteriores não foram contados como categorias: a contagem fica
+        # incompleta, tratada como podada (os ausentes já contados continuam valendo)
+        contador.podado = acumulador["contagem"] > 0
+        self.categoricas[coluna] = contador
+        self.tipos[coluna] = str(tipo)
+    
+    @property
+    def impressao_digital(self):
+        return self._assinatura.hexdigest()
+    
+    @property
+    def forma(self):
+        return (self.total_linhas, len(self.colunas))
+    
+    @property
+    def amostra(self):
+        return self.reservatorio.amostra
+    
+    def desvio_padrao(self, coluna):
+        acumulador = self.numericas[coluna]
+        if acumulador["contagem"] < 2:
+            return np.nan
+        return float(np.sqrt(acumulador["m2"] / (acumulador["contagem"] - 1)))
+    
+    def quartis(self, coluna):
+        esboco = self.numericas[coluna]["esboco"]
+        return esboco.quantil(0.25), esboco.quantil(0.75)
+    
+    def perfilar(self):
+        """Mesmo formato de perfilar_colunas, com outliers estimados pelo esboço de quantis"""
+        linhas = {}
+        for coluna, acumulador in self.numericas.items():
+            esboco = acumulador["esboco"]
+            q1, q3 = self.quartis(coluna)
+            inferior, superior = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+            outliers = 0
+            if esboco.minimo < inferior or esboco.maximo > superior:
+                fracao = esboco.fracao_abaixo(inferior) + 1 - esboco.fracao_abaixo(superior)
+                outliers = max(1, int(round(fracao * acumulador["contagem"])))
+            linhas[coluna] = {
+                "q1": q1,
+                "q3": q3,
+                "limite_inferior": inferior,
+                "limite_superior": superior,
+                "outliers": outliers,
+                "taxa_ausentes": self.ausentes[coluna] / self.total_linhas if self.total_linhas else np.nan
+            }
+        perfil = pd.DataFrame.from_dict(linhas, orient="index", columns=COLUNAS_PERFIL)
+        taxa_ausentes = pd.Series({
+            coluna: self.ausentes[coluna] / self.total_linhas if self.total_linhas else np.nan
+            for coluna in self.colunas
+        }, dtype=float)
+        return perfil, taxa_ausentes
+    
+    def descrever(self):
+        """Equivalente aproximado de DataFrame.describe() a partir dos acumuladores"""
+        tabela = {}
+        for coluna, acumulador in self.numericas.items():
+            esboco = acumulador["esboco"]
+            tabela[coluna] = {
+                "count": acumulador["contagem"],
+                "mean": acumulador["media"] if acumulador["contagem"] else np.nan,
+                "std": self.desvio_padrao(coluna),
+                "min": esboco.minimo if acumulador["contagem"] else np.nan,
+                "25%": esboco.quantil(0.25),
+                "50%": esboco.quantil(0.50),
+                "75%": esboco.quantil(0.75),
+                "max": esboco.maximo if acumulador["contagem"] else np.nan,
+            }
+        return pd.DataFrame(tabela)
+
+class CacheLRU:
+    """Dicionário limitado que descarta o item usado há mais tempo, seguro entre threads"""
+    def __init__(self, capacidade=32, limite_bytes=None, medir=None):
+        self.capacidade = capacidade
+        self.limite_bytes = limite_bytes
+        self._medir = medir
+        self._bytes_em_uso = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+    
+    def obter(self, chave, padrao=None):
+        with self._trava:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+    
+    def guardar(self, chave, valor):
+        with self._trava:
+            if chave in self._itens:
+                self._bytes_em_uso -= self._tamanho(self._itens[chave])
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            self._bytes_em_uso += self._tamanho(valor)
+            while len(self._itens) > self.capacidade or (
+                self.limite_bytes is not None and self._bytes_em_uso > self.limite_bytes and len(self._itens) > 1
+            ):
+                _, removido = self._itens.popitem(last=False)
+                self._bytes_em_uso -= self._tamanho(removido)
+    
+    def _tamanho(self, valor):
+        return self._medir(valor) if self._medir is not None else 0
+    
+    def __len__(self):
+        return len(self._itens)
+
+# Renderiza gráficos enquanto a chamada ao LLM está em andamento
+EXECUTOR_GRAFICOS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="grafico")
+
+# Perfis compartilhados entre sessões que analisam o mesmo conteúdo:
+# (PerfilDataset, perfil de outliers, taxa de ausentes), como em perfilar_colunas
+CACHE_PERFIS = CacheLRU(capacidade=32)
+
+# Gráficos já renderizados, por (dataset, tipo, colunas, formato, resolução)
+CACHE_GRAFICOS = CacheLRU(capacidade=256, limite_bytes=64 * 1024 ** 2, medir=lambda imagem: imagem.tamanho_bytes)
+
+def ler_csv(conteudo, compressao=None):
+    """Converte os bytes de um CSV em DataFrame, com tipos Arrow quando o pyarrow está disponível
+    e texto de baixa cardinalidade como `category`"""
+    if pa is not None:
+        if compressao is not None:
+            # O pyarrow descompacta gzip e zstd sozinho, sem depender do pacote zstandard
+            fluxo = pa.input_stream(pa.BufferReader(conteudo), compression=compressao)
+            return otimizar_tipos(tabela_para_pandas(pa_csv.read_csv(fluxo)))
+        return otimizar_tipos(pd.read_csv(io.BytesIO(conteudo), engine="pyarrow", dtype_backend="pyarrow"))
+    return otimizar_tipos(pd.read_csv(io.BytesIO(conteudo), compression=compressao))
+
+def tabela_para_pandas(tabela):
+    """Tabela Arrow em DataFrame com tipos Arrow; colunas dicionário viram `category`, como em otimizar_tipos"""
+    return tabela.to_pandas(types_mapper=lambda tipo: None if pa.types.is_dictionary(tipo) else pd.ArrowDtype(tipo))
+
+def gravar_bytes(caminho, conteudo):
+    with open(caminho, "wb") as arquivo:
+        arquivo.write(conteudo)
+
+class LeitorDatasets:
+    """Lê CSV (também compactado com gzip ou zstd), Parquet e Feather/Arrow IPC.
+    
+    Com um diretório de cache, arquivos Arrow são gravados uma vez com o hash como nome e abertos
+    por memory-map, sem cópia (quando não estão compactados), e CSVs podem ser convertidos uma vez
+    para Parquet, tornando as próximas cargas do mesmo conteúdo quase instantâneas. Com
+    `limite_bytes_cache`, cada gravação remove os arquivos usados há mais tempo até o diretório
+    caber no limite.
+    """
+    EXTENSOES = ("csv", "gz", "zst", "parquet", "feather", "arrow", "ipc")
+    COMPRESSOES = {".gz": "gzip", ".zst": "zstd"}
+    EXTENSOES_CACHE = (".arrow", ".parquet", ".original")
+    
+    def __init__(self, diretorio_cache=None, converter_csv_parquet=False, limite_bytes_cache=None):
+        self.diretorio_cache = diretorio_cache
+        self.converter_csv_parquet = converter_csv_parquet
+        self.limite_bytes_cache = limite_bytes_cache
+        if diretorio_cache is not None:
+            os.makedirs(diretorio_cache, exist_ok=True)
+    
+    @classmethod
+    def identificar(cls, conteudo, nome):
+        """(formato, compressão) pelo conteúdo e, na falta de assinatura conhecida, pela extensão"""
+        nome = (nome or "").lower()
+        if conteudo[:4] == b"PAR1":
+            return "parquet", None
+        if conteudo[:6] == b"ARROW1":
+            return "arrow", None
+        if conteudo[:2] == b"\x1f\x8b":
+            return "csv", "gzip"
+        if conteudo[:4] == b"\x28\xb5\x2f\xfd":
+            return "csv", "zstd"
+        return "csv", cls.COMPRESSOES.get(os.path.splitext(nome)[1])
+    
+    @classmethod
+    def extensoes_suportadas(cls):
+        """Extensões que podem ser lidas neste ambiente, para oferecer no upload"""
+        if pa is not None:
+            return cls.EXTENSOES
+        return ("csv", "gz", "zst") if TEM_ZSTANDARD else ("csv", "gz")
+    
+    @staticmethod
+    def _verificar_suporte(formato, compressao):
+        # O formato vem da assinatura do conteúdo: um .csv pode chegar compactado com zstd
+        if formato != "csv" and pa is None:
+            raise ValueError(f"Leitura de arquivos {formato} requer o pacote pyarrow")
+        if compressao == "zstd" and pa is None and not TEM_ZSTANDARD:
+            raise ValueError("Leitura de arquivos zstd requer o pacote pyarrow ou o zstandard")
+    
+    def __call__(self, conteudo, nome, chave=None):
+        formato, compressao = self.identificar(conteudo, nome)
+        self._verificar_suporte(formato, compressao)
+        
+        if formato == "parquet":
+            return otimizar_tipos(tabela_para_pandas(pa_parquet.read_table(pa.BufferReader(conteudo))))
+        if formato == "arrow":
+            return otimizar_tipos(self._ler_arrow(conteudo, chave))
+        
+        caminho_parquet = self._caminho_cache(conteudo, chave, ".parquet")
+        if self.converter_csv_parquet and pa is not None and caminho_parquet is not None:
+            if os.path.exists(caminho_parquet):
+                self._marcar_uso(caminho_parquet)
+                return tabela_para_pandas(pa_parquet.read_table(caminho_parquet, memory_map=True))
+            dataframe = ler_csv(conteudo, compressao)
+            self._gravar_atomicamente(caminho_parquet, lambda caminho: dataframe.to_parquet(caminho, index=False))
+            return dataframe
+        return ler_csv(conteudo, compressao)
+    
+    def _ler_arrow(self, conteudo, chave):
+        caminho = self._caminho_cache(conteudo, chave, ".arrow")
+        if caminho is None:
+            tabela = pa.ipc.open_file(pa.BufferReader(conteudo)).read_all()
+        else:
+            if os.path.exists(caminho):
+                self._marcar_uso(caminho)
+            else:
+                self._gravar_atomicamente(caminho, lambda destino: gravar_bytes(destino, conteudo))
+            # As colunas apontam direto para as páginas do arquivo, carregadas pelo sistema sob demanda
+            tabela = pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+        return tabela_para_pandas(tabela)
+    
+    def guardar_original(self, fonte):
+        """Grava uma cópia do arquivo enviado (bytes ou arquivo aberto), para recarregá-lo depois; devolve o hash"""
+        if isinstance(fonte, (bytes, bytearray, memoryview)):
+            chave = hashlib.sha256(fonte).hexdigest()
+            gravar = lambda destino: gravar_bytes(destino, fonte)
+        else:
+            fonte.seek(0)
+            assinatura = hashlib.sha256()
+            for pedaco in iter(lambda: fonte.read(1024 ** 2), b""):
+                assinatura.update(pedaco)
+            chave = assinatura.hexdigest()
+            
+            def gravar(destino):
+                fonte.seek(0)
+                with open(destino, "wb") as arquivo:
+                    shutil.copyfileobj(fonte, arquivo)
+        if self.localizar_original(chave) is None:
+            self._gravar_atomicamente(os.path.join(self.diretorio_cache, chave + ".original"), gravar)
+        return chave
+    
+    def localizar_original(self, chave):
+        """Caminho de uma cópia byte a byte do arquivo com esse hash, se houver; o .arrow do cache também serve"""
+        for extensao in (".arrow", ".original"):
+            caminho = os.path.join(self.diretorio_cache, chave + extensao)
+            if os.path.exists(caminho):
+                return self._marcar_uso(caminho)
+        return None
+    
+    def _caminho_cache(self, conteudo, chave, extensao):
+        if self.diretorio_cache is None:
+            return None
+        chave = chave or hashlib.sha256(conteudo).hexdigest()
+        return os.path.join(self.diretorio_cache, chave + extensao)
+    
+    def _gravar_atomicamente(self, caminho, gravar):
+        # Grava num temporário e renomeia: sessões concorrentes nunca leem um arquivo pela metade
+        temporario = f"{caminho}.{uuid.uuid4().hex}.parcial"
+        try:
+            gravar(temporario)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        self.limpar_cache(preservar=caminho)
+    
+    @staticmethod
+    def _marcar_uso(caminho):
+        """Atualiza a data de modificação, que ordena a limpeza do cache (LRU)"""
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return caminho
+    
+    def limpar_cache(self, preservar=None):
+        """Remove os arquivos usados há mais tempo até o cache caber em `limite_bytes_cache`"""
+        if self.diretorio_cache is None or self.limite_bytes_cache is None:
+            return
+        arquivos = []
+        with os.scandir(self.diretorio_cache) as entradas:
+            for entrada in entradas:
+                if entrada.name.endswith(self.EXTENSOES_CACHE) and entrada.is_file():
+                    estado = entrada.stat()
+                    arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        excedente = sum(tamanho for _, tamanho, _ in arquivos) - self.limite_bytes_cache
+        for _, tamanho, caminho in sorted(arquivos):
+            if excedente <= 0:
+                break
+            if caminho == preservar:
+                continue
+            try:
+                # Em POSIX, sessões com o arquivo mapeado em memória continuam lendo normalmente
+                os.remove(caminho)
+            except OSError:
+                continue  # Já removido por outra sessão ou em uso (Windows)
+            excedente -= tamanho
+    
+    @classmethod
+    def ler_em_blocos(cls, fonte, nome, tamanho_bloco):
+        """Itera o arquivo em DataFrames de até `tamanho_bloco` linhas, sem carregá-lo inteiro"""
+        cabecalho = fonte.read(8)
+        fonte.seek(0)
+        formato, compressao = cls.identificar(cabecalho, nome)
+        cls._verificar_suporte(formato, compressao)
+        
+        if formato == "parquet":
+            lotes = pa_parquet.ParquetFile(fonte).iter_batches(batch_size=tamanho_bloco)
+        elif formato == "arrow":
+            leitor = pa.ipc.open_file(fonte)
+            lotes = (leitor.get_batch(i) for i in range(leitor.num_record_batches))
+        else:
+            if compressao is not None and pa is not None:
+                # Descompacta em fluxo com o pyarrow, que traz zstd sem dependências extras
+                fonte, compressao = pa.input_stream(fonte, compression=compressao), None
+            yield from pd.read_csv(fonte, chunksize=tamanho_bloco, compression=compressao)
+            return
+        for lote in lotes:
+            yield lote.to_pandas()
+
+class ReferenciaDataset:
+    """Identificador leve de um dataset; é o que cada sessão guarda no session_state"""
+    def __init__(self, chave, nome, forma):
+        self.chave = chave
+        self.nome = nome
+        self.forma = forma
+
+class EntradaArmazem:
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+        self.tamanho_bytes = int(dataframe.memory_usage(deep=True).sum())
+        self.referencias = 0
+        self.indice = None
+        self.trava_indice = threading.Lock()
+
+class ArmazemDatasets:
+    """Guarda uma única cópia de cada arquivo enviado, compartilhada por todas as sessões do processo"""
+    def __init__(self, orcamento_bytes=2 * 1024 ** 3):
+        self.orcamento_bytes = orcamento_bytes
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+    
+    @property
+    def bytes_em_uso(self):
+        return sum(entrada.tamanho_bytes for entrada in self._entradas.values())
+    
+    def carregar(self, conteudo, nome, leitor=None):
+        """Devolve (referência, DataFrame), reaproveitando o parse se o conteúdo já foi visto.
+        
+        `leitor(conteudo, nome, chave)` converte os bytes, já com otimizar_tipos aplicado; o padrão é um
+        LeitorDatasets sem cache em disco.
+        """
+        chave = hashlib.sha256(conteudo).hexdigest()
+        entrada = self._adquirir(chave)
+        if entrada is None:
+            # O leitor já entrega os tipos otimizados: as sessões usam o DataFrame como está
+            dataframe = (leitor or LeitorDatasets())(conteudo, nome, chave)
+            with self._trava:
+                # Outra sessão pode ter concluído o mesmo parse enquanto este rodava
+                entrada = self._entradas.setdefault(chave, EntradaArmazem(dataframe))
+                entrada.referencias += 1
+                self._entradas.move_to_end(chave)
+                self._despejar()
+        
+        referencia = ReferenciaDataset(chave, nome, entrada.dataframe.shape)
+        # Libera a referência quando a sessão que a detém for descartada
+        weakref.finalize(referencia, self.liberar, chave)
+        return referencia, entrada.dataframe
+    
+    def obter_indice(self, referencia):
+        """IndiceDataset do dataset, calculado na primeira sessão e compartilhado com as seguintes"""
+        with self._trava:
+            entrada = self._entradas.get(referencia.chave)
+        if entrada is None:
+            return None
+        with entrada.trava_indice:
+            if entrada.indice is None:
+                entrada.indice = IndiceDataset(entrada.dataframe)
+                with self._trava:
+                    entrada.tamanho_bytes += entrada.indice.tamanho_bytes
+                    self._despejar()
+        return entrada.indice
+    
+    def _adquirir(self, chave):
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                entrada.referencias += 1
+                self._entradas.move_to_end(chave)
+            return entrada
+    
+    def liberar(self, chave):
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada.referencias > 0:
+                entrada.referencias -= 1
+            self._despejar()
+    
+    def _despejar(self):
+        """Remove datasets sem sessões ativas, do menos recente para o mais recente, até caber no orçamento"""
+        excedente = self.bytes_em_uso - self.orcamento_bytes
+        for chave in list(self._entradas):
+            if excedente <= 0:
+                break
+            entrada = self._entradas[chave]
+            if entrada.referencias == 0:
+                excedente -= entrada.tamanho_bytes
+                del self._entradas[chave]
+
+def formatar_numero(valor):
+    return "nan" if pd.isna(valor) else f"{valor:.4g}"
+
+def estimar_tokens(texto):
+    """Estimativa rápida de tokens (~3,5 caracteres por token em português), sem tokenizador"""
+    return int(np.ceil(len(texto) / 3.5))
+
+class PerfilDataset:
+    """Resumo do dataset calculado uma única vez por carga e reutilizado em todas as perguntas.
+    
+    Guarda uma linha compacta por coluna e uma pontuação de relevância, para que o prompt
+    possa ser montado sob um orçamento de tokens sem voltar ao DataFrame.
+    """
+    def __init__(self, impressao_digital, forma, tipos, amostra, resumos_colunas, relevancia, descricao=None):
+        self.impressao_digital = impressao_digital
+        self.forma = forma
+        self.colunas = list(tipos)
+        self.tipos = tipos
+        self.amostra = amostra
+        self.resumos_colunas = resumos_colunas
+        self.relevancia = relevancia
+        self.descricao = descricao  # Saída de describe() das numéricas, usada para comparar anexos
+    
+    @classmethod
+    def a_partir_do_dataframe(cls, dataframe, impressao_digital, indice=None):
+        descricao = dataframe.describe()
+        total_linhas = len(dataframe)
+        ausentes = taxas_de_ausentes(dataframe, indice.ausentes if indice is not None else None).fillna(0.0)
+        resumos, relevancia = {}, {}
+        for coluna in dataframe.columns:
+            if coluna in descricao.columns:
+                estatisticas = descricao[coluna]
+                resumos[coluna] = cls._resumir_numerica(coluna, dataframe[coluna].dtype, estatisticas, ausentes[coluna])
+                relevancia[coluna] = cls._relevancia_numerica(estatisticas["mean"], estatisticas["std"], ausentes[coluna])
+            elif pd.api.types.is_datetime64_any_dtype(dataframe[coluna]):
+                if indice is not None and coluna in indice.limites:
+                    minimo, maximo = indice.limites[coluna]["minimo"], indice.limites[coluna]["maximo"]
+                else:
+                    minimo, maximo = dataframe[coluna].min(), dataframe[coluna].max()
+                resumos[coluna] = cls._resumir_data(coluna, dataframe[coluna].dtype, minimo, maximo, ausentes[coluna])
+                relevancia[coluna] = 0.5 + ausentes[coluna]
+            else:
+                if indice is not None and coluna in indice.contagens:
+                    contagem = indice.contagens[coluna]
+                else:
+                    contagem = dataframe[coluna].value_counts()
+                contagem = contagem[contagem > 0]
+                resumos[coluna] = cls._resumir_categorica(
+                    coluna, dataframe[coluna].dtype, contagem.head(3).items(), len(contagem), total_linhas, ausentes[coluna]
+                )
+                relevancia[coluna] = 0.5 + ausentes[coluna]
+        return cls(
+            impressao_digital,
+            dataframe.shape,
+            {coluna: str(tipo) for coluna, tipo in dataframe.dtypes.items()},
+            dataframe.head(),
+            resumos,
+            relevancia,
+            descricao
+        )
+    
+    @classmethod
+    def a_partir_de_estatisticas(cls, estatisticas):
+        descricao = estatisticas.descrever()
+        total_linhas = estatisticas.total_linhas
+        resumos, relevancia = {}, {}
+        for coluna in estatisticas.colunas:
+            taxa_ausentes = estatisticas.ausentes[coluna] / total_linhas if total_linhas else 0.0
+            if coluna in estatisticas.numericas:
+                resumos[coluna] = cls._resumir_numerica(coluna, estatisticas.tipos[coluna], descricao[coluna], taxa_ausentes)
+                relevancia[coluna] = cls._relevancia_numerica(
+                    descricao[coluna]["mean"], descricao[coluna]["std"], taxa_ausentes
+                )
+            elif coluna in estatisticas.datas:
+                limites = estatisticas.datas[coluna]
+                resumos[coluna] = cls._resumir_data(
+                    coluna, estatisticas.tipos[coluna], limites["minimo"], limites["maximo"], taxa_ausentes
+                )
+                relevancia[coluna] = 0.5 + taxa_ausentes
+            else:
+                contador = estatisticas.categoricas[coluna]
+                resumos[coluna] = cls._resumir_categorica(
+                    coluna, estatisticas.tipos[coluna], contador.mais_frequentes(3),
+                    contador.distintos.estimar(), total_linhas, taxa_ausentes,
+                    distintos_aproximado=not contador.distintos.exato
+                )
+                relevancia[coluna] = 0.5 + taxa_ausentes
+        return cls(
+            estatisticas.impressao_digital,
+            estatisticas.forma,
+            estatisticas.tipos,
+            estatisticas.primeiras_linhas,
+            resumos,
+            relevancia,
+            descricao
+        )
+    
+    @staticmethod
+    def _resumir_numerica(coluna, tipo, estatisticas, taxa_ausentes):
+        return (
+            f"{coluna} ({tipo}): média={formatar_numero(estatisticas['mean'])}, "
+            f"dp={formatar_numero(estatisticas['std'])}, mín={formatar_numero(estatisticas['min'])}, "
+            f"p25={formatar_numero(estatisticas['25%'])}, p50={formatar_numero(estatisticas['50%'])}, "
+            f"p75={formatar_numero(estatisticas['75%'])}, máx={formatar_numero(estatisticas['max'])}, "
+            f"ausentes={taxa_ausentes:.1%}"
+        )
+    
+    @staticmethod
+    def _resumir_categorica(coluna, tipo, mais_frequentes, distintos, total_linhas, taxa_ausentes,
+                            distintos_aproximado=False):
+        frequentes = ", ".join(
+            f"'{valor}' ({quantidade / total_linhas:.0%})" for valor, quantidade in mais_frequentes
+        ) if total_linhas else ""
+        distintos = f"~{distintos}" if distintos_aproximado else distintos
+        return f"{coluna} ({tipo}): {distintos} valores distintos, mais frequentes {frequentes}, ausentes={taxa_ausentes:.1%}"
+    
+    @staticmethod
+    def _resumir_data(coluna, tipo, minimo, maximo, taxa_ausentes):
+        return f"{coluna} ({tipo}): de {minimo} a {maximo}, ausentes={taxa_ausentes:.1%}"
+    
+    @staticmethod
+    def _relevancia_numerica(media, desvio, taxa_ausentes):
+        # Colunas com mais variação relativa (coeficiente de variação) e mais ausentes vêm primeiro
+        if pd.isna(desvio) or pd.isna(media):
+            return taxa_ausentes
+        coeficiente = desvio / abs(media) if media else 10.0
+        return min(coeficiente, 10.0) / 10.0 + taxa_ausentes
+
+class ConstrutorPrompt:
+    """Monta o prompt dentro de um orçamento de tokens, priorizando as colunas mais relevantes.
+    
+    Ordem de prioridade das colunas: as citadas na pergunta, depois as de maior pontuação em
+    PerfilDataset.relevancia. As demais aparecem só pelo nome enquanto couberem no orçamento.
+    """
+    INSTRUCOES = """
+        Com base no histórico de análises e nos dados atuais, forneça uma resposta completa.
+        Considere padrões já identificados e conclusões anteriores.
+        """
+    
+    def __init__(self, orcamento_tokens=3000, fracao_historico=0.25, colunas_amostra=8, linhas_amostra=3):
+        self.orcamento_tokens = orcamento_tokens
+        self.fracao_historico = fracao_historico
+        self.colunas_amostra = colunas_amostra
+        self.linhas_amostra = linhas_amostra
+    
+    def construir(self, perfil, pergunta, contexto_historico):
+        """Devolve (prompt, tokens estimados)"""
+        cabecalho = f"Pergunta atual: {pergunta}\n{self.INSTRUCOES}"
+        disponivel = self.orcamento_tokens - estimar_tokens(cabecalho)
+        
+        historico = self._truncar(contexto_historico, int(self.orcamento_tokens * self.fracao_historico))
+        disponivel -= estimar_tokens(historico)
+        
+        contexto_dados = self._contexto_dados(perfil, pergunta, disponivel)
+        prompt = f"{historico}\n\n{contexto_dados}\n\n{cabecalho}"
+        return prompt, estimar_tokens(prompt)
+    
+    def _contexto_dados(self, perfil, pergunta, disponivel):
+        linhas = [
+            "Informações do dataset:",
+            f"- Formato: {perfil.forma[0]} linhas × {perfil.forma[1]} colunas",
+            "- Colunas em ordem de relevância para a pergunta:"
+        ]
+        disponivel -= estimar_tokens("\n".join(linhas))
+        ordenadas = self._ordenar_colunas(perfil, pergunta)
+        
+        # Reserva espaço para a amostra das colunas principais e para a lista das demais
+        amostra = perfil.amostra[ordenadas[:self.colunas_amostra]].head(self.linhas_amostra).to_string()
+        texto_amostra = f"- Primeiras linhas (colunas principais):\n{amostra}"
+        reserva_amostra = estimar_tokens(texto_amostra) if estimar_tokens(texto_amostra) <= disponivel // 4 else 0
+        reserva_nomes = disponivel // 10
+        
+        orcamento_detalhes = disponivel - reserva_amostra - reserva_nomes
+        detalhadas = 0
+        for coluna in ordenadas:
+            resumo = f"  * {perfil.resumos_colunas[coluna]}"
+            custo = estimar_tokens(resumo) + 1
+            if custo > orcamento_detalhes:
+                break
+            linhas.append(resumo)
+            orcamento_detalhes -= custo
+            detalhadas += 1
+        
+        restantes = ordenadas[detalhadas:]
+        if restantes:
+            orcamento_nomes = reserva_nomes + orcamento_detalhes
+            nomes = []
+            for coluna in restantes:
+                custo = estimar_tokens(str(coluna)) + 1
+                if custo > orcamento_nomes:
+                    break
+                nomes.append(str(coluna))
+                orcamento_nomes -= custo
+            omitidas = len(restantes) - len(nomes)
+            linhas.append(f"- Demais colunas: {', '.join(nomes)}" + (f" (+{omitidas} omitidas)" if omitidas else ""))
+        
+        if reserva_amostra:
+            linhas.append(texto_amostra)
+        
+        return "\n".join(linhas)
+    
+    def _ordenar_colunas(self, perfil, pergunta):
+        pergunta_normalizada = normalizar_pergunta(pergunta).replace("_", " ")
+        citadas = [
+            coluna for coluna in perfil.colunas
+            if re.search(
+                rf"(?<!\w){re.escape(normalizar_pergunta(str(coluna)).replace('_', ' '))}(?!\w)",
+                pergunta_normalizada
+            )
+        ]
+        demais = sorted(
+            (coluna for coluna in perfil.colunas if coluna not in set(citadas)),
+            key=lambda coluna: perfil.relevancia[coluna],
+            reverse=True
+        )
+        return citadas + demais
+    
+    @staticmethod
+    def _truncar(texto, limite_tokens):
+        limite_caracteres = int(limite_tokens * 3.5)
+        if len(texto) <= limite_caracteres:
+            return texto
+        return texto[:limite_caracteres] + "..."
+
+# Limites a partir dos quais os gráficos passam a usar dados reduzidos
+LIMITE_PONTOS_DISPERSAO = 20_000
+LIMITE_PONTOS_HEXBIN = 200_000
+LIMITE_PONTOS_LINHA = 2_000
+LIMITE_OUTLIERS_BOXPLOT = 2_000
+
+def amostrar_linhas(dataframe, limite, estrato=None, semente=0):
+    """Amostra aleatória de até `limite` linhas; com estrato (coluna ou Series), cada grupo mantém sua proporção"""
+    if len(dataframe) <= limite:
+        return dataframe
+    if estrato is None:
+        return dataframe.sample(n=limite, random_state=semente)
+    
+    return dataframe.groupby(estrato, observed=True, dropna=False).sample(
+        frac=limite / len(dataframe), random_state=semente
+    )
+
+def decimar_min_max(y, baldes):
+    """Índices do mínimo e do máximo de cada balde, preservando picos da série"""
+    n = len(y)
+    tamanho = int(np.ceil(n / baldes))
+    completos = (n // tamanho) * tamanho
+    blocos = y[:completos].reshape(-1, tamanho)
+    deslocamentos = np.arange(0, completos, tamanho)
+    indices = [deslocamentos + blocos.argmin(axis=1), deslocamentos + blocos.argmax(axis=1)]
+    if completos < n:
+        resto = y[completos:]
+        indices.append(np.array([completos + resto.argmin(), completos + resto.argmax()]))
+    return np.unique(np.concatenate(indices))
+
+def decimar_lttb(x, y, limite):
+    """Largest-Triangle-Three-Buckets: escolhe `limite` pontos que preservam a forma da série"""
+    n = len(x)
+    if n <= limite or limite < 3:
+        return np.arange(n)
+    
+    selecionados = np.empty(limite, dtype=np.int64)
+    selecionados[0], selecionados[-1] = 0, n - 1
+    bordas = np.linspace(1, n - 1, limite - 1).astype(np.int64)
+    anterior = 0
+    for i in range(limite - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        proximo_fim = bordas[i + 2] if i + 2 < len(bordas) else n
+        media_x = x[fim:proximo_fim].mean()
+        media_y = y[fim:proximo_fim].mean()
+        # Área do triângulo formado pelo ponto anterior, cada candidato e a média do próximo balde
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(areas.argmax())
+        selecionados[i + 1] = anterior
+    return selecionados
+
+def reduzir_serie(y, limite=LIMITE_PONTOS_LINHA):
+    """Índices de uma série longa (sem nulos) reduzida a cerca de `limite` pontos (min-max seguido de LTTB).
+    
+    O LTTB escolhe um ponto por balde pela área do triângulo e pode descartar o pico global;
+    por isso o mínimo e o máximo da série são sempre incluídos.
+    """
+    n = len(y)
+    if n <= limite:
+        return np.arange(n)
+    indices = np.arange(n)
+    if n > 20 * limite:
+        # Pré-redução vetorizada para que o LTTB percorra poucos pontos
+        indices = decimar_min_max(y, 2 * limite)
+    escolhidos = indices[decimar_lttb(indices.astype(float), y[indices], limite)]
+    return np.union1d(escolhidos, [y.argmin(), y.argmax()])
+
+def normalizar_pergunta(pergunta):
+    """Forma canônica da pergunta: sem acentos, caixa, espaços repetidos ou pontuação final"""
+    sem_acentos = "".join(
+        caractere for caractere in unicodedata.normalize("NFKD", pergunta)
+        if not unicodedata.combining(caractere)
+    )
+    return " ".join(sem_acentos.lower().split()).rstrip("?!. ")
+
+class CacheRespostas:
+    """Respostas do LLM persistidas em SQLite, com expiração por idade e limite de entradas"""
+    def __init__(self, caminho="cache_respostas.sqlite3", ttl_segundos=7 * 24 * 3600, max_entradas=5000):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.acertos = 0
+        self.falhas = 0
+        self._trava = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            "chave TEXT PRIMARY KEY, resposta TEXT NOT NULL, criado_em REAL NOT NULL, acessado_em REAL NOT NULL)"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (acessado_em)")
+    
+    @staticmethod
+    def gerar_chave(impressao_digital, pergunta, modelo, temperatura, contexto_historico):
+        componentes = [
+            impressao_digital,
+            normalizar_pergunta(pergunta),
+            modelo,
+            temperatura,
+            hashlib.sha256(contexto_historico.encode()).hexdigest()
+        ]
+        return hashlib.sha256(json.dumps(componentes).encode()).hexdigest()
+    
+    def obter(self, chave):
+        agora = time.time()
+        with self._trava:
+            linha = self._conexao.execute(
+                "SELECT resposta FROM respostas WHERE chave = ? AND criado_em >= ?",
+                (chave, agora - self.ttl_segundos)
+            ).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+            self._conexao.execute("UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self.acertos += 1
+            return linha[0]
+    
+    def guardar(self, chave, resposta):
+        agora = time.time()
+        with self._trava:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resposta, criado_em, acessado_em) VALUES (?, ?, ?, ?)",
+                (chave, resposta, agora, agora)
+            )
+            self._despejar(agora)
+    
+    def _despejar(self, agora):
+        """Remove entradas expiradas e, acima do limite, as acessadas há mais tempo"""
+        self._conexao.execute("DELETE FROM respostas WHERE criado_em < ?", (agora - self.ttl_segundos,))
+        total = self._conexao.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+        if total > self.max_entradas:
+            self._conexao.execute(
+                "DELETE FROM respostas WHERE chave IN (SELECT chave FROM respostas ORDER BY acessado_em LIMIT ?)",
+                (total - self.max_entradas,)
+            )
+    
+    @property
+    def taxa_acerto(self):
+        total = self.acertos + self.falhas
+        return self.acertos / total if total else 0.0
+
+class PersistenciaSessoes:
+    """Memória e conversa de cada sessão gravadas em SQLite, uma linha por interação.
+    
+    As gravações são apenas anexações; a leitura traz só as linhas mais recentes e as imagens
+    são lidas sob demanda, então restaurar uma sessão longa custa o mesmo que uma curta.
+    """
+    def __init__(self, caminho="sessoes.sqlite3"):
+        self._trava = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.executescript(
+            "CREATE TABLE IF NOT EXISTS sessoes (id TEXT PRIMARY KEY, criado_em REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS memoria ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, sessao TEXT NOT NULL, tipo TEXT NOT NULL, dados TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_memoria_sessao ON memoria (sessao, tipo, id);"
+            "CREATE TABLE IF NOT EXISTS mensagens ("
+            "sessao TEXT NOT NULL, ordem INTEGER NOT NULL, emissor TEXT NOT NULL, conteudo TEXT NOT NULL, "
+            "imagem TEXT, timestamp TEXT NOT NULL, PRIMARY KEY (sessao, ordem));"
+            "CREATE TABLE IF NOT EXISTS imagens (chave TEXT PRIMARY KEY, formato TEXT NOT NULL, dados BLOB NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS datasets (sessao TEXT PRIMARY KEY, impressao TEXT NOT NULL, descricao TEXT);"
+        )
+    
+    def criar_sessao(self):
+        id_sessao = uuid.uuid4().hex
+        with self._trava:
+            self._conexao.execute("INSERT INTO sessoes (id, criado_em) VALUES (?, ?)", (id_sessao, time.time()))
+        return id_sessao
+    
+    def sessao_existe(self, id_sessao):
+        with self._trava:
+            return self._conexao.execute("SELECT 1 FROM sessoes WHERE id = ?", (id_sessao,)).fetchone() is not None
+    
+    def anexar_memoria(self, id_sessao, tipo, dados):
+        with self._trava:
+            self._conexao.execute(
+                "INSERT INTO memoria (sessao, tipo, dados) VALUES (?, ?, ?)",
+                (id_sessao, tipo, json.dumps(dados, ensure_ascii=False, default=str))
+            )
+    
+    def carregar_memoria(self, id_sessao, tipo, limite):
+        """Os `limite` registros mais recentes do tipo, do mais antigo para o mais novo"""
+        with self._trava:
+            linhas = self._conexao.execute(
+                "SELECT dados FROM memoria WHERE sessao = ? AND tipo = ? ORDER BY id DESC LIMIT ?",
+                (id_sessao, tipo, limite)
+            ).fetchall()
+        return [json.loads(dados) for dados, in reversed(linhas)]
+    
+    def contar_memoria(self, id_sessao, tipo):
+        with self._trava:
+            return self._conexao.execute(
+                "SELECT COUNT(*) FROM memoria WHERE sessao = ? AND tipo = ?", (id_sessao, tipo)
+            ).fetchone()[0]
+    
+    def limpar_memoria(self, id_sessao):
+        with self._trava:
+            self._conexao.execute("DELETE FROM memoria WHERE sessao = ?", (id_sessao,))
+    
+    def gravar_dataset(self, id_sessao, impressao_digital, descricao=None):
+        with self._trava:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO datasets (sessao, impressao, descricao) VALUES (?, ?, ?)",
+                (id_sessao, impressao_digital, json.dumps(descricao) if descricao is not None else None)
+            )
+    
+    def obter_dataset(self, id_sessao):
+        """(impressão digital, descrição) do dataset associado à sessão, ou (None, None)"""
+        with self._trava:
+            linha = self._conexao.execute(
+                "SELECT impressao, descricao FROM datasets WHERE sessao = ?", (id_sessao,)
+            ).fetchone()
+        if linha is None:
+            return None, None
+        impressao, descricao = linha
+        return impressao, json.loads(descricao) if descricao is not None else None
+    
+    def anexar_mensagem(self, id_sessao, registro, imagem=None):
+        """Grava a mensagem no fim da conversa e devolve a ordem atribuída.
+        
+        A ordem sai do próprio banco: outras abas (ou processos) podem estar escrevendo na mesma sessão.
+        """
+        with self._trava:
+            if imagem is not None:
+                self._conexao.execute(
+                    "INSERT OR IGNORE INTO imagens (chave, formato, dados) VALUES (?, ?, ?)",
+                    (imagem.chave, imagem.formato, imagem.dados)
+                )
+            cursor = self._conexao.execute(
+                "INSERT INTO mensagens (sessao, ordem, emissor, conteudo, imagem, timestamp) "
+                "SELECT ?, COALESCE(MAX(ordem) + 1, 0), ?, ?, ?, ? FROM mensagens WHERE sessao = ?",
+                (id_sessao, registro["emissor"], registro["conteudo"], registro["imagem"], registro["timestamp"], id_sessao)
+            )
+            return self._conexao.execute("SELECT ordem FROM mensagens WHERE rowid = ?", (cursor.lastrowid,)).fetchone()[0]
+    
+    def carregar_mensagens(self, id_sessao, antes_de, limite):
+        """Até `limite` mensagens com ordem menor que `antes_de`, em ordem cronológica"""
+        with self._trava:
+            linhas = self._conexao.execute(
+                "SELECT ordem, emissor, conteudo, imagem, timestamp FROM mensagens "
+                "WHERE sessao = ? AND ordem < ? ORDER BY ordem DESC LIMIT ?",
+                (id_sessao, antes_de, limite)
+            ).fetchall()
+        return [
+            {"emissor": emissor, "conteudo": conteudo, "imagem": imagem, "timestamp": timestamp, "ordem": ordem}
+            for ordem, emissor, conteudo, imagem, timestamp in reversed(linhas)
+        ]
+    
+    def contar_mensagens(self, id_sessao):
+        with self._trava:
+            return self._conexao.execute(
+                "SELECT COUNT(*) FROM mensagens WHERE sessao = ?", (id_sessao,)
+            ).fetchone()[0]
+    
+    def obter_imagem(self, chave):
+        with self._trava:
+            linha = self._conexao.execute("SELECT formato, dados FROM imagens WHERE chave = ?", (chave,)).fetchone()
+        if linha is None:
+            return None
+        formato, dados = linha
+        return ImagemGrafico(dados, formato)
+
+MARCADOR_CONSULTA = "```consulta"
+
+INSTRUCOES_CONSULTA = """
+                Se precisar de números exatos que não estão no resumo (agrupamentos, correlações,
+                séries temporais), responda APENAS com um bloco no formato abaixo; o resultado,
+                calculado localmente sobre o dataset completo, será enviado em seguida:
+                ```consulta
+                {"operacao": "agrupar", "por": ["coluna_categoria"], "coluna": "coluna_valor", "agregacao": "mean"}
+                ```
+                Operações: agregar (coluna, agregacao), agrupar (por, coluna, agregacao, ordenar "asc"/"desc", limite),
+                correlacao (colunas, metodo "pearson"/"spearman"), reamostrar (coluna_data, frequencia D/W/M/Q/Y, coluna, agregacao).
+                Todas aceitam "filtros": [{"coluna": "...", "op": "==", "valor": ...}] com op em ==, !=, >, >=, <, <=, in.
+                Agregações: mean, sum, count, min, max, median, std, nunique."""
+
+class ConsultaInvalida(ValueError):
+    """Especificação de consulta recusada pela validação ou que falhou ao executar"""
+
+def extrair_consulta(texto):
+    """Devolve o JSON do bloco ```consulta que abre a resposta do modelo, ou None se não houver pedido.
+    
+    Só vale o bloco no início da resposta: no modo streaming o texto anterior a um bloco no meio
+    da resposta já teria sido exibido, e as duas formas de resposta precisam seguir a mesma regra.
+    """
+    correspondencia = re.match(r"\s*" + re.escape(MARCADOR_CONSULTA) + r"\s*(\{.*\})\s*```", texto, re.DOTALL)
+    return correspondencia.group(1) if correspondencia else None
+
+class MotorConsultas:
+    """Executa localmente, com pandas vetorizado, consultas restritas pedidas pelo modelo.
+    
+    Só operações, agregações e operadores de filtro de uma lista fechada são aceitos, e toda
+    coluna citada precisa existir. Resultados são memorizados por (dataset, consulta).
+    """
+    OPERACOES = {"agregar", "agrupar", "correlacao", "reamostrar"}
+    AGREGACOES = {"mean", "sum", "count", "min", "max", "median", "std", "nunique"}
+    OPERADORES = {"==", "!=", ">", ">=", "<", "<=", "in"}
+    FREQUENCIAS = {"D": "D", "W": "W", "M": "MS", "Q": "QS", "Y": "YS"}
+    METODOS_CORRELACAO = {"pearson", "spearman"}
+    LIMITE_LINHAS = 50
+    LIMITE_COLUNAS_CORRELACAO = 15
+    
+    def __init__(self, capacidade_cache=256):
+        self._resultados = CacheLRU(capacidade=capacidade_cache)
+    
+    def validar(self, especificacao, colunas):
+        """Confere a especificação e devolve uma cópia normalizada; levanta ConsultaInvalida"""
+        if not isinstance(especificacao, dict):
+            raise ConsultaInvalida("a consulta deve ser um objeto JSON")
+        colunas = set(colunas)
+        # O modelo pode devolver qualquer JSON: tipos são conferidos antes de testes de pertinência,
+        # que com listas ou objetos levantariam TypeError em vez de ConsultaInvalida
+        operacao = especificacao.get("operacao")
+        if not isinstance(operacao, str) or operacao not in self.OPERACOES:
+            raise ConsultaInvalida(f"operação desconhecida: {operacao!r}")
+        
+        def coluna_existente(nome, campo):
+            if not isinstance(nome, str) or nome not in colunas:
+                raise ConsultaInvalida(f"coluna inexistente em '{campo}': {nome!r}")
+            return nome
+        
+        def lista_de_colunas(valor, campo):
+            if not isinstance(valor, list):
+                raise ConsultaInvalida(f"'{campo}' deve ser uma lista de nomes de colunas")
+            return [coluna_existente(nome, campo) for nome in valor]
+        
+        def opcao_valida(campo, permitidas, padrao):
+            valor = especificacao.get(campo, padrao)
+            if not isinstance(valor, str) or valor not in permitidas:
+                raise ConsultaInvalida(f"valor não permitido em '{campo}': {valor!r} (use um de {sorted(permitidas)})")
+            return valor
+        
+        def agregacao_valida(padrao=None):
+            return opcao_valida("agregacao", self.AGREGACOES, padrao)
+        
+        normalizada = {"operacao": operacao, "filtros": self._validar_filtros(especificacao.get("filtros", []), coluna_existente)}
+        if operacao == "agregar":
+            normalizada["coluna"] = coluna_existente(especificacao.get("coluna"), "coluna")
+            normalizada["agregacao"] = agregacao_valida()
+        elif operacao == "agrupar":
+            por = especificacao.get("por")
+            por = [por] if isinstance(por, str) else por
+            if not por or not isinstance(por, list) or len(por) > 3:
+                raise ConsultaInvalida("'por' deve listar de 1 a 3 colunas")
+            normalizada["por"] = lista_de_colunas(por, "por")
+            normalizada["agregacao"] = agregacao_valida("count")
+            if especificacao.get("coluna") is not None:
+                normalizada["coluna"] = coluna_existente(especificacao["coluna"], "coluna")
+            elif normalizada["agregacao"] != "count":
+                raise ConsultaInvalida("'coluna' é obrigatória para agregações diferentes de count")
+            normalizada["ordenar"] = opcao_valida("ordenar", ("asc", "desc"), "desc")
+            limite = especificacao.get("limite", 20)
+            if not isinstance(limite, int) or isinstance(limite, bool):
+                raise ConsultaInvalida(f"'limite' deve ser um inteiro: {limite!r}")
+            normalizada["limite"] = max(1, min(limite, self.LIMITE_LINHAS))
+        elif operacao == "correlacao":
+            selecionadas = especificacao.get("colunas")
+            normalizada["colunas"] = lista_de_colunas([] if selecionadas is None else selecionadas, "colunas")
+            if len(normalizada["colunas"]) > self.LIMITE_COLUNAS_CORRELACAO:
+                raise ConsultaInvalida(f"no máximo {self.LIMITE_COLUNAS_CORRELACAO} colunas na correlação")
+            normalizada["metodo"] = opcao_valida("metodo", self.METODOS_CORRELACAO, "pearson")
+        elif operacao == "reamostrar":
+            normalizada["coluna_data"] = coluna_existente(especificacao.get("coluna_data"), "coluna_data")
+            normalizada["coluna"] = coluna_existente(especificacao.get("coluna"), "coluna")
+            normalizada["agregacao"] = agregacao_valida("mean")
+            normalizada["frequencia"] = opcao_valida("frequencia", self.FREQUENCIAS, "M")
+        return normalizada
+    
+    def _validar_filtros(self, filtros, coluna_existente):
+        if not isinstance(filtros, list):
+            raise ConsultaInvalida("'filtros' deve ser uma lista")
+        validados = []
+        for filtro in filtros:
+            if not isinstance(filtro, dict) or not isinstance(filtro.get("op"), str) or filtro["op"] not in self.OPERADORES:
+                raise ConsultaInvalida(f"filtro inválido: {filtro!r}")
+            valor = filtro.get("valor")
+            if filtro["op"] == "in" and (
+                    not isinstance(valor, list) or not all(isinstance(item, (str, int, float, bool)) for item in valor)):
+                raise ConsultaInvalida("o operador 'in' exige uma lista de valores simples")
+            if filtro["op"] != "in" and not isinstance(valor, (str, int, float, bool)):
+                raise ConsultaInvalida(f"valor de filtro não suportado: {valor!r}")
+            validados.append({"coluna": coluna_existente(filtro.get("coluna"), "filtros"), "op": filtro["op"], "valor": valor})
+        return validados
+    
+    def executar(self, dataframe, especificacao, impressao_digital, indice=None):
+        """Executa uma especificação já validada e devolve o resultado como texto para o prompt"""
+        chave = (impressao_digital, json.dumps(especificacao, sort_keys=True, default=str))
+        resultado = self._resultados.obter(chave)
+        if resultado is None:
+            try:
+                resultado = self._formatar(self._calcular(dataframe, especificacao, indice))
+            except (KeyError, TypeError, ValueError) as erro:
+                raise ConsultaInvalida(f"falha ao executar a consulta: {erro}") from erro
+            self._resultados.guardar(chave, resultado)
+        return resultado
+    
+    def _calcular(self, dataframe, especificacao, indice=None):
+        operacao = especificacao["operacao"]
+        # Contagem por uma única categórica, sem filtros, sai direto das contagens pré-calculadas
+        if (indice is not None and operacao == "agrupar" and not especificacao["filtros"]
+                and "coluna" not in especificacao and len(especificacao["por"]) == 1
+                and especificacao["por"][0] in indice.contagens):
+            contagem = indice.contagens[especificacao["por"][0]]
+            contagem = contagem[contagem > 0].sort_values(ascending=especificacao["ordenar"] == "asc")
+            return contagem.head(especificacao["limite"])
+        
+        dados = dataframe
+        if especificacao["filtros"]:
+            dados = dataframe[self._mascara(dataframe, especificacao["filtros"])]
+        
+        if operacao == "agregar":
+            coluna, agregacao = especificacao["coluna"], especificacao["agregacao"]
+            return pd.Series({f"{agregacao}({coluna})": dados[coluna].agg(agregacao), "linhas_consideradas": len(dados)})
+        
+        if operacao == "agrupar":
+            grupos = dados.groupby(especificacao["por"], observed=True)
+            if "coluna" in especificacao:
+                resultado = grupos[especificacao["coluna"]].agg(especificacao["agregacao"])
+            else:
+                resultado = grupos.size()
+            resultado = resultado.sort_values(ascending=especificacao["ordenar"] == "asc")
+            return resultado.head(especificacao["limite"])
+        
+        if operacao == "correlacao":
+            numericas = indice.numericas if indice is not None else particionar_colunas(dados)[0]
+            colunas = especificacao["colunas"] or numericas[:self.LIMITE_COLUNAS_CORRELACAO]
+            return dados[colunas].corr(method=especificacao["metodo"])
+        
+        # reamostrar
+        datas = pd.to_datetime(dados[especificacao["coluna_data"]], errors="coerce")
+        serie = pd.Series(dados[especificacao["coluna"]].to_numpy(), index=datas)[datas.notna().to_numpy()]
+        resultado = serie.sort_index().resample(self.FREQUENCIAS[especificacao["frequencia"]]).agg(especificacao["agregacao"])
+        return resultado.tail(self.LIMITE_LINHAS)
+    
+    @staticmethod
+    def _mascara(dataframe, filtros):
+        mascara = np.ones(len(dataframe), dtype=bool)
+        for filtro in filtros:
+            serie, valor = dataframe[filtro["coluna"]], filtro["valor"]
+            operador = filtro["op"]
+            if operador == "in":
+                condicao = serie.isin(valor)
+            elif operador == "==":
+                condicao = serie == valor
+            elif operador == "!=":
+                condicao = serie != valor
+            elif operador == ">":
+                condicao = serie > valor
+            elif operador == ">=":
+                condicao = serie >= valor
+            elif operador == "<":
+                condicao = serie < valor
+            else:
+                condicao = serie <= valor
+            mascara &= condicao.fillna(False).to_numpy(dtype=bool)
+        return mascara
+    
+    def _formatar(self, resultado):
+        if isinstance(resultado, (pd.Series, pd.DataFrame)):
+            return resultado.to_string(max_rows=self.LIMITE_LINHAS, float_format=formatar_numero)
+        return str(resultado)
+
+class ConfiguracaoGraficos:
+    """Formato e resolução usados ao exportar os gráficos"""
+    FORMATOS = ("png", "svg")
+    
+    def __init__(self, formato="png", dpi=100):
+        if formato not in self.FORMATOS:
+            raise ValueError(f"Formato de gráfico não suportado: {formato}")
+        self.formato = formato
+        self.dpi = dpi
+
+class ImagemGrafico:
+    """Gráfico já codificado; mensagens guardam apenas a chave e a imagem é armazenada uma vez"""
+    def __init__(self, dados, formato):
+        self.dados = dados
+        self.formato = formato
+        self.chave = hashlib.sha256(dados).hexdigest()
+    
+    @classmethod
+    def a_partir_da_figura(cls, figura, configuracao):
+        buffer = io.BytesIO()
+        figura.savefig(buffer, format=configuracao.formato, dpi=configuracao.dpi, bbox_inches='tight')
+        return cls(buffer.getvalue(), configuracao.formato)
+    
+    @property
+    def tamanho_bytes(self):
+        return len(self.dados)
+    
+    def para_exibicao(self):
+        """Conteúdo aceito por st.image: bytes para PNG, texto para SVG"""
+        if self.formato == "svg":
+            return self.dados.decode()
+        return self.dados
+
+class RespostaEmFluxo:
+    """Resposta entregue em partes; texto completo e gráfico ficam disponíveis ao fim da iteração"""
+    def __init__(self, partes, ao_concluir=None):
+        self._partes = partes
+        self._ao_concluir = ao_concluir
+        self.texto = ""
+        self.visualizacao = None
+    
+    def __iter__(self):
+        recebidas = []
+        try:
+            for parte in self._partes:
+                recebidas.append(parte)
+                yield parte
+        except Exception as erro:
+            mensagem_erro = f"Erro ao processar pergunta: {str(erro)}"
+            self.texto = "".join(recebidas) + mensagem_erro
+            yield mensagem_erro
+            return
+        
+        self.texto = "".join(recebidas)
+        if self._ao_concluir is not None:
+            self.visualizacao = self._ao_concluir(self.texto)
+
+class ErroGatewayLLM(RuntimeError):
+    """Falha definitiva ao chamar o LLM: tentativas esgotadas ou prazo vencido"""
+
+class BaldeFichas:
+    """Limite de taxa por balde de fichas: `taxa` fichas por segundo, até `capacidade` acumuladas"""
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._fichas = capacidade
+        self._atualizado_em = time.monotonic()
+        self._trava = threading.Lock()
+    
+    def adquirir(self, prazo):
+        """Espera por uma ficha até o instante `prazo` (time.monotonic); devolve False se não houver tempo"""
+        while True:
+            with self._trava:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado_em) * self.taxa)
+                self._atualizado_em = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = (1 - self._fichas) / self.taxa
+            if agora + espera > prazo:
+                return False
+            time.sleep(espera)
+
+class GatewayLLM:
+    """Ponto único de acesso ao LLM, compartilhado por todas as sessões do processo.
+    
+    Limita as chamadas simultâneas com um semáforo e a taxa com um balde de fichas, repete
+    falhas transitórias (429, 5xx, timeout, conexão) com espera exponencial e jitter, e respeita
+    um prazo total por requisição. O cliente deve ser criado com max_retries=0: quem repete é o gateway.
+    """
+    STATUS_TRANSITORIOS = {408, 409, 429}
+    
+    def __init__(self, cliente, max_concorrencia=8, requisicoes_por_minuto=30, rajada=5,
+                 max_tentativas=4, espera_base=0.5, espera_maxima=8.0, prazo_segundos=60.0):
+        self.cliente = cliente
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.prazo_segundos = prazo_segundos
+        self._semaforo = threading.BoundedSemaphore(max_concorrencia)
+        # requisicoes_por_minuto=None desliga o limite de taxa (ex.: clientes simulados)
+        self._balde = BaldeFichas(requisicoes_por_minuto / 60, rajada) if requisicoes_por_minuto else None
+        self.repeticoes = 0
+    
+    @classmethod
+    def para_groq(cls, chave_api, max_concorrencia=8, **opcoes):
+        """Um cliente Groq com pool de conexões do tamanho do limite de concorrência"""
+        conexoes = httpx.Client(
+            limits=httpx.Limits(max_connections=max_concorrencia, max_keepalive_connections=max_concorrencia)
+        )
+        cliente = Groq(api_key=chave_api, max_retries=0, http_client=conexoes)
+        return cls(cliente, max_concorrencia=max_concorrencia, **opcoes)
+    
+    def completar(self, prazo_segundos=None, **parametros):
+        prazo = time.monotonic() + (prazo_segundos or self.prazo_segundos)
+        self._entrar(prazo)
+        try:
+            return self._chamar(prazo, parametros)
+        finally:
+            self._semaforo.release()
+    
+    def fluxo(self, prazo_segundos=None, **parametros):
+        """Como completar(stream=True); só a abertura do fluxo é repetida, nunca um fluxo já iniciado"""
+        prazo = time.monotonic() + (prazo_segundos or self.prazo_segundos)
+        self._entrar(prazo)
+        try:
+            yield from self._chamar(prazo, dict(parametros, stream=True))
+        finally:
+            self._semaforo.release()
+    
+    def _entrar(self, prazo):
+        if not self._semaforo.acquire(timeout=max(0.0, prazo - time.monotonic())):
+            raise ErroGatewayLLM("o serviço de IA está ocupado; tente novamente em instantes")
+        if self._balde is not None and not self._balde.adquirir(prazo):
+            self._semaforo.release()
+            raise ErroGatewayLLM("limite de requisições ao serviço de IA atingido; tente novamente em instantes")
+    
+    def _chamar(self, prazo, parametros):
+        for tentativa in range(self.max_tentativas):
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                return self.cliente.chat.completions.create(timeout=restante, **parametros)
+            except Exception as erro:
+                if not self._transitorio(erro):
+                    raise
+                espera = self._espera(tentativa, erro)
+                if tentativa + 1 == self.max_tentativas or time.monotonic() + espera >= prazo:
+                    status = getattr(erro, "status_code", None)
+                    motivo = f"HTTP {status}" if status else type(erro).__name__
+                    raise ErroGatewayLLM(
+                        f"serviço de IA indisponível ({motivo}) após {tentativa + 1} tentativa(s); tente novamente em instantes"
+                    ) from erro
+                self.repeticoes += 1
+                time.sleep(espera)
+        raise ErroGatewayLLM("prazo da requisição ao serviço de IA esgotado")
+    
+    def _transitorio(self, erro):
+        if isinstance(erro, APIConnectionError):  # Inclui APITimeoutError
+            return True
+        status = getattr(erro, "status_code", None)
+        return isinstance(erro, APIStatusError) and (status in self.STATUS_TRANSITORIOS or status >= 500)
+    
+    def _espera(self, tentativa, erro):
+        # Jitter completo evita que sessões rejeitadas juntas voltem todas no mesmo instante
+        espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** tentativa))
+        resposta = getattr(erro, "response", None)
+        retry_after = resposta.headers.get("retry-after") if resposta is not None else None
+        try:
+            return max(espera, float(retry_after)) if retry_after else espera
+        except ValueError:
+            return espera
+
+REGISTRO_METRICAS = logging.getLogger("analisador.metricas")
+
+class MedicaoEtapa:
+    __slots__ = ("etapa", "parede_s", "cpu_s", "memoria_bytes")
+    
+    def __init__(self, etapa, parede_s, cpu_s, memoria_bytes=None):
+        self.etapa = etapa
+        self.parede_s = parede_s
+        self.cpu_s = cpu_s
+        self.memoria_bytes = memoria_bytes
+    
+    def para_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+class MetricasProcesso:
+    """Agregados de todas as sessões, exportados no formato de texto do Prometheus"""
     def __init__(self):
-        self.historico_analises = []
-        self.insights_coletados = []
-        self.padroes_detectados = []
-        self.conclusoes_gerais = []
-        self.contador_interacoes = 0
+        self._trava = threading.Lock()
+        self._etapas = {}  # etapa -> [execuções, parede, CPU, maior pico de memória]
+        self._tokens = {"prompt": 0, "completion": 0}
     
-    def registrar_analise(self, pergunta, resposta, metrica=None):
-        registro = {
-            "timestamp": datetime.now().isoformat(),
-            "pergunta": pergunta,
-            "resposta": resposta,
-            "metrica": metrica,
-            "tipo_analise": self._classificar_analise(pergunta)
-        }
-        self.historico_analises.append(registro)
-        self.contador_interacoes += 1
-        
-        # Extrai insights automaticamente da resposta
-        self._extrair_insights(resposta, pergunta)
+    def registrar(self, medicao):
+        with self._trava:
+            agregado = self._etapas.setdefault(medicao.etapa, [0, 0.0, 0.0, 0])
+            agregado[0] += 1
+            agregado[1] += medicao.parede_s
+            agregado[2] += medicao.cpu_s
+            if medicao.memoria_bytes is not None:
+                agregado[3] = max(agregado[3], medicao.memoria_bytes)
     
-    def _classificar_analise(self, pergunta):
-        pergunta_lower = pergunta.lower()
-        if any(palavra in pergunta_lower for palavra in ['distribuição', 'histograma', 'frequência']):
-            return "distribuicao"
-        elif any(palavra in pergunta_lower for palavra in ['correlação', 'relação', 'associação']):
-            return "correlacao"
-        elif any(palavra in pergunta_lower for palavra in ['tendência', 'evolução', 'tempo']):
-            return "tendencia"
-        elif any(palavra in pergunta_lower for palavra in ['comparação', 'diferença', 'categoria']):
-            return "comparacao"
-        else:
-            return "geral"
+    def registrar_tokens(self, tipo, quantidade):
+        with self._trava:
+            self._tokens[tipo] += quantidade
     
-    def _extrair_insights(self, resposta, pergunta):
-        # Analisa a resposta para extrair insights importantes
-        insights_potenciais = [
-            "alta", "baixa", "aumento", "diminuição", "correlação", "significante",
-            "outlier", "padrão", "tendência", "maior", "menor", "máximo", "mínimo"
-        ]
+    def para_prometheus(self):
+        with self._trava:
+            etapas = {etapa: list(agregado) for etapa, agregado in self._etapas.items()}
+            tokens = dict(self._tokens)
         
-        resposta_lower = resposta.lower()
-        for insight in insights_potenciais:
-            if insight in resposta_lower:
-                insight_registro = {
-                    "timestamp": datetime.now().isoformat(),
-                    "insight": insight,
-                    "contexto": pergunta[:100],  # Primeiros 100 caracteres
-                    "resumo": self._resumir_insight(resposta, insight)
-                }
-                if insight_registro not in self.insights_coletados:
-                    self.insights_coletados.append(insight_registro)
+        linhas = []
+        series = (
+            ("analisador_etapa_execucoes_total", "counter", "Execuções de cada etapa", 0),
+            ("analisador_etapa_segundos_total", "counter", "Tempo de parede acumulado por etapa", 1),
+            ("analisador_etapa_cpu_segundos_total", "counter", "Tempo de CPU acumulado por etapa", 2),
+            ("analisador_etapa_memoria_pico_bytes", "gauge", "Maior pico de memória alocada numa etapa", 3),
+        )
+        for nome, tipo, ajuda, posicao in series:
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+            linhas += [f'{nome}{{etapa="{etapa}"}} {agregado[posicao]}' for etapa, agregado in sorted(etapas.items())]
+        linhas += ["# HELP analisador_tokens_total Tokens informados pela API do LLM", "# TYPE analisador_tokens_total counter"]
+        linhas += [f'analisador_tokens_total{{tipo="{tipo}"}} {quantidade}' for tipo, quantidade in tokens.items()]
+        return "\n".join(linhas) + "\n"
+
+METRICAS_PROCESSO = MetricasProcesso()
+
+class MedidorEtapa:
+    __slots__ = ("_instrumentacao", "_etapa", "_inicio", "_inicio_cpu", "_memoria_base")
+    # O pico do tracemalloc é um só no processo: só é zerado quando nenhuma outra etapa, de
+    # qualquer sessão ou thread, está medindo; etapas simultâneas compartilham o mesmo pico
+    _medindo_memoria = 0
+    _trava_memoria = threading.Lock()
     
-    def _resumir_insight(self, resposta, palavra_chave):
-        # Cria um resumo do insight encontrado
-        sentences = resposta.split('.')
-        for sentence in sentences:
-            if palavra_chave in sentence.lower():
-                return sentence.strip()
-        return resposta[:150] + "..."
+    def __init__(self, instrumentacao, etapa):
+        self._instrumentacao = instrumentacao
+        self._etapa = etapa
     
-    def adicionar_padrao(self, tipo_padrao, descricao, dados_suporte):
-        padrao = {
-            "tipo": tipo_padrao,
-            "descricao": descricao,
-            "dados_suporte": dados_suporte,
-            "timestamp": datetime.now().isoformat()
-        }
-        self.padroes_detectados.append(padrao)
+    def __enter__(self):
+        self._memoria_base = None
+        if tracemalloc.is_tracing():
+            with MedidorEtapa._trava_memoria:
+                if MedidorEtapa._medindo_memoria == 0:
+                    tracemalloc.reset_peak()
+                MedidorEtapa._medindo_memoria += 1
+                self._memoria_base = tracemalloc.get_traced_memory()[0]
+        self._inicio_cpu = time.thread_time()
+        self._inicio = time.perf_counter()
+        return self
     
-    def adicionar_conclusao(self, conclusao, nivel_confianca="medio"):
-        conclusao_registro = {
-            "conclusao": conclusao,
-            "nivel_confianca": nivel_confianca,
-            "timestamp": datetime.now().isoformat(),
-            "base_analise": len(self.historico_analises)
+    def __exit__(self, *erro):
+        parede = time.perf_counter() - self._inicio
+        cpu = time.thread_time() - self._inicio_cpu
+        memoria = None
+        if self._memoria_base is not None:
+            with MedidorEtapa._trava_memoria:
+                MedidorEtapa._medindo_memoria -= 1
+                memoria = max(0, tracemalloc.get_traced_memory()[1] - self._memoria_base)
+        self._instrumentacao.registrar(MedicaoEtapa(self._etapa, parede, cpu, memoria))
+        return False
+
+class Instrumentacao:
+    """Tempo de parede, CPU da thread, pico de memória e tokens de cada etapa de uma operação.
+    
+    Desativada, `etapa()` devolve um contexto vazio e nada é medido. O pico de memória só é
+    medido com o tracemalloc ligado para o processo inteiro (MEDIR_MEMORIA=1, ver
+    configurar_metricas), e é aproximado quando etapas rodam em paralelo.
+    """
+    def __init__(self, ativa=True, metricas=METRICAS_PROCESSO):
+        self.ativa = ativa
+        self.metricas = metricas
+        self.operacao = None
+        self.medicoes = []
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.ultima_execucao_interface = None
+    
+    @property
+    def medir_memoria(self):
+        return tracemalloc.is_tracing()
+    
+    def iniciar(self, operacao):
+        """Começa uma nova operação; as medições da anterior são descartadas"""
+        self.operacao = operacao
+        self.medicoes = []
+        self.tokens = {"prompt": 0, "completion": 0}
+    
+    def etapa(self, nome):
+        return MedidorEtapa(self, nome) if self.ativa else nullcontext()
+    
+    def registrar(self, medicao):
+        self.medicoes.append(medicao)
+        self.metricas.registrar(medicao)
+        if REGISTRO_METRICAS.isEnabledFor(logging.INFO):
+            REGISTRO_METRICAS.info(json.dumps({"evento": "etapa", "operacao": self.operacao, **medicao.para_dict()}))
+    
+    def registrar_uso(self, uso):
+        """Contagem de tokens informada pela API (`usage` da resposta), quando disponível"""
+        if not self.ativa or uso is None:
+            return
+        for tipo, campo in (("prompt", "prompt_tokens"), ("completion", "completion_tokens")):
+            quantidade = getattr(uso, campo, None) or 0
+            self.tokens[tipo] += quantidade
+            self.metricas.registrar_tokens(tipo, quantidade)
+    
+    def registrar_execucao_interface(self, parede_s, cpu_s):
+        """Duração da última execução do script do Streamlit (o "rerun")"""
+        if self.ativa:
+            self.ultima_execucao_interface = MedicaoEtapa("execucao_interface", parede_s, cpu_s)
+            self.metricas.registrar(self.ultima_execucao_interface)
+    
+    def resumo(self):
+        return {
+            "operacao": self.operacao,
+            "etapas": [medicao.para_dict() for medicao in self.medicoes],
+            "tokens": dict(self.tokens),
         }
-        self.conclusoes_gerais.append(conclusao_registro)
+
+def iniciar_servidor_metricas(porta, metricas=METRICAS_PROCESSO):
+    """Expõe GET /metrics no formato do Prometheus numa thread em segundo plano"""
+    class Manipulador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            conteudo = metricas.para_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(conteudo)))
+            self.end_headers()
+            self.wfile.write(conteudo)
     
-    def obter_resumo_conclusoes(self):
-        if not self.conclusoes_gerais and not self.insights_coletados:
-            return "Ainda não foram identificadas conclusões significativas. Faça mais análises para gerar insights."
+    servidor = ThreadingHTTPServer(("0.0.0.0", porta), Manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="metricas").start()
+    return servidor
+
+class AnalisadorDadosInteligente:
+    def __init__(self, chave_api, cliente=None, cache_respostas=None, memoria=None, gateway=None,
+                 instrumentacao=None):
+        # Permite injetar um cliente compatível (ex.: simulacao.ClienteLLMSimulado) em testes;
+        # na interface, todas as sessões usam o mesmo gateway
+        if gateway is None:
+            if cliente is not None:
+                gateway = GatewayLLM(cliente, requisicoes_por_minuto=None)
+            else:
+                gateway = GatewayLLM.para_groq(chave_api)
+        self.gateway = gateway
+        self.cache_respostas = cache_respostas
+        self.modelo = "llama-3.1-8b-instant"
+        self.temperatura = 0.3
+        self.max_tokens = 1024
+        self.ultima_medicao = None
+        self.configuracao_graficos = ConfiguracaoGraficos()
+        self.construtor_prompt = ConstrutorPrompt()
+        self.ultimo_prompt_tokens = None
+        self.motor_consultas = MotorConsultas()
+        self.max_consultas = 2
+        self.ultimas_consultas = []
+        self.conjunto_dados = None
+        self.indice = None
+        self.perfil_dados = None
+        self.estatisticas_fluxo = None
+        self.perfil_colunas = None
+        self.taxa_ausentes = None
+        self.memoria = memoria if memoria is not None else SistemaMemoria()
+        self.instrumentacao = instrumentacao if instrumentacao is not None else Instrumentacao()
+    
+    def carregar_informacoes(self, dataframe, impressao_digital=None, indice=None):
+        """Carrega um DataFrame em memória.
         
-        resumo = "## 📊 Conclusões e Insights Obtidos\n\n"
+        Com `indice` (ex.: compartilhado pelo ArmazemDatasets), o DataFrame é usado como está,
+        já com os tipos otimizados, e nem ele nem o índice são recalculados.
+        """
+        etapa = self.instrumentacao.etapa
+        if indice is not None:
+            self.conjunto_dados, self.indice = dataframe, indice
+        else:
+            with etapa("otimizacao_tipos"):
+                self.conjunto_dados = otimizar_tipos(dataframe)
+            with etapa("indice"):
+                self.indice = IndiceDataset(self.conjunto_dados)
+        self.estatisticas_fluxo = None
+        with etapa("perfil"):
+            self._atualizar_perfil(impressao_digital)
+        dataset_novo = self._preparar_memoria()
         
-        if self.conclusoes_gerais:
-            resumo += "### Principais Conclusões:\n"
-            for i, conclusao in enumerate(self.conclusoes_gerais[-5:], 1):  # Últimas 5 conclusões
-                resumo += f"{i}. {conclusao['conclusao']} (Confiança: {conclusao['nivel_confianca']})\n"
+        # Análise inicial automática do dataset
+        with etapa("analise_inicial"):
+            analise_inicial = self._realizar_analise_inicial()
+        if dataset_novo:
+            self.memoria.adicionar_conclusao(analise_inicial, "alto")
+    
+    def carregar_informacoes_em_blocos(self, fonte, tamanho_bloco=100_000, tamanho_amostra=50_000, nome=None):
+        """Lê o arquivo em blocos, acumulando estatísticas e uma amostra limitada para os gráficos"""
+        etapa = self.instrumentacao.etapa
+        estatisticas = EstatisticasIncrementais(tamanho_amostra)
+        with etapa("leitura_em_blocos"):
+            if isinstance(fonte, (str, os.PathLike)):
+                with open(fonte, "rb") as arquivo:
+                    for bloco in LeitorDatasets.ler_em_blocos(arquivo, nome or os.fspath(fonte), tamanho_bloco):
+                        estatisticas.adicionar_bloco(bloco)
+            else:
+                for bloco in LeitorDatasets.ler_em_blocos(fonte, nome or getattr(fonte, "name", ""), tamanho_bloco):
+                    estatisticas.adicionar_bloco(bloco)
         
-        if self.insights_coletados:
-            resumo += "\n### Insights Detectados:\n"
-            insights_unicos = {}
-            for insight in self.insights_coletados:
-                chave = insight['insight']
-                if chave not in insights_unicos:
-                    insights_unicos[chave] = insight['resumo']
-            
-            for insight, descricao in list(insights_unicos.items())[:5]:
-                resumo += f"• **{insight.title()}**: {descricao}\n"
+        # Apenas a amostra fica em memória; o contexto do prompt vem dos acumuladores
+        with etapa("otimizacao_tipos"):
+            self.conjunto_dados = otimizar_tipos(estatisticas.amostra)
+        with etapa("indice"):
+            self.indice = IndiceDataset(self.conjunto_dados)
+        self.estatisticas_fluxo = estatisticas
+        with etapa("perfil"):
+            self.perfil_dados = PerfilDataset.a_partir_de_estatisticas(estatisticas)
+        dataset_novo = self._preparar_memoria()
         
-        resumo += f"\n*Baseado em {self.contador_interacoes} análises realizadas*"
+        with etapa("analise_inicial"):
+            analise_inicial = self._realizar_analise_inicial()
+        if dataset_novo:
+            self.memoria.adicionar_conclusao(analise_inicial, "alto")
+    
+    def _preparar_memoria(self):
+        """Limpa a memória só quando o dataset muda; devolve True nesse caso.
+        
+        Recarregar o mesmo conteúdo (ao restaurar a sessão ou reenviar o arquivo) mantém as análises.
+        """
+        impressao_digital = self.perfil_dados.impressao_digital
+        if impressao_digital == self.memoria.impressao_dataset:
+            return False
+        self.memoria.limpar_memoria()
+        self.memoria.associar_dataset(impressao_digital)
+        return True
+    
+    def anexar_dados(self, novos_dados, registrar_conclusao=True):
+        """Acrescenta linhas ao dataset carregado sem limpar a memória.
+        
+        No modo em memória o DataFrame inteiro continua disponível: o índice é atualizado só com as
+        linhas novas e o perfil do prompt é recalculado exato (quartis, outliers, distintos), como na
+        carga. No modo em blocos momentos, esboços de quantis e contagens de categorias absorvem só as
+        linhas novas e o perfil continua aproximado. Devolve o resumo do que mudou, que também é
+        registrado como conclusão na memória (exceto ao reaplicar anexos de uma sessão restaurada).
+        """
+        if self.conjunto_dados is None:
+            raise ValueError("Carregue um dataset antes de anexar novos dados")
+        etapa = self.instrumentacao.etapa
+        antes = self._retrato_estatisticas()
+        
+        if self.estatisticas_fluxo is None:
+            with etapa("anexo_indice"):
+                # alinhar_tipos converte as colunas para os tipos (e categorias) do dataset carregado
+                base, novos_dados = alinhar_tipos(self.conjunto_dados, novos_dados)
+                # Nunca altera o DataFrame original: ele pode estar compartilhado no armazém
+                self.conjunto_dados = pd.concat([base, novos_dados], ignore_index=True)
+                self.indice = self.indice.anexar(novos_dados)
+            with etapa("anexo_perfil"):
+                # Impressão encadeada: só as linhas novas são percorridas, e reaplicar os mesmos
+                # anexos (ao restaurar a sessão) reencontra o perfil no CACHE_PERFIS
+                impressao_digital = hashlib.sha256(
+                    (self.perfil_dados.impressao_digital + calcular_impressao_digital(novos_dados)).encode()
+                ).hexdigest()
+                self._atualizar_perfil(impressao_digital)
+        else:
+            estatisticas = self.estatisticas_fluxo
+            if set(novos_dados.columns) != set(estatisticas.colunas):
+                raise ValueError("As colunas dos novos dados não correspondem às do dataset carregado")
+            novos_dados = novos_dados[list(estatisticas.colunas)]
+            with etapa("anexo_estatisticas"):
+                estatisticas.adicionar_bloco(novos_dados)
+            with etapa("anexo_indice"):
+                # No modo em blocos só a amostra fica em memória; reindexá-la tem custo limitado
+                self.conjunto_dados = otimizar_tipos(estatisticas.amostra)
+                self.indice = IndiceDataset(self.conjunto_dados)
+            with etapa("anexo_perfil"):
+                self.perfil_dados = PerfilDataset.a_partir_de_estatisticas(estatisticas)
+                self.perfil_colunas, self.taxa_ausentes = estatisticas.perfilar()
+        
+        resumo = self._descrever_mudancas(antes, self._retrato_estatisticas(), len(novos_dados))
+        if registrar_conclusao:
+            self.memoria.adicionar_conclusao(resumo, "alto")
         return resumo
     
-    def obter_historico_recente(self, limite=5):
-        return self.historico_analises[-limite:]
+    def _retrato_estatisticas(self):
+        """Estado resumido do perfil atual, para comparar antes e depois de um anexo (sem varrer os dados)"""
+        categorias, datas = {}, {}
+        if self.estatisticas_fluxo is None:
+            # Contagens exatas do índice, só das colunas `category`
+            for coluna in self.indice.categoricas_contadas:
+                contagem = self.indice.contagens[coluna]
+                categorias[coluna] = set(contagem.index[contagem > 0])
+            for coluna in self.indice.datas:
+                datas[coluna] = (self.indice.limites[coluna]["minimo"], self.indice.limites[coluna]["maximo"])
+        else:
+            # Só categóricas de baixa cardinalidade com contagem exata: em colunas de texto livre, IDs
+            # ou contadores já podados, todo valor "novo" seria ruído
+            estatisticas = self.estatisticas_fluxo
+            for coluna in self.indice.categoricas_contadas:
+                contador = estatisticas.categoricas.get(coluna)
+                if contador is not None and not contador.podado:
+                    categorias[coluna] = set(contador.contagens)
+            for coluna, limites in estatisticas.datas.items():
+                datas[coluna] = (limites["minimo"], limites["maximo"])
+        return {
+            "linhas": self.perfil_dados.forma[0],
+            "descricao": self.perfil_dados.descricao,
+            "outliers": self.perfil_colunas["outliers"],
+            "ausentes": self.taxa_ausentes,
+            "categorias": categorias,
+            "datas": datas,
+        }
     
-    def limpar_memoria(self):
-        self.historico_analises.clear()
-        self.insights_coletados.clear()
-        self.padroes_detectados.clear()
-        self.conclusoes_gerais.clear()
-        self.contador_interacoes = 0
-
-class AnalisadorDadosInteligente:
-    def __init__(self, chave_api):
-        self.cliente = Groq(api_key=chave_api)
-        self.conjunto_dados = None
-        self.memoria = SistemaMemoria()
+    @staticmethod
+    def _descrever_mudancas(antes, depois, linhas_novas, limite=3):
+        mudancas = []
+        
+        # Médias que mais se deslocaram, em desvios-padrão da distribuição anterior
+        deslocamentos = {}
+        for coluna in depois["descricao"].columns:
+            media_antes, media_depois = antes["descricao"][coluna]["mean"], depois["descricao"][coluna]["mean"]
+            desvio = antes["descricao"][coluna]["std"]
+            if pd.isna(media_antes) or pd.isna(media_depois) or pd.isna(desvio) or desvio == 0:
+                continue
+            deslocamento = abs(media_depois - media_antes) / desvio
+            if deslocamento >= 0.05:
+                deslocamentos[coluna] = deslocamento
+        for coluna in sorted(deslocamentos, key=deslocamentos.get, reverse=True)[:limite]:
+            mudancas.append(
+                f"média de {coluna} {formatar_numero(antes['descricao'][coluna]['mean'])} → "
+                f"{formatar_numero(depois['descricao'][coluna]['mean'])}"
+            )
+        
+        outliers = (depois["outliers"] - antes["outliers"].reindex(depois["outliers"].index, fill_value=0))
+        for coluna in outliers[outliers != 0].abs().sort_values(ascending=False).head(limite).index:
+            mudancas.append(f"outliers em {coluna} {int(antes['outliers'].get(coluna, 0))} → {int(depois['outliers'][coluna])}")
+        
+        ausentes = (depois["ausentes"] - antes["ausentes"]).abs()
+        for coluna in ausentes[ausentes >= 0.01].sort_values(ascending=False).head(limite).index:
+            mudancas.append(f"ausentes em {coluna} {antes['ausentes'][coluna]:.1%} → {depois['ausentes'][coluna]:.1%}")
+        
+        for coluna, categorias in depois["categorias"].items():
+            if coluna not in antes["categorias"]:
+                continue
+            novas = list(categorias - antes["categorias"][coluna])[:limite]
+            if novas:
+                mudancas.append(f"novas categorias em {coluna}: " + ", ".join(f"'{valor}'" for valor in novas))
+        
+        for coluna, intervalo in depois["datas"].items():
+            if intervalo != antes["datas"].get(coluna):
+                inicio, fim = antes["datas"].get(coluna, (pd.NaT, pd.NaT))
+                mudancas.append(f"período de {coluna} {inicio} a {fim} → {intervalo[0]} a {intervalo[1]}")
+        
+        resumo = f"Dados anexados: +{linhas_novas} linhas (total {depois['linhas']})"
+        if not mudancas:
+            return resumo + "; sem mudanças relevantes nas estatísticas"
+        return resumo + "; " + "; ".join(mudancas)
     
-    def carregar_informacoes(self, dataframe):
-        self.conjunto_dados = dataframe
-        self.memoria.limpar_memoria()  # Limpa memória ao carregar novo dataset
+    def _atualizar_perfil(self, impressao_digital=None):
+        """Recalcula o perfil e o perfil de outliers apenas quando o conteúdo do dataset muda"""
+        if impressao_digital is None:
+            impressao_digital = calcular_impressao_digital(self.conjunto_dados)
+        if self.perfil_dados is not None and self.perfil_dados.impressao_digital == impressao_digital:
+            return
         
-        # Análise inicial automática do dataset
-        analise_inicial = self._realizar_analise_inicial()
-        self.memoria.adicionar_conclusao(analise_inicial, "alto")
+        perfis = CACHE_PERFIS.obter(impressao_digital)
+        if perfis is None:
+            perfil = PerfilDataset.a_partir_do_dataframe(self.conjunto_dados, impressao_digital, self.indice)
+            # Em arquivos largos, os quartis de todas as numéricas custam mais que o próprio resumo
+            perfil_colunas, taxa_ausentes = perfilar_colunas(
+                self.conjunto_dados, self.indice.numericas, self.indice.ausentes
+            )
+            perfis = (perfil, perfil_colunas, taxa_ausentes)
+            CACHE_PERFIS.guardar(impressao_digital, perfis)
+        self.perfil_dados, self.perfil_colunas, self.taxa_ausentes = perfis
     
     def _realizar_analise_inicial(self):
         """Realiza uma análise inicial automática do dataset"""
@@ -148,103 +2402,259 @@ class AnalisadorDadosInteligente:
             return "Dataset não carregado"
         
         try:
-            colunas_numericas = self.conjunto_dados.select_dtypes(include=['number']).columns
-            colunas_categoricas = self.conjunto_dados.select_dtypes(include=['object']).columns
+            if self.estatisticas_fluxo is not None:
+                estatisticas = self.estatisticas_fluxo
+                self.perfil_colunas, self.taxa_ausentes = estatisticas.perfilar()
+                total_categoricas = len(estatisticas.categoricas)
+                total_linhas = estatisticas.total_linhas
+            else:
+                # Perfil de outliers já calculado (ou compartilhado por outra sessão) em _atualizar_perfil
+                total_categoricas = len(self.indice.categoricas)
+                total_linhas = len(self.conjunto_dados)
             
             conclusoes = []
             
-            if len(colunas_numericas) > 0:
-                conclusoes.append(f"Dataset contém {len(colunas_numericas)} variáveis numéricas")
-                # Detecta possíveis outliers
-                for coluna in colunas_numericas[:3]:  # Analisa as 3 primeiras
-                    q1 = self.conjunto_dados[coluna].quantile(0.25)
-                    q3 = self.conjunto_dados[coluna].quantile(0.75)
-                    iqr = q3 - q1
-                    outliers = self.conjunto_dados[
-                        (self.conjunto_dados[coluna] < (q1 - 1.5 * iqr)) | 
-                        (self.conjunto_dados[coluna] > (q3 + 1.5 * iqr))
-                    ]
-                    if len(outliers) > 0:
-                        conclusoes.append(f"Possíveis outliers detectados em {coluna}")
+            if len(self.perfil_colunas) > 0:
+                conclusoes.append(f"Dataset contém {len(self.perfil_colunas)} variáveis numéricas")
+                # Destaca as colunas com mais outliers
+                com_outliers = self.perfil_colunas["outliers"]
+                com_outliers = com_outliers[com_outliers > 0].sort_values(ascending=False)
+                for coluna, quantidade in com_outliers.head(10).items():
+                    conclusoes.append(f"Possíveis outliers detectados em {coluna} ({quantidade} registros)")
+                if len(com_outliers) > 10:
+                    conclusoes.append(f"Outliers também em outras {len(com_outliers) - 10} colunas numéricas")
             
-            if len(colunas_categoricas) > 0:
-                conclusoes.append(f"Dataset contém {len(colunas_categoricas)} variáveis categóricas")
+            if total_categoricas > 0:
+                conclusoes.append(f"Dataset contém {total_categoricas} variáveis categóricas")
             
-            if len(self.conjunto_dados) > 1000:
+            ausentes = self.taxa_ausentes[self.taxa_ausentes > 0].sort_values(ascending=False)
+            for coluna, taxa in ausentes.head(5).items():
+                conclusoes.append(f"{taxa:.1%} de valores ausentes em {coluna}")
+            
+            if total_linhas > 1000:
                 conclusoes.append("Dataset de grande porte - amostra significativa")
-            elif len(self.conjunto_dados) < 100:
+            elif total_linhas < 100:
                 conclusoes.append("Dataset pequeno - cuidado com generalizações")
             
             return "; ".join(conclusoes)
             
         except Exception as e:
             return f"Análise inicial básica: {len(self.conjunto_dados)} registros carregados"
-
+    
     def obter_resposta(self, pergunta):
         if self.conjunto_dados is None:
-            return "Por favor, carregue um arquivo CSV primeiro.", None
-        
-        # Prepara contexto com histórico de análises
-        contexto_historico = self._preparar_contexto_historico()
-        
-        # Prepara contexto sobre os dados
-        contexto_dados = f"""
-        Informações do dataset:
-        - Formato: {self.conjunto_dados.shape}
-        - Colunas: {list(self.conjunto_dados.columns)}
-        - Primeiras linhas:
-        {self.conjunto_dados.head().to_string()}
-        - Estatísticas descritivas:
-        {self.conjunto_dados.describe().to_string()}
-        """
+            return "Por favor, carregue um arquivo de dados primeiro.", None
+        
+        # O gráfico depende só da pergunta, então é renderizado em paralelo com a consulta
+        inicio = time.perf_counter()
+        futuro_visualizacao, contexto_historico, chave_cache, texto_em_cache = self._preparar_pergunta(pergunta)
+        
+        try:
+            if texto_em_cache is not None:
+                texto_resposta = texto_em_cache
+            else:
+                # Consulta ao Groq, executando localmente as consultas que o modelo pedir
+                with self.instrumentacao.etapa("prompt"):
+                    mensagens = self._montar_mensagens(pergunta, contexto_historico)
+                texto_resposta = self._completar(mensagens)
+                self._guardar_em_cache(chave_cache, texto_resposta)
+            duracao_llm = time.perf_counter() - inicio
+            
+            visualizacao = self._finalizar_resposta(pergunta, texto_resposta, futuro_visualizacao, inicio, duracao_llm)
+            
+            return texto_resposta, visualizacao
+            
+        except Exception as erro:
+            futuro_visualizacao.cancel()
+            return f"Erro ao processar pergunta: {str(erro)}", None
+    
+    def obter_resposta_em_fluxo(self, pergunta):
+        """Versão em streaming de obter_resposta: o texto chega em partes conforme é gerado"""
+        if self.conjunto_dados is None:
+            return RespostaEmFluxo(iter(["Por favor, carregue um arquivo de dados primeiro."]))
         
-        prompt_completo = f"""
-        {contexto_historico}
+        inicio = time.perf_counter()
+        futuro_visualizacao, contexto_historico, chave_cache, texto_em_cache = self._preparar_pergunta(pergunta)
         
-        {contexto_dados}
+        if texto_em_cache is not None:
+            partes = iter([texto_em_cache])
+            chave_cache = None  # Já está no cache
+        else:
+            partes = self._gerar_partes_resposta(pergunta, contexto_historico)
         
-        Pergunta atual: {pergunta}
+        def concluir(texto_resposta):
+            self._guardar_em_cache(chave_cache, texto_resposta)
+            return self._finalizar_resposta(
+                pergunta, texto_resposta, futuro_visualizacao, inicio, time.perf_counter() - inicio
+            )
         
-        Com base no histórico de análises e nos dados atuais, forneça uma resposta completa.
-        Considere padrões já identificados e conclusões anteriores.
+        return RespostaEmFluxo(partes, concluir)
+    
+    def _preparar_pergunta(self, pergunta):
+        """Etapas comuns às duas formas de resposta: gráfico em paralelo, contexto e cache"""
+        self.instrumentacao.iniciar("pergunta")
+        futuro_visualizacao = self._iniciar_visualizacao(pergunta)
+        with self.instrumentacao.etapa("contexto_historico"):
+            contexto_historico = self._preparar_contexto_historico()
+        self.ultimas_consultas = []
+        with self.instrumentacao.etapa("cache_respostas"):
+            chave_cache, texto_em_cache = self._consultar_cache(pergunta, contexto_historico)
+        return futuro_visualizacao, contexto_historico, chave_cache, texto_em_cache
+    
+    def _consultar_cache(self, pergunta, contexto_historico):
+        """Devolve (chave, resposta em cache ou None); sem cache configurado a chave é None"""
+        if self.cache_respostas is None:
+            return None, None
+        chave = CacheRespostas.gerar_chave(
+            self.perfil_dados.impressao_digital, pergunta, self.modelo, self.temperatura, contexto_historico
+        )
+        return chave, self.cache_respostas.obter(chave)
+    
+    def _guardar_em_cache(self, chave, texto_resposta):
+        if chave is not None:
+            self.cache_respostas.guardar(chave, texto_resposta)
+    
+    def _iniciar_visualizacao(self, pergunta):
+        """Agenda a renderização do gráfico no executor; o resultado é (imagem, duração).
+        
+        Dataset, índice, impressão digital e configuração são capturados agora: se outro dataset for
+        carregado enquanto o gráfico renderiza, ele não pode ser desenhado com os dados novos e
+        guardado no CACHE_GRAFICOS sob a impressão antiga.
         """
+        dados, indice = self.conjunto_dados, self.indice
+        impressao_digital, configuracao = self.perfil_dados.impressao_digital, self.configuracao_graficos
         
-        try:
-            # Consulta ao Groq
-            resposta = self.cliente.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Você é um especialista em análise de dados com memória contextual. 
-                        Use o histórico de análises para enriquecer suas respostas.
-                        Identifique padrões, tendências e relações nos dados.
-                        Ao final de cada análise, sugira próximos passos ou perguntas relacionadas."""
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt_completo
-                    }
-                ],
-                model="llama-3.1-8b-instant",
-                temperature=0.3,
-                max_tokens=1024
-            )
-            
+        def renderizar():
+            inicio = time.perf_counter()
+            visualizacao = self._criar_visualizacao(pergunta, dados, indice, impressao_digital, configuracao)
+            return visualizacao, time.perf_counter() - inicio
+        
+        return EXECUTOR_GRAFICOS.submit(renderizar)
+    
+    def _completar(self, mensagens):
+        for rodada in range(self.max_consultas + 1):
+            with self.instrumentacao.etapa("llm"):
+                resposta = self.gateway.completar(
+                    messages=mensagens,
+                    model=self.modelo,
+                    temperature=self.temperatura,
+                    max_tokens=self.max_tokens
+                )
+            self.instrumentacao.registrar_uso(getattr(resposta, "usage", None))
             texto_resposta = resposta.choices[0].message.content
+            consulta = extrair_consulta(texto_resposta) if rodada < self.max_consultas else None
+            if consulta is None:
+                return texto_resposta
+            mensagens = mensagens + self._responder_consulta(texto_resposta, consulta, rodada + 1 == self.max_consultas)
+        return texto_resposta
+    
+    def _gerar_partes_resposta(self, pergunta, contexto_historico):
+        with self.instrumentacao.etapa("prompt"):
+            mensagens = self._montar_mensagens(pergunta, contexto_historico)
+        for rodada in range(self.max_consultas + 1):
+            pode_consultar = rodada < self.max_consultas
+            partes = self._partes_do_fluxo(mensagens)
+            recebido = ""
+            for parte in partes:
+                recebido += parte
+                inicio_texto = recebido.lstrip()
+                if pode_consultar and (MARCADOR_CONSULTA.startswith(inicio_texto) or inicio_texto.startswith(MARCADOR_CONSULTA)):
+                    continue  # Pode ser um pedido de consulta: segura o texto até ter certeza
+                yield recebido
+                yield from partes
+                return
             
-            # Registra a análise na memória
-            self.memoria.registrar_analise(pergunta, texto_resposta)
-            
-            # Gera visualização
-            visualizacao = self._criar_visualizacao(pergunta, texto_resposta)
+            consulta = extrair_consulta(recebido) if pode_consultar else None
+            if consulta is None:
+                if recebido:
+                    yield recebido
+                return
+            mensagens = mensagens + self._responder_consulta(recebido, consulta, rodada + 1 == self.max_consultas)
+    
+    def _partes_do_fluxo(self, mensagens):
+        with self.instrumentacao.etapa("llm"):
+            fluxo = self.gateway.fluxo(
+                messages=mensagens,
+                model=self.modelo,
+                temperature=self.temperatura,
+                max_tokens=self.max_tokens
+            )
+            for pedaco in fluxo:
+                # A Groq informa o uso de tokens no último pedaço, em x_groq.usage
+                uso = getattr(pedaco, "usage", None) or getattr(getattr(pedaco, "x_groq", None), "usage", None)
+                self.instrumentacao.registrar_uso(uso)
+                if pedaco.choices and pedaco.choices[0].delta.content:
+                    yield pedaco.choices[0].delta.content
+    
+    def _responder_consulta(self, texto_pedido, consulta, ultima_rodada):
+        """Executa a consulta pedida pelo modelo e devolve as mensagens que levam o resultado de volta"""
+        with self.instrumentacao.etapa("consulta_local"):
+            conteudo = self._executar_consulta(consulta)
+        self.ultimas_consultas.append({"consulta": consulta, "resultado": conteudo})
+        
+        instrucao = "Responda agora à pergunta original usando esse resultado."
+        if ultima_rodada:
+            instrucao += " Não solicite novas consultas."
+        return [
+            {"role": "assistant", "content": texto_pedido},
+            {"role": "user", "content": f"{conteudo}\n\n{instrucao}"}
+        ]
+    
+    def _executar_consulta(self, consulta):
+        try:
+            especificacao = self.motor_consultas.validar(json.loads(consulta), self.conjunto_dados.columns)
+            resultado = self.motor_consultas.executar(
+                self.conjunto_dados, especificacao, self.perfil_dados.impressao_digital, self.indice
+            )
+            conteudo = f"Resultado da consulta (calculado localmente):\n{resultado}"
+            if self.estatisticas_fluxo is not None:
+                conteudo += f"\n(Calculado sobre uma amostra de {len(self.conjunto_dados)} linhas.)"
+        except ValueError as erro:
+            conteudo = f"Consulta inválida: {erro}"
+        return conteudo
+    
+    def _montar_mensagens(self, pergunta, contexto_historico):
+        # Contexto sobre os dados vem do perfil calculado na carga, limitado ao orçamento de tokens
+        prompt_completo, self.ultimo_prompt_tokens = self.construtor_prompt.construir(
+            self.perfil_dados, pergunta, contexto_historico
+        )
+        
+        return [
+            {
+                "role": "system",
+                "content": """Você é um especialista em análise de dados com memória contextual. 
+                Use o histórico de análises para enriquecer suas respostas.
+                Identifique padrões, tendências e relações nos dados.
+                Ao final de cada análise, sugira próximos passos ou perguntas relacionadas.""" + INSTRUCOES_CONSULTA
+            },
+            {
+                "role": "user", 
+                "content": prompt_completo
+            }
+        ]
+    
+    def _finalizar_resposta(self, pergunta, texto_resposta, futuro_visualizacao, inicio, duracao_llm):
+        """Registra a resposta completa na memória e aguarda o gráfico renderizado em paralelo"""
+        with self.instrumentacao.etapa("memoria"):
+            # Classificação, insights e conclusões saem de uma única varredura da resposta
+            analise_texto = ANALISADOR_TEXTO.analisar(pergunta, texto_resposta)
+            self.memoria.registrar_analise(pergunta, texto_resposta, analise_texto=analise_texto)
             
             # Atualiza conclusões baseadas na nova análise
-            self._atualizar_conclusoes(pergunta, texto_resposta)
-            
-            return texto_resposta, visualizacao
-            
-        except Exception as erro:
-            return f"Erro ao processar pergunta: {str(erro)}", None
+            self._atualizar_conclusoes(analise_texto)
+        
+        with self.instrumentacao.etapa("espera_grafico"):
+            visualizacao, duracao_grafico = futuro_visualizacao.result()
+        duracao_total = time.perf_counter() - inicio
+        self.ultima_medicao = {
+            "llm_s": duracao_llm,
+            "grafico_s": duracao_grafico,
+            "total_s": duracao_total,
+            # Quanto levaria em sequência menos o tempo real com sobreposição
+            "economia_s": max(0.0, duracao_llm + duracao_grafico - duracao_total)
+        }
+        
+        return visualizacao
     
     def _preparar_contexto_historico(self):
         """Prepara o contexto do histórico de análises para o prompt"""
@@ -255,93 +2665,149 @@ class AnalisadorDadosInteligente:
         
         contexto = "### Histórico Recente de Análises:\n"
         for i, analise in enumerate(historico_recente, 1):
-            contexto += f"{i}. Pergunta: {analise['pergunta']}\n"
-            contexto += f"   Tipo: {analise['tipo_analise']}\n"
-            contexto += f"   Resumo: {analise['resposta'][:200]}...\n\n"
+            contexto += f"{i}. Pergunta: {analise.pergunta}\n"
+            contexto += f"   Tipo: {analise.tipo_analise}\n"
+            contexto += f"   Resumo: {analise.resposta[:200]}...\n\n"
         
         return contexto
     
-    def _atualizar_conclusoes(self, pergunta, resposta):
+    def _atualizar_conclusoes(self, analise_texto):
         """Atualiza conclusões baseadas na nova análise"""
-        # Detecta conclusões importantes na resposta
-        marcadores_conclusao = [
-            "concluímos que", "portanto", "dessa forma", "em resumo", 
-            "isso indica que", "sugere que", "evidencia", "demonstra"
-        ]
-        
-        resposta_lower = resposta.lower()
-        for marcador in marcadores_conclusao:
-            if marcador in resposta_lower:
-                # Extrai a sentença contendo a conclusão
-                sentences = resposta.split('.')
-                for sentence in sentences:
-                    if marcador in sentence.lower():
-                        self.memoria.adicionar_conclusao(sentence.strip(), "medio")
-                        break
-    
-    def _criar_visualizacao(self, pergunta, resposta):
+        for sentenca in analise_texto.conclusoes:
+            self.memoria.adicionar_conclusao(sentenca, "medio")
+    
+    def _criar_visualizacao(self, pergunta, dados, indice, impressao_digital, configuracao):
         try:
-            figura, eixo = plt.subplots(figsize=(10, 6))
-            
-            pergunta_lower = pergunta.lower()
-            colunas_numericas = self.conjunto_dados.select_dtypes(include=['number']).columns
-            
-            if len(colunas_numericas) > 0:
-                coluna_alvo = colunas_numericas[0]
-                
-                if any(palavra in pergunta_lower for palavra in ['distribuição', 'histograma', 'frequência']):
-                    self.conjunto_dados[coluna_alvo].hist(ax=eixo, bins=15, alpha=0.7, color='skyblue')
-                    eixo.set_title(f'Distribuição de {coluna_alvo}')
-                    eixo.set_ylabel('Frequência')
-                    eixo.grid(True, alpha=0.3)
-                
-                elif any(palavra in pergunta_lower for palavra in ['correlação', 'relação', 'associação']):
-                    if len(colunas_numericas) >= 2:
-                        sns.scatterplot(data=self.conjunto_dados, x=colunas_numericas[0], y=colunas_numericas[1], ax=eixo)
-                        eixo.set_title(f'Relação entre {colunas_numericas[0]} e {colunas_numericas[1]}')
-                        eixo.grid(True, alpha=0.3)
-                    else:
-                        # Fallback para histograma
-                        self.conjunto_dados[coluna_alvo].hist(ax=eixo, bins=15, alpha=0.7)
-                        eixo.set_title(f'Distribuição de {coluna_alvo}')
-                
-                elif any(palavra in pergunta_lower for palavra in ['boxplot', 'outlier', 'dispersão']):
-                    sns.boxplot(data=self.conjunto_dados[coluna_alvo], ax=eixo)
-                    eixo.set_title(f'Boxplot de {coluna_alvo}')
-                    eixo.grid(True, alpha=0.3)
-                
-                else:
-                    # Gráfico de barras para colunas categóricas ou linha temporal
-                    colunas_categoricas = self.conjunto_dados.select_dtypes(include=['object']).columns
-                    if len(colunas_categoricas) > 0:
-                        coluna_cat = colunas_categoricas[0]
-                        contagem = self.conjunto_dados[coluna_cat].value_counts().head(10)
-                        contagem.plot(kind='bar', ax=eixo, color='lightgreen')
-                        eixo.set_title(f'Top 10 Valores em {coluna_cat}')
-                        eixo.tick_params(axis='x', rotation=45)
-                        eixo.grid(True, alpha=0.3)
-                    else:
-                        # Gráfico de linha para tendências temporais
-                        if len(self.conjunto_dados) > 1:
-                            self.conjunto_dados[coluna_alvo].plot(ax=eixo, marker='o')
-                            eixo.set_title(f'Tendência de {coluna_alvo}')
-                            eixo.grid(True, alpha=0.3)
-            
-            plt.tight_layout()
-            
-            # Converter para base64
-            buffer = io.BytesIO()
-            figura.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-            buffer.seek(0)
-            imagem_base64 = base64.b64encode(buffer.read()).decode()
-            plt.close(figura)
+            especificacao = self._escolher_grafico(pergunta, dados, indice)
+            if especificacao is None:
+                return None
             
-            return f"data:image/png;base64,{imagem_base64}"
+            # O gráfico depende só do dataset e do tipo escolhido, não da resposta
+            tipo, colunas = especificacao
+            chave = (impressao_digital, tipo, colunas, configuracao.formato, configuracao.dpi)
+            imagem = CACHE_GRAFICOS.obter(chave)
+            if imagem is None:
+                with self.instrumentacao.etapa("grafico_renderizacao"):
+                    figura = self._renderizar_grafico(tipo, colunas, dados, indice)
+                with self.instrumentacao.etapa("grafico_codificacao"):
+                    imagem = ImagemGrafico.a_partir_da_figura(figura, configuracao)
+                CACHE_GRAFICOS.guardar(chave, imagem)
+            return imagem
             
         except Exception as erro:
             print(f"Erro ao criar visualização: {erro}")
             return None
     
+    def _escolher_grafico(self, pergunta, dados, indice):
+        """Decide o tipo de gráfico e as colunas envolvidas a partir da pergunta"""
+        pergunta_lower = pergunta.lower()
+        colunas_numericas = indice.numericas
+        
+        if len(colunas_numericas) == 0:
+            return None
+        coluna_alvo = colunas_numericas[0]
+        
+        if any(palavra in pergunta_lower for palavra in ['distribuição', 'histograma', 'frequência']):
+            return "distribuicao", (coluna_alvo,)
+        
+        if any(palavra in pergunta_lower for palavra in ['correlação', 'relação', 'associação']):
+            if len(colunas_numericas) >= 2:
+                return "relacao", (colunas_numericas[0], colunas_numericas[1])
+            # Fallback para histograma
+            return "distribuicao", (coluna_alvo,)
+        
+        if any(palavra in pergunta_lower for palavra in ['boxplot', 'outlier', 'dispersão']):
+            return "boxplot", (coluna_alvo,)
+        
+        # Gráfico de barras para colunas categóricas ou linha temporal; texto de alta cardinalidade
+        # (IDs, texto livre) não tem contagens no índice nem daria um gráfico de barras útil
+        categoricas = indice.categoricas_contadas
+        if len(categoricas) > 0:
+            return "categorias", (categoricas[0],)
+        if len(dados) > 1:
+            return "tendencia", (coluna_alvo,)
+        return None
+    
+    def _renderizar_grafico(self, tipo, colunas, dados, indice):
+        # Figura criada sem pyplot para não compartilhar estado global entre threads
+        figura = Figure(figsize=(10, 6))
+        eixo = figura.subplots()
+        
+        if tipo == "distribuicao":
+            coluna_alvo = colunas[0]
+            dados[coluna_alvo].hist(ax=eixo, figure=figura, bins=15, alpha=0.7, color='skyblue')
+            eixo.set_title(f'Distribuição de {coluna_alvo}')
+            eixo.set_ylabel('Frequência')
+        
+        elif tipo == "relacao":
+            self._desenhar_relacao(figura, eixo, colunas[0], colunas[1], dados, indice)
+            eixo.set_title(f'Relação entre {colunas[0]} e {colunas[1]}')
+        
+        elif tipo == "boxplot":
+            coluna_alvo = colunas[0]
+            self._desenhar_boxplot(eixo, coluna_alvo, dados)
+            eixo.set_title(f'Boxplot de {coluna_alvo}')
+        
+        elif tipo == "categorias":
+            coluna_cat = colunas[0]
+            contagem = indice.contagens[coluna_cat].head(10)
+            contagem.plot(kind='bar', ax=eixo, color='lightgreen')
+            eixo.set_title(f'Top 10 Valores em {coluna_cat}')
+            eixo.tick_params(axis='x', rotation=45)
+        
+        elif tipo == "tendencia":
+            # Gráfico de linha para tendências temporais
+            coluna_alvo = colunas[0]
+            serie = dados[coluna_alvo].dropna()
+            if len(serie) > LIMITE_PONTOS_LINHA:
+                indices = reduzir_serie(serie.to_numpy(dtype=float, na_value=np.nan))
+                serie.iloc[indices].plot(ax=eixo, linewidth=1)
+                eixo.set_title(f'Tendência de {coluna_alvo} ({len(indices)} de {len(serie)} pontos)')
+            else:
+                serie.plot(ax=eixo, marker='o')
+                eixo.set_title(f'Tendência de {coluna_alvo}')
+        
+        eixo.grid(True, alpha=0.3)
+        figura.tight_layout()
+        return figura
+    
+    def _desenhar_relacao(self, figura, eixo, coluna_x, coluna_y, dados, indice):
+        """Dispersão completa, amostrada ou em hexbin conforme a quantidade de pontos"""
+        pontos = dados[[coluna_x, coluna_y]].dropna()
+        if len(pontos) > LIMITE_PONTOS_HEXBIN:
+            # Agrega em células hexagonais: custo linear e imagem legível com milhões de pontos
+            celulas = eixo.hexbin(
+                pontos[coluna_x].to_numpy(dtype=float), pontos[coluna_y].to_numpy(dtype=float),
+                gridsize=60, mincnt=1, bins="log", cmap="viridis"
+            )
+            figura.colorbar(celulas, ax=eixo, label="Registros (log)")
+        else:
+            if len(pontos) > LIMITE_PONTOS_DISPERSAO:
+                estrato = None
+                categoricas = indice.categoricas_contadas
+                if len(categoricas) > 0 and (indice.contagens[categoricas[0]] > 0).sum() <= 20:
+                    estrato = dados.loc[pontos.index, categoricas[0]]
+                pontos = amostrar_linhas(pontos, LIMITE_PONTOS_DISPERSAO, estrato=estrato)
+            sns.scatterplot(data=pontos, x=coluna_x, y=coluna_y, ax=eixo, s=12, linewidth=0)
+        eixo.set_xlabel(coluna_x)
+        eixo.set_ylabel(coluna_y)
+    
+    def _desenhar_boxplot(self, eixo, coluna, dados):
+        """Boxplot com estatísticas da coluna inteira e, em colunas grandes, só parte dos outliers"""
+        valores = dados[coluna].dropna()
+        if len(valores) <= LIMITE_PONTOS_DISPERSAO:
+            sns.boxplot(data=valores, ax=eixo)
+            return
+        
+        estatisticas = boxplot_stats(valores.to_numpy(dtype=float))[0]
+        outliers = estatisticas["fliers"]
+        if len(outliers) > LIMITE_OUTLIERS_BOXPLOT:
+            gerador = np.random.default_rng(0)
+            estatisticas["fliers"] = gerador.choice(outliers, LIMITE_OUTLIERS_BOXPLOT, replace=False)
+        eixo.bxp([estatisticas], widths=0.5, patch_artist=True,
+                 boxprops={"facecolor": "tab:blue", "alpha": 0.7}, flierprops={"markersize": 3})
+        eixo.set_xticks([])
+    
     def obter_conclusoes(self):
         return self.memoria.obter_resumo_conclusoes()
     
@@ -349,172 +2815,571 @@ class AnalisadorDadosInteligente:
         self.memoria.limpar_memoria()
 
 class GerenciadorConversa:
-    def __init__(self):
+    """Histórico do chat; com persistência, só as mensagens recentes e as imagens exibidas ficam em memória"""
+    def __init__(self, persistencia=None, id_sessao=None, tamanho_pagina=50, limite_em_memoria=200):
         self.registros = []
+        self.persistencia = persistencia
+        self.id_sessao = id_sessao
+        self.tamanho_pagina = tamanho_pagina
+        self.limite_em_memoria = limite_em_memoria
+        self.total_mensagens = 0
+        self.primeira_ordem = 0  # Ordem da mensagem mais antiga presente em `registros`
+        if persistencia is None:
+            self.imagens = {}
+        else:
+            self.imagens = CacheLRU(capacidade=64, limite_bytes=32 * 1024 ** 2, medir=lambda imagem: imagem.tamanho_bytes)
+            self.total_mensagens = self.primeira_ordem = persistencia.contar_mensagens(id_sessao)
+            self.carregar_anteriores()
+    
+    @property
+    def ha_mensagens_anteriores(self):
+        return self.primeira_ordem > 0
+    
+    def carregar_anteriores(self):
+        """Traz do disco a página de mensagens anterior à mais antiga exibida"""
+        if self.persistencia is None or not self.ha_mensagens_anteriores:
+            return
+        pagina = self.persistencia.carregar_mensagens(self.id_sessao, self.primeira_ordem, self.tamanho_pagina)
+        if pagina:
+            self.primeira_ordem = pagina[0]["ordem"]
+            self.registros[:0] = pagina
     
     def adicionar_mensagem(self, emissor, conteudo, imagem=None):
-        self.registros.append({
+        # A mensagem guarda só a chave; gráficos repetidos ocupam memória uma única vez
+        chave_imagem = None
+        if imagem is not None:
+            chave_imagem = imagem.chave
+            if self.persistencia is None:
+                self.imagens.setdefault(chave_imagem, imagem)
+            else:
+                self.imagens.guardar(chave_imagem, imagem)
+        
+        registro = {
             "emissor": emissor,
             "conteudo": conteudo,
-            "imagem": imagem,
-            "timestamp": datetime.now().isoformat()
-        })
-
-# Configuração da interface
-interface.set_page_config(
-    page_title="Analisador Inteligente com Memória", 
-    layout="wide",
-    page_icon="🧠"
-)
+            "imagem": chave_imagem,
+            "timestamp": datetime.now().isoformat(),
+            "ordem": self.total_mensagens
+        }
+        self.registros.append(registro)
+        
+        if self.persistencia is not None:
+            # Com a mesma sessão aberta em outra aba, a ordem gravada pode estar à frente da contagem local
+            registro["ordem"] = self.persistencia.anexar_mensagem(self.id_sessao, registro, imagem)
+            # As mais antigas continuam no disco e voltam com carregar_anteriores()
+            excedente = len(self.registros) - self.limite_em_memoria
+            if excedente > 0:
+                del self.registros[:excedente]
+                self.primeira_ordem = self.registros[0]["ordem"]
+        self.total_mensagens = registro["ordem"] + 1
+    
+    def obter_imagem(self, chave):
+        if self.persistencia is None:
+            return self.imagens.get(chave)
+        imagem = self.imagens.obter(chave)
+        if imagem is None:
+            imagem = self.persistencia.obter_imagem(chave)
+            if imagem is not None:
+                self.imagens.guardar(chave, imagem)
+        return imagem
 
-interface.title("🧠 Analisador Inteligente com Memória Contextual")
+@interface.cache_resource
+def obter_armazem_datasets():
+    """Armazém único por processo, compartilhado por todas as sessões"""
+    orcamento_mb = int(os.getenv("ORCAMENTO_MEMORIA_DATASETS_MB", "2048"))
+    return ArmazemDatasets(orcamento_mb * 1024 ** 2)
 
-# Inicialização na sessão
-if "analisador_inteligente" not in interface.session_state:
-    chave_groq = os.getenv("GROQ_API_KEY")
-    print(chave_groq)
-    if not chave_groq:
-        interface.error("GROQ_API_KEY não encontrada nas variáveis de ambiente")
-    interface.session_state.analisador_inteligente = AnalisadorDadosInteligente(chave_groq)
+@interface.cache_resource
+def obter_diretorio_cache_datasets():
+    """Onde ficam os arquivos Arrow mapeados em memória e os CSVs convertidos para Parquet"""
+    diretorio = os.getenv("DIRETORIO_CACHE_DATASETS", ".cache_datasets")
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
 
-if "gerenciador_dialogo" not in interface.session_state:
-    interface.session_state.gerenciador_dialogo = GerenciadorConversa()
+def criar_leitor_datasets(converter_csv_parquet=False):
+    """Leitor que usa o cache em disco do processo, limitado a ORCAMENTO_DISCO_DATASETS_MB"""
+    orcamento_mb = int(os.getenv("ORCAMENTO_DISCO_DATASETS_MB", "4096"))
+    return LeitorDatasets(obter_diretorio_cache_datasets(), converter_csv_parquet, orcamento_mb * 1024 ** 2)
 
-if "dados_carregados" not in interface.session_state:
-    interface.session_state.dados_carregados = None
+@interface.cache_resource
+def obter_cache_respostas():
+    """Cache de respostas em disco, compartilhado por todas as sessões do processo"""
+    return CacheRespostas(
+        caminho=os.getenv("CAMINHO_CACHE_RESPOSTAS", "cache_respostas.sqlite3"),
+        ttl_segundos=int(os.getenv("TTL_CACHE_RESPOSTAS_HORAS", "168")) * 3600,
+        max_entradas=int(os.getenv("MAX_ENTRADAS_CACHE_RESPOSTAS", "5000"))
+    )
 
-# Mensagem inicial
-if len(interface.session_state.gerenciador_dialogo.registros) == 0:
-    interface.session_state.gerenciador_dialogo.adicionar_mensagem(
-        "assistente", 
-        "Olá! Sou um analisador inteligente com memória. Envie um CSV e faça perguntas - vou lembrar das análises anteriores para dar respostas contextuais! 🧠"
+@interface.cache_resource
+def obter_gateway_llm():
+    """Cliente, pool de conexões e limites de chamadas ao LLM compartilhados pelo processo"""
+    return GatewayLLM.para_groq(
+        os.getenv("GROQ_API_KEY"),
+        max_concorrencia=int(os.getenv("LLM_MAX_CONCORRENCIA", "8")),
+        requisicoes_por_minuto=float(os.getenv("LLM_REQUISICOES_POR_MINUTO", "30")),
+        prazo_segundos=float(os.getenv("LLM_PRAZO_SEGUNDOS", "60"))
     )
 
-# Layout principal
-col_principal, col_lateral = interface.columns([3, 1])
+@interface.cache_resource
+def configurar_metricas():
+    """Logs estruturados (LOG_METRICAS=1), endpoint Prometheus (METRICAS_PORTA) e pico de memória por
+    etapa (MEDIR_MEMORIA=1, com tracemalloc, que deixa o processo inteiro mais lento), uma vez por processo"""
+    if os.getenv("MEDIR_MEMORIA") == "1" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if os.getenv("LOG_METRICAS") == "1" and not REGISTRO_METRICAS.handlers:
+        manipulador = logging.StreamHandler()
+        manipulador.setFormatter(logging.Formatter("%(message)s"))
+        REGISTRO_METRICAS.addHandler(manipulador)
+        REGISTRO_METRICAS.setLevel(logging.INFO)
+    porta = os.getenv("METRICAS_PORTA")
+    return iniciar_servidor_metricas(int(porta)) if porta else None
+
+@interface.cache_resource
+def obter_persistencia_sessoes():
+    """Banco de sessões do processo; PERSISTIR_SESSOES=0 mantém tudo apenas em memória"""
+    if os.getenv("PERSISTIR_SESSOES", "1") == "0":
+        return None
+    return PersistenciaSessoes(os.getenv("CAMINHO_SESSOES", "sessoes.sqlite3"))
+
+def guardar_dataset_da_sessao(analisador, fonte, nome, modo, tamanho_bloco=None):
+    """Associa o arquivo carregado à sessão, com uma cópia em disco para recarregá-lo ao restaurá-la"""
+    leitor = criar_leitor_datasets()
+    descricao = {
+        "arquivo": leitor.guardar_original(fonte), "nome": nome, "modo": modo,
+        "tamanho_bloco": tamanho_bloco, "anexos": []
+    }
+    analisador.memoria.associar_dataset(analisador.memoria.impressao_dataset, descricao)
+
+def guardar_anexo_da_sessao(analisador, conteudo, nome):
+    descricao = analisador.memoria.descricao_dataset
+    if descricao is None:
+        return
+    anexo = {"arquivo": criar_leitor_datasets().guardar_original(conteudo), "nome": nome}
+    analisador.memoria.associar_dataset(
+        analisador.memoria.impressao_dataset, dict(descricao, anexos=descricao["anexos"] + [anexo])
+    )
 
-with col_lateral:
-    interface.header("🔧 Controles")
+def restaurar_dataset_da_sessao(analisador):
+    """Recarrega o dataset (e os anexos) da sessão restaurada, mantendo a memória; devolve a referência ou None"""
+    descricao = analisador.memoria.descricao_dataset
+    leitor = criar_leitor_datasets(converter_csv_parquet=pa is not None)
+    arquivos = [descricao] + descricao["anexos"]
+    caminhos = [leitor.localizar_original(arquivo["arquivo"]) for arquivo in arquivos]
+    if None in caminhos:
+        return None  # A cópia saiu do cache em disco: o arquivo precisa ser enviado de novo
     
-    # Botão para ver conclusões
-    if interface.button("📊 Ver Conclusões", use_container_width=True):
-        if interface.session_state.analisador_inteligente.conjunto_dados is not None:
-            conclusoes = interface.session_state.analisador_inteligente.obter_conclusoes()
-            interface.session_state.gerenciador_dialogo.adicionar_mensagem("assistente", conclusoes)
+    analisador.instrumentacao.iniciar("restauracao")
+    if descricao["modo"] == "fluxo":
+        analisador.carregar_informacoes_em_blocos(caminhos[0], descricao["tamanho_bloco"], nome=descricao["nome"])
+        referencia = ReferenciaDataset(
+            analisador.perfil_dados.impressao_digital, descricao["nome"], analisador.perfil_dados.forma
+        )
+    else:
+        armazem = obter_armazem_datasets()
+        with open(caminhos[0], "rb") as arquivo:
+            referencia, dados = armazem.carregar(arquivo.read(), descricao["nome"], leitor)
+        analisador.carregar_informacoes(dados, impressao_digital=referencia.chave, indice=armazem.obter_indice(referencia))
+    for anexo, caminho in zip(descricao["anexos"], caminhos[1:]):
+        with open(caminho, "rb") as arquivo:
+            analisador.anexar_dados(LeitorDatasets()(arquivo.read(), anexo["nome"]), registrar_conclusao=False)
+    return referencia
+
+def executar_interface():
+    inicio_execucao, inicio_cpu = time.perf_counter(), time.thread_time()
     
-    # Botão para limpar memória
-    if interface.button("🗑️ Limpar Memória", use_container_width=True):
-        interface.session_state.analisador_inteligente.limpar_memoria()
+    # Configuração da interface
+    interface.set_page_config(
+        page_title="Analisador Inteligente com Memória", 
+        layout="wide",
+        page_icon="🧠"
+    )
+    configurar_metricas()
+
+    interface.title("🧠 Analisador Inteligente com Memória Contextual")
+
+    # Inicialização na sessão; o ID na URL permite restaurar memória e conversa após reiniciar
+    persistencia = obter_persistencia_sessoes()
+    if "id_sessao" not in interface.session_state:
+        id_sessao = interface.query_params.get("sessao")
+        if persistencia is not None:
+            if not id_sessao or not persistencia.sessao_existe(id_sessao):
+                id_sessao = persistencia.criar_sessao()
+            interface.query_params["sessao"] = id_sessao
+        interface.session_state.id_sessao = id_sessao
+    id_sessao = interface.session_state.id_sessao
+
+    if "analisador_inteligente" not in interface.session_state:
+        chave_groq = os.getenv("GROQ_API_KEY")
+        print(chave_groq)
+        if not chave_groq:
+            interface.error("GROQ_API_KEY não encontrada nas variáveis de ambiente")
+        interface.session_state.analisador_inteligente = AnalisadorDadosInteligente(
+            chave_groq,
+            cache_respostas=obter_cache_respostas(),
+            gateway=obter_gateway_llm(),
+            instrumentacao=Instrumentacao(ativa=os.getenv("INSTRUMENTACAO", "1") != "0"),
+            memoria=SistemaMemoria(persistencia=persistencia, id_sessao=id_sessao)
+        )
+
+    if "gerenciador_dialogo" not in interface.session_state:
+        interface.session_state.gerenciador_dialogo = GerenciadorConversa(persistencia, id_sessao)
+
+    if "dados_carregados" not in interface.session_state:
+        interface.session_state.dados_carregados = None
+        # Sessão restaurada: recarrega o dataset a que a memória se refere, sem limpá-la
+        analisador = interface.session_state.analisador_inteligente
+        if analisador.memoria.descricao_dataset is not None:
+            with interface.spinner("Recarregando o dataset da sessão..."):
+                interface.session_state.dados_carregados = restaurar_dataset_da_sessao(analisador)
+            if interface.session_state.dados_carregados is None:
+                interface.toast(
+                    f"O arquivo '{analisador.memoria.descricao_dataset['nome']}' não está mais em cache. "
+                    "Envie-o novamente: com o mesmo conteúdo, a memória da sessão é mantida."
+                )
+    geracao_uploader = interface.session_state.setdefault("geracao_uploader", 0)
+
+    # Mensagem inicial
+    if interface.session_state.gerenciador_dialogo.total_mensagens == 0:
         interface.session_state.gerenciador_dialogo.adicionar_mensagem(
             "assistente", 
-            "Memória limpa! Começando uma nova sessão de análise."
+            "Olá! Sou um analisador inteligente com memória. Envie um arquivo de dados (CSV, Parquet ou Feather) e faça perguntas - vou lembrar das análises anteriores para dar respostas contextuais! 🧠"
         )
-        interface.rerun()
+
+    # Layout principal
+    col_principal, col_lateral = interface.columns([3, 1])
+
+    with col_lateral:
+        interface.header("🔧 Controles")
     
-    interface.markdown("---")
+        # Botão para ver conclusões
+        if interface.button("📊 Ver Conclusões", use_container_width=True):
+            if interface.session_state.analisador_inteligente.conjunto_dados is not None:
+                conclusoes = interface.session_state.analisador_inteligente.obter_conclusoes()
+                interface.session_state.gerenciador_dialogo.adicionar_mensagem("assistente", conclusoes)
     
-    # Área de upload
-    interface.header("📁 Carregar Dados")
-    arquivo_submetido = interface.file_uploader(
-        "Selecionar arquivo CSV",
-        type=["csv"],
-        help="Carregue um dataset para análise",
-        key="uploader_csv"
-    )
+        configuracao_atual = interface.session_state.analisador_inteligente.configuracao_graficos
+        formato_grafico = interface.selectbox(
+            "Formato dos gráficos",
+            ConfiguracaoGraficos.FORMATOS,
+            index=ConfiguracaoGraficos.FORMATOS.index(configuracao_atual.formato),
+            format_func=str.upper
+        )
+        resolucao_grafico = interface.select_slider(
+            "Resolução (dpi)",
+            options=[72, 100, 150, 300],
+            value=configuracao_atual.dpi,
+            disabled=formato_grafico == "svg"
+        )
+        interface.session_state.analisador_inteligente.configuracao_graficos = ConfiguracaoGraficos(
+            formato_grafico, resolucao_grafico
+        )
+        
+        respostas_em_fluxo = interface.toggle(
+            "⚡ Respostas em tempo real",
+            value=True,
+            help="Exibe a resposta enquanto ela é gerada"
+        )
+        
+        # Botão para limpar memória
+        if interface.button("🗑️ Limpar Memória", use_container_width=True):
+            interface.session_state.analisador_inteligente.limpar_memoria()
+            interface.session_state.gerenciador_dialogo.adicionar_mensagem(
+                "assistente", 
+                "Memória limpa! Começando uma nova sessão de análise."
+            )
+            interface.rerun()
+    
+        if persistencia is not None:
+            interface.caption(f"Sessão: `{id_sessao}`")
+            id_restaurar = interface.text_input("Restaurar sessão (ID)", key="id_restaurar")
+            if interface.button("♻️ Restaurar", use_container_width=True, disabled=not id_restaurar):
+                if persistencia.sessao_existe(id_restaurar.strip()):
+                    interface.query_params["sessao"] = id_restaurar.strip()
+                    # Uploaders com chave nova: o arquivo da sessão anterior não é recarregado na sessão restaurada
+                    interface.session_state.geracao_uploader += 1
+                    for chave in ("id_sessao", "analisador_inteligente", "gerenciador_dialogo", "dados_carregados"):
+                        interface.session_state.pop(chave, None)
+                    interface.rerun()
+                else:
+                    interface.error("Sessão não encontrada")
+    
+        interface.markdown("---")
+    
+        # Área de upload
+        interface.header("📁 Carregar Dados")
+        arquivo_submetido = interface.file_uploader(
+            "Selecionar arquivo (CSV, CSV.gz/.zst, Parquet, Feather/Arrow)",
+            # Parquet e Feather dependem do pyarrow; sem ele só CSV, gzip e (com o zstandard) zstd
+            type=list(LeitorDatasets.extensoes_suportadas()),
+            help="Carregue um dataset para análise",
+            key=f"uploader_csv_{geracao_uploader}"
+        )
+        modo_fluxo = interface.checkbox(
+            "Modo streaming (arquivos grandes)",
+            help="Lê o arquivo em blocos e mantém apenas estatísticas e uma amostra em memória"
+        )
+        converter_parquet = interface.checkbox(
+            "Guardar CSV como Parquet",
+            value=pa is not None,
+            disabled=pa is None or modo_fluxo,
+            help="Converte o CSV uma vez; recarregar o mesmo arquivo passa a ler o Parquet em cache"
+        )
+        tamanho_bloco = interface.number_input(
+            "Linhas por bloco",
+            min_value=10_000,
+            max_value=1_000_000,
+            value=100_000,
+            step=10_000,
+            disabled=not modo_fluxo
+        )
     
-    if arquivo_submetido and interface.session_state.dados_carregados is None:
-        with interface.spinner("Analisando dataset..."):
-            dados = pd.read_csv(arquivo_submetido)
-            interface.session_state.analisador_inteligente.carregar_informacoes(dados)
-            interface.session_state.dados_carregados = dados
+        if arquivo_submetido and interface.session_state.dados_carregados is None:
+            with interface.spinner("Analisando dataset..."):
+                analisador = interface.session_state.analisador_inteligente
+                analisador.instrumentacao.iniciar("carga")
+                try:
+                    if modo_fluxo:
+                        analisador.carregar_informacoes_em_blocos(
+                            arquivo_submetido, int(tamanho_bloco), nome=arquivo_submetido.name
+                        )
+                        referencia = ReferenciaDataset(
+                            analisador.perfil_dados.impressao_digital,
+                            arquivo_submetido.name,
+                            analisador.perfil_dados.forma
+                        )
+                    else:
+                        # A sessão guarda só a referência; DataFrame e índice ficam no armazém compartilhado
+                        armazem = obter_armazem_datasets()
+                        with analisador.instrumentacao.etapa("leitura_arquivo"):
+                            referencia, dados = armazem.carregar(
+                                arquivo_submetido.getvalue(),
+                                arquivo_submetido.name,
+                                criar_leitor_datasets(converter_parquet)
+                            )
+                        with analisador.instrumentacao.etapa("indice"):
+                            indice = armazem.obter_indice(referencia)
+                        analisador.carregar_informacoes(dados, impressao_digital=referencia.chave, indice=indice)
+                except ValueError as erro:
+                    # Formato ou compressão que este ambiente não lê (ex.: Parquet sem pyarrow)
+                    interface.error(f"Não foi possível ler '{arquivo_submetido.name}': {erro}")
+                else:
+                    if persistencia is not None:
+                        guardar_dataset_da_sessao(
+                            analisador,
+                            arquivo_submetido if modo_fluxo else arquivo_submetido.getvalue(),
+                            arquivo_submetido.name,
+                            "fluxo" if modo_fluxo else "memoria",
+                            int(tamanho_bloco) if modo_fluxo else None
+                        )
+                    linhas, colunas = referencia.forma
+                    interface.session_state.dados_carregados = referencia
             
-            interface.success(f"✅ Dataset carregado: {dados.shape[0]} linhas × {dados.shape[1]} colunas")
+                    interface.success(f"✅ Dataset carregado: {linhas} linhas × {colunas} colunas")
             
-            # Mensagem de confirmação com análise inicial
-            resumo_inicial = f"""
-            Dataset '{arquivo_submetido.name}' carregado com sucesso! 
+                    # Mensagem de confirmação com análise inicial
+                    resumo_inicial = f"""
+                    Dataset '{arquivo_submetido.name}' carregado com sucesso! 
 
-            **Resumo inicial:**
-            - Dimensões: {dados.shape[0]} linhas × {dados.shape[1]} colunas
-            - Memória contextual ativada
-            - Análise inicial concluída
+                    **Resumo inicial:**
+                    - Dimensões: {linhas} linhas × {colunas} colunas
+                    - Memória contextual ativada
+                    - Análise inicial concluída
 
-            Faça perguntas sobre os dados e eu vou me lembrar das análises anteriores!
-            """
+                    Faça perguntas sobre os dados e eu vou me lembrar das análises anteriores!
+                    """
             
-            interface.session_state.gerenciador_dialogo.adicionar_mensagem(
-                "assistente",
-                resumo_inicial
+                    interface.session_state.gerenciador_dialogo.adicionar_mensagem(
+                        "assistente",
+                        resumo_inicial
+                    )
+
+        # Anexo incremental: novas linhas entram sem refazer a análise nem limpar a memória
+        if interface.session_state.dados_carregados is not None:
+            arquivo_anexo = interface.file_uploader(
+                "➕ Anexar novos dados",
+                type=list(LeitorDatasets.extensoes_suportadas()),
+                help="Mesmas colunas do dataset carregado; as estatísticas são atualizadas só com as linhas novas",
+                key=f"uploader_anexo_{geracao_uploader}"
             )
+            anexos_processados = interface.session_state.setdefault("anexos_processados", set())
+            if arquivo_anexo and arquivo_anexo.file_id not in anexos_processados:
+                anexos_processados.add(arquivo_anexo.file_id)
+                analisador = interface.session_state.analisador_inteligente
+                with interface.spinner("Anexando dados..."):
+                    analisador.instrumentacao.iniciar("anexo")
+                    try:
+                        with analisador.instrumentacao.etapa("leitura_arquivo"):
+                            novos_dados = LeitorDatasets()(arquivo_anexo.getvalue(), arquivo_anexo.name)
+                        resumo_anexo = analisador.anexar_dados(novos_dados)
+                    except ValueError as erro:
+                        interface.error(f"Não foi possível anexar '{arquivo_anexo.name}': {erro}")
+                    else:
+                        if persistencia is not None:
+                            guardar_anexo_da_sessao(analisador, arquivo_anexo.getvalue(), arquivo_anexo.name)
+                        interface.session_state.gerenciador_dialogo.adicionar_mensagem("assistente", f"📥 {resumo_anexo}")
+
+        # Estatísticas da sessão
+        if interface.session_state.dados_carregados is not None:
+            interface.markdown("---")
+            interface.header("📈 Estatísticas")
+            analisador = interface.session_state.analisador_inteligente
+            linhas, colunas = analisador.perfil_dados.forma
+        
+            col1, col2 = interface.columns(2)
+            col1.metric("Linhas", linhas)
+            col2.metric("Colunas", colunas)
+        
+            interface.metric("Análises Realizadas", analisador.memoria.contador_interacoes)
+            interface.metric("Insights Coletados", len(analisador.memoria.insights_coletados))
+            if analisador.ultima_medicao:
+                medicao = analisador.ultima_medicao
+                interface.metric(
+                    "Última resposta",
+                    f"{medicao['total_s']:.1f}s",
+                    delta=f"-{medicao['economia_s']:.1f}s com gráfico em paralelo",
+                    delta_color="normal"
+                )
+            
+            if analisador.ultimo_prompt_tokens:
+                interface.metric(
+                    "Tokens do último prompt (estimativa)",
+                    analisador.ultimo_prompt_tokens,
+                    help=f"Orçamento: {analisador.construtor_prompt.orcamento_tokens} tokens"
+                )
+            
+            if analisador.cache_respostas is not None:
+                cache = analisador.cache_respostas
+                col1, col2 = interface.columns(2)
+                col1.metric("Cache (acertos)", cache.acertos)
+                col2.metric("Cache (falhas)", cache.falhas)
+                interface.caption(f"Taxa de acerto do cache de respostas: {cache.taxa_acerto:.0%}")
+        
+        exibir_diagnostico(interface.session_state.analisador_inteligente.instrumentacao)
+
+    with col_principal:
+        interface.header("💬 Análise Contextual com Memória")
+    
+        # Exibir histórico de conversa; mensagens antigas vêm do disco sob demanda
+        if interface.session_state.gerenciador_dialogo.ha_mensagens_anteriores:
+            if interface.button("⬆️ Carregar mensagens anteriores"):
+                interface.session_state.gerenciador_dialogo.carregar_anteriores()
+        for mensagem in interface.session_state.gerenciador_dialogo.registros:
+            with interface.chat_message(mensagem["emissor"]):
+                interface.markdown(mensagem["conteudo"])
+                if mensagem["imagem"]:
+                    imagem = interface.session_state.gerenciador_dialogo.obter_imagem(mensagem["imagem"])
+                    interface.image(imagem.para_exibicao(), use_container_width=True)
+
+        # Entrada do usuário
+        entrada_usuario = interface.chat_input(
+            "Digite sua pergunta sobre os dados...",
+            disabled=interface.session_state.dados_carregados is None
+        )
+
+        if entrada_usuario:
+            # Adiciona pergunta do usuário
+            interface.session_state.gerenciador_dialogo.adicionar_mensagem("usuario", entrada_usuario)
+        
+            with interface.chat_message("usuario"):
+                interface.markdown(entrada_usuario)
+        
+            # Processa a resposta
+            with interface.chat_message("assistente"):
+                analisador = interface.session_state.analisador_inteligente
+                if respostas_em_fluxo:
+                    # Renderiza os tokens conforme chegam; memória e gráfico são processados ao final
+                    resposta = analisador.obter_resposta_em_fluxo(entrada_usuario)
+                    interface.write_stream(resposta)
+                    texto_resposta, grafico = resposta.texto, resposta.visualizacao
+                else:
+                    with interface.spinner("Analisando com contexto anterior..."):
+                        texto_resposta, grafico = analisador.obter_resposta(entrada_usuario)
+                    interface.markdown(texto_resposta)
+                
+                if analisador.ultimas_consultas:
+                    with interface.expander("🔎 Consultas executadas localmente"):
+                        for execucao in analisador.ultimas_consultas:
+                            interface.code(execucao["consulta"], language="json")
+                            interface.text(execucao["resultado"])
+                
+                if grafico:
+                    interface.image(grafico.para_exibicao(), use_container_width=True)
+        
+            # Armazena resposta no histórico
+            interface.session_state.gerenciador_dialogo.adicionar_mensagem("assistente", texto_resposta, grafico)
 
-    # Estatísticas da sessão
+    # Rodapé com informações da memória
     if interface.session_state.dados_carregados is not None:
         interface.markdown("---")
-        interface.header("📈 Estatísticas")
-        dados = interface.session_state.dados_carregados
+        col1, col2, col3 = interface.columns(3)
+    
         analisador = interface.session_state.analisador_inteligente
-        
-        col1, col2 = interface.columns(2)
-        col1.metric("Linhas", dados.shape[0])
-        col2.metric("Colunas", dados.shape[1])
-        
-        interface.metric("Análises Realizadas", analisador.memoria.contador_interacoes)
-        interface.metric("Insights Coletados", len(analisador.memoria.insights_coletados))
-
-with col_principal:
-    interface.header("💬 Análise Contextual com Memória")
-    
-    # Exibir histórico de conversa
-    for mensagem in interface.session_state.gerenciador_dialogo.registros:
-        with interface.chat_message(mensagem["emissor"]):
-            interface.markdown(mensagem["conteudo"])
-            if mensagem["imagem"]:
-                interface.image(mensagem["imagem"], use_container_width=True)
-
-    # Entrada do usuário
-    entrada_usuario = interface.chat_input(
-        "Digite sua pergunta sobre os dados...",
-        disabled=interface.session_state.dados_carregados is None
+        col1.metric("Interações", analisador.memoria.contador_interacoes)
+        col2.metric("Conclusões", len(analisador.memoria.conclusoes_gerais))
+        col3.metric("Insights", len(analisador.memoria.insights_coletados))
+
+    # Exemplos de perguntas
+    with col_lateral:
+        interface.markdown("---")
+        interface.header("💡 Perguntas Sugeridas")
+        interface.markdown("""
+        - Qual a distribuição dos dados?
+        - Existe correlação entre variáveis?
+        - Quais são os outliers?
+        - Mostre tendências temporais
+        - Compare categorias
+        - **Quais suas conclusões?** ← Novo!
+        """)
+
+    interface.session_state.analisador_inteligente.instrumentacao.registrar_execucao_interface(
+        time.perf_counter() - inicio_execucao, time.thread_time() - inicio_cpu
     )
 
-    if entrada_usuario:
-        # Adiciona pergunta do usuário
-        interface.session_state.gerenciador_dialogo.adicionar_mensagem("usuario", entrada_usuario)
+def exibir_diagnostico(instrumentacao):
+    """Painel recolhível com as medições da última operação e exportação das métricas"""
+    with interface.expander("🩺 Diagnóstico"):
+        instrumentacao.ativa = interface.toggle("Coletar medições", value=instrumentacao.ativa)
+        if not instrumentacao.medir_memoria:
+            # O tracemalloc vale para o processo todo; não pode ser ligado por uma sessão
+            interface.caption("Pico de memória por etapa: inicie o app com MEDIR_MEMORIA=1 para medir")
         
-        with interface.chat_message("usuario"):
-            interface.markdown(entrada_usuario)
+        if instrumentacao.medicoes:
+            interface.caption(f"Última operação: {instrumentacao.operacao}")
+            tabela = pd.DataFrame(
+                {
+                    "Etapa": medicao.etapa,
+                    "Tempo (ms)": medicao.parede_s * 1000,
+                    "CPU (ms)": medicao.cpu_s * 1000,
+                    "Memória (KB)": None if medicao.memoria_bytes is None else medicao.memoria_bytes / 1024,
+                }
+                for medicao in instrumentacao.medicoes
+            )
+            interface.dataframe(tabela, hide_index=True, use_container_width=True)
+            if any(instrumentacao.tokens.values()):
+                interface.caption(
+                    f"Tokens: {instrumentacao.tokens['prompt']} no prompt, "
+                    f"{instrumentacao.tokens['completion']} na resposta"
+                )
+        if instrumentacao.ultima_execucao_interface is not None:
+            interface.caption(
+                f"Execução anterior da interface: {instrumentacao.ultima_execucao_interface.parede_s * 1000:.0f} ms"
+            )
         
-        # Processa a resposta
-        with interface.chat_message("assistente"):
-            with interface.spinner("Analisando com contexto anterior..."):
-                texto_resposta, grafico = interface.session_state.analisador_inteligente.obter_resposta(entrada_usuario)
-            
-            interface.markdown(texto_resposta)
-            if grafico:
-                interface.image(grafico, use_container_width=True)
-        
-        # Armazena resposta no histórico
-        interface.session_state.gerenciador_dialogo.adicionar_mensagem("assistente", texto_resposta, grafico)
-
-# Rodapé com informações da memória
-if interface.session_state.dados_carregados is not None:
-    interface.markdown("---")
-    col1, col2, col3 = interface.columns(3)
-    
-    analisador = interface.session_state.analisador_inteligente
-    col1.metric("Interações", analisador.memoria.contador_interacoes)
-    col2.metric("Conclusões", len(analisador.memoria.conclusoes_gerais))
-    col3.metric("Insights", len(analisador.memoria.insights_coletados))
-
-# Exemplos de perguntas
-with col_lateral:
-    interface.markdown("---")
-    interface.header("💡 Perguntas Sugeridas")
-    interface.markdown("""
-    - Qual a distribuição dos dados?
-    - Existe correlação entre variáveis?
-    - Quais são os outliers?
-    - Mostre tendências temporais
-    - Compare categorias
-    - **Quais suas conclusões?** ← Novo!
-    """)
\ No newline at end of file
+        col1, col2 = interface.columns(2)
+        col1.download_button(
+            "Métricas (Prometheus)",
+            instrumentacao.metricas.para_prometheus(),
+            file_name="metricas.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
+        col2.download_button(
+            "Medições (JSON)",
+            json.dumps(instrumentacao.resumo(), ensure_ascii=False, indent=2),
+            file_name="medicoes.json",
+            mime="application/json",
+            use_container_width=True
+        )
+
+if __name__ == "__main__":
+    executar_interface()
@@ -0,0 +1,170 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+RESPOSTA_PADRAO = (
+    "A distribuição dos dados mostra uma tendência de alta na primeira variável, "
+    "com alguns outliers acima do terceiro quartil. Portanto, sugere que existe um padrão "
+    "sazonal relevante. Em resumo, recomenda-se investigar a correlação entre as colunas numéricas."
+)
+
+def estimar_uso(mensagens, tokens_resposta):
+    """Uso de tokens aproximado (palavras), no formato do campo `usage` da API"""
+    prompt = sum(len(str(mensagem.get("content", "")).split()) for mensagem in mensagens)
+    return SimpleNamespace(
+        prompt_tokens=prompt, completion_tokens=len(tokens_resposta), total_tokens=prompt + len(tokens_resposta)
+    )
+
+class ClienteLLMSimulado:
+    """Cliente local com a mesma interface de Groq().chat.completions, sem acesso à rede.
+    
+    Útil para testes e medições: a latência do primeiro token e de cada token seguinte
+    é configurável, e o modo stream=True entrega a resposta em pedaços como a API real.
+    `resposta` pode ser uma lista: cada chamada consome a próxima e a última se repete,
+    o que permite simular um pedido de consulta seguido da resposta final.
+    """
+    def __init__(self, resposta=RESPOSTA_PADRAO, latencia_primeiro_token=0.0, latencia_por_token=0.0):
+        self.respostas = list(resposta) if isinstance(resposta, (list, tuple)) else [resposta]
+        self.latencia_primeiro_token = latencia_primeiro_token
+        self.latencia_por_token = latencia_por_token
+        self.chamadas = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._criar))
+    
+    def _criar(self, messages, model, temperature=None, max_tokens=None, stream=False, **kwargs):
+        resposta = self.respostas[min(len(self.chamadas), len(self.respostas) - 1)]
+        self.chamadas.append({"messages": messages, "model": model, "stream": stream})
+        tokens = resposta.split(" ")
+        uso = estimar_uso(messages, tokens)
+        if stream:
+            return self._fluxo(tokens, uso)
+        
+        time.sleep(self.latencia_primeiro_token + self.latencia_por_token * len(tokens))
+        mensagem = SimpleNamespace(role="assistant", content=resposta)
+        return SimpleNamespace(choices=[SimpleNamespace(message=mensagem, finish_reason="stop")], usage=uso)
+    
+    def _fluxo(self, tokens, uso):
+        time.sleep(self.latencia_primeiro_token)
+        for i, token in enumerate(tokens):
+            if i > 0:
+                time.sleep(self.latencia_por_token)
+            conteudo = token if i == 0 else " " + token
+            delta = SimpleNamespace(role="assistant", content=conteudo)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+        # Como na Groq, o uso de tokens chega no último pedaço, em x_groq.usage
+        yield SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")],
+            x_groq=SimpleNamespace(usage=uso)
+        )
+
+
+class ServidorLLMSimulado:
+    """Servidor HTTP local que imita o endpoint de chat da Groq (compatível com OpenAI).
+    
+    Simula latência e rejeições: as primeiras `falhas_iniciais` requisições e uma fração
+    `taxa_falhas` das demais recebem `status_falha` (429 por padrão, com Retry-After).
+    Registra o total de requisições e o pico de requisições simultâneas. Uso:
+    
+        with ServidorLLMSimulado(taxa_falhas=0.3) as servidor:
+            cliente = Groq(api_key="teste", base_url=servidor.url, max_retries=0)
+    """
+    def __init__(self, resposta=RESPOSTA_PADRAO, latencia=0.0, falhas_iniciais=0, taxa_falhas=0.0,
+                 status_falha=429, retry_after=None, semente=0):
+        self.resposta = resposta
+        self.latencia = latencia
+        self.falhas_iniciais = falhas_iniciais
+        self.taxa_falhas = taxa_falhas
+        self.status_falha = status_falha
+        self.retry_after = retry_after
+        self.requisicoes = 0
+        self.falhas = 0
+        self.em_andamento = 0
+        self.pico_simultaneas = 0
+        self._aleatorio = random.Random(semente)
+        self._trava = threading.Lock()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", 0), self._criar_manipulador())
+        self._servidor.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address
+        return f"http://{host}:{porta}"
+    
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *erro):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+    
+    def _deve_falhar(self):
+        with self._trava:
+            self.requisicoes += 1
+            falhar = self.requisicoes <= self.falhas_iniciais or self._aleatorio.random() < self.taxa_falhas
+            if falhar:
+                self.falhas += 1
+            return falhar
+    
+    def _criar_manipulador(self):
+        servidor = self
+        
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, *args):
+                pass
+            
+            def do_POST(self):
+                corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with servidor._trava:
+                    servidor.em_andamento += 1
+                    servidor.pico_simultaneas = max(servidor.pico_simultaneas, servidor.em_andamento)
+                try:
+                    time.sleep(servidor.latencia)
+                    if servidor._deve_falhar():
+                        self._enviar_json(servidor.status_falha, {"error": {"message": "limite simulado", "type": "rate_limit"}})
+                    elif corpo.get("stream"):
+                        self._enviar_fluxo(corpo.get("model"))
+                    else:
+                        self._enviar_json(200, {
+                            "id": "simulado", "object": "chat.completion", "created": int(time.time()),
+                            "model": corpo.get("model"),
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": servidor.resposta}}],
+                            "usage": vars(estimar_uso(corpo.get("messages", []), servidor.resposta.split(" ")))
+                        })
+                finally:
+                    with servidor._trava:
+                        servidor.em_andamento -= 1
+            
+            def _enviar_json(self, status, dados):
+                conteudo = json.dumps(dados).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(conteudo)))
+                if status != 200 and servidor.retry_after is not None:
+                    self.send_header("Retry-After", str(servidor.retry_after))
+                self.end_headers()
+                self.wfile.write(conteudo)
+            
+            def _enviar_fluxo(self, modelo):
+                eventos = []
+                for i, token in enumerate(servidor.resposta.split(" ")):
+                    eventos.append({
+                        "id": "simulado", "object": "chat.completion.chunk", "created": int(time.time()), "model": modelo,
+                        "choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token}, "finish_reason": None}]
+                    })
+                conteudo = "".join(f"data: {json.dumps(evento)}\n\n" for evento in eventos) + "data: [DONE]\n\n"
+                conteudo = conteudo.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(conteudo)))
+                self.end_headers()
+                self.wfile.write(conteudo)
+        
+        return Manipulador
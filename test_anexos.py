@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+@pytest.fixture
+def novos():
+    """Linhas novas com uma categoria inédita, datas além do período e texto em vez de `category`"""
+    return pd.DataFrame({
+        "valor": [11.0, 9.5, np.nan],
+        "categoria": ["a", "d", None],
+        "data": pd.to_datetime(["2025-06-01", "2025-06-02", None]),
+    })
+
+def test_alinhar_tipos_une_as_categorias(dados, novos):
+    base, bloco = main.alinhar_tipos(dados, novos[["data", "valor", "categoria"]])
+    assert list(bloco.columns) == list(dados.columns)
+    assert list(base["categoria"].cat.categories) == ["a", "b", "c", "d"]
+    assert bloco["categoria"].dtype == base["categoria"].dtype
+    assert base["categoria"].tolist() == dados["categoria"].tolist()
+
+def test_alinhar_tipos_recusa_colunas_diferentes(dados, novos):
+    with pytest.raises(ValueError, match="colunas"):
+        main.alinhar_tipos(dados, novos.rename(columns={"valor": "preco"}))
+
+def test_indice_anexado_confere_com_o_recalculado(dados, novos):
+    base, bloco = main.alinhar_tipos(dados, novos)
+    original = main.IndiceDataset(base)
+    anexado = original.anexar(bloco)
+    completo = main.IndiceDataset(pd.concat([base, bloco], ignore_index=True))
+
+    assert anexado.total_linhas == completo.total_linhas == len(dados) + len(novos)
+    assert anexado.ausentes == completo.ausentes
+    assert anexado.limites == completo.limites
+    pd.testing.assert_series_equal(
+        anexado.contagens["categoria"].sort_index(), completo.contagens["categoria"].sort_index(), check_names=False
+    )
+    # O índice original pode estar compartilhado entre sessões: não muda
+    assert original.total_linhas == len(dados) and original.contagens["categoria"].get("d", 0) == 0
+
+def test_anexo_em_memoria_mantem_o_perfil_exato(criar_analisador, dados, novos):
+    analisador = criar_analisador()
+    analisador.carregar_informacoes(dados)
+    resumo = analisador.anexar_dados(novos)
+
+    assert resumo.startswith(f"Dados anexados: +3 linhas (total {len(dados) + 3})")
+    assert "novas categorias em categoria: 'd'" in resumo
+    assert "período de data 2024-01-01 00:00:00 a 2024-10-26 00:00:00 → 2024-01-01 00:00:00 a 2025-06-02 00:00:00" in resumo
+    assert analisador.memoria.conclusoes_gerais[-1].conclusao == resumo
+
+    # Mesmos números de uma carga direta dos dados completos, sem estimativas
+    completo = criar_analisador()
+    completo.carregar_informacoes(pd.concat(main.alinhar_tipos(dados, novos), ignore_index=True))
+    assert analisador.perfil_dados.resumos_colunas == completo.perfil_dados.resumos_colunas
+    pd.testing.assert_frame_equal(analisador.perfil_colunas, completo.perfil_colunas)
+    assert "~" not in "".join(analisador.perfil_dados.resumos_colunas.values())
+
+def test_reaplicar_os_mesmos_anexos_gera_a_mesma_impressao(criar_analisador, dados, novos):
+    impressoes = []
+    for _ in range(2):
+        analisador = criar_analisador()
+        analisador.carregar_informacoes(dados)
+        analisador.anexar_dados(novos, registrar_conclusao=False)
+        impressoes.append(analisador.perfil_dados.impressao_digital)
+    assert impressoes[0] == impressoes[1]
+    assert len(analisador.memoria.conclusoes_gerais) == 1  # Só a da análise inicial
+
+def test_anexo_em_blocos_atualiza_os_acumuladores(criar_analisador, dados, novos, tmp_path):
+    caminho = tmp_path / "dados.csv"
+    dados.to_csv(caminho, index=False)
+    analisador = criar_analisador()
+    analisador.carregar_informacoes_em_blocos(caminho, tamanho_bloco=100)
+    resumo = analisador.anexar_dados(novos)
+
+    assert analisador.estatisticas_fluxo.total_linhas == len(dados) + 3
+    assert analisador.perfil_dados.forma == (len(dados) + 3, 3)
+    assert "novas categorias em categoria: 'd'" in resumo
+
+@pytest.mark.parametrize("modo", ["memoria", "fluxo"])
+def test_anexo_com_colunas_diferentes_e_recusado(criar_analisador, dados, novos, tmp_path, modo):
+    analisador = criar_analisador()
+    if modo == "memoria":
+        analisador.carregar_informacoes(dados)
+    else:
+        dados.to_csv(tmp_path / "dados.csv", index=False)
+        analisador.carregar_informacoes_em_blocos(tmp_path / "dados.csv", tamanho_bloco=100)
+    perfil = analisador.perfil_dados
+
+    with pytest.raises(ValueError, match="colunas"):
+        analisador.anexar_dados(novos.drop(columns="data"))
+    assert analisador.perfil_dados is perfil and len(analisador.conjunto_dados) == len(dados)
+
+def test_descrever_mudancas_sem_diferencas(criar_analisador, dados):
+    analisador = criar_analisador()
+    analisador.carregar_informacoes(dados)
+    retrato = analisador._retrato_estatisticas()
+    assert analisador._descrever_mudancas(retrato, retrato, 0) == (
+        f"Dados anexados: +0 linhas (total {len(dados)}); sem mudanças relevantes nas estatísticas"
+    )
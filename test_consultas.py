@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+import main
+
+COLUNAS = ["valor", "categoria", "data"]
+
+@pytest.fixture
+def motor():
+    return main.MotorConsultas()
+
+@pytest.mark.parametrize("especificacao", [
+    [],
+    {"operacao": "apagar"},
+    {"operacao": ["agregar"]},
+    {"operacao": "agregar", "coluna": "inexistente", "agregacao": "mean"},
+    {"operacao": "agregar", "coluna": ["valor"], "agregacao": "mean"},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": ["mean"]},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": "eval"},
+    {"operacao": "agrupar", "por": [["categoria"]]},
+    {"operacao": "agrupar", "por": []},
+    {"operacao": "agrupar", "por": "categoria", "agregacao": "mean"},
+    {"operacao": "agrupar", "por": "categoria", "ordenar": ["asc"]},
+    {"operacao": "agrupar", "por": "categoria", "limite": "10"},
+    {"operacao": "agrupar", "por": "categoria", "limite": True},
+    {"operacao": "correlacao", "colunas": 5},
+    {"operacao": "correlacao", "colunas": "valor"},
+    {"operacao": "correlacao", "metodo": {"nome": "pearson"}},
+    {"operacao": "reamostrar", "coluna_data": "data", "coluna": "valor", "frequencia": ["M"]},
+    {"operacao": "reamostrar", "coluna_data": "data", "coluna": "valor", "frequencia": "H"},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": "mean", "filtros": {"coluna": "valor"}},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": "mean",
+     "filtros": [{"coluna": "valor", "op": ["=="], "valor": 1}]},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": "mean",
+     "filtros": [{"coluna": "categoria", "op": "in", "valor": "a"}]},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": "mean",
+     "filtros": [{"coluna": "categoria", "op": "in", "valor": [["a"]]}]},
+    {"operacao": "agregar", "coluna": "valor", "agregacao": "mean",
+     "filtros": [{"coluna": "valor", "op": ">", "valor": {"x": 1}}]},
+])
+def test_validar_rejeita_especificacoes_malformadas(motor, especificacao):
+    with pytest.raises(main.ConsultaInvalida):
+        motor.validar(especificacao, COLUNAS)
+
+def test_validar_normaliza_padroes(motor):
+    normalizada = motor.validar({"operacao": "agrupar", "por": "categoria", "limite": 500}, COLUNAS)
+    assert normalizada == {
+        "operacao": "agrupar", "filtros": [], "por": ["categoria"],
+        "agregacao": "count", "ordenar": "desc", "limite": motor.LIMITE_LINHAS,
+    }
+
+def test_executar_agrupamento_confere_com_pandas(motor, dados):
+    especificacao = motor.validar(
+        {"operacao": "agrupar", "por": ["categoria"], "coluna": "valor", "agregacao": "mean",
+         "filtros": [{"coluna": "valor", "op": ">", "valor": 9}]},
+        dados.columns
+    )
+    resultado = motor.executar(dados, especificacao, "dataset-teste")
+    esperado = dados[dados["valor"] > 9].groupby("categoria", observed=True)["valor"].mean()
+    for categoria, media in esperado.items():
+        assert f"{categoria}" in resultado and main.formatar_numero(media) in resultado
+
+@pytest.mark.parametrize("texto, esperado", [
+    ('```consulta\n{"operacao": "agregar"}\n```', '{"operacao": "agregar"}'),
+    ('  \n```consulta {"operacao": "agregar"} ```\ntexto depois', '{"operacao": "agregar"}'),
+    ('Vou calcular. ```consulta {"operacao": "agregar"}```', None),
+    ("Resposta sem consulta.", None),
+])
+def test_extrair_consulta_so_aceita_bloco_no_inicio(texto, esperado):
+    assert main.extrair_consulta(texto) == esperado
+
+CONSULTA = {"operacao": "agregar", "coluna": "valor", "agregacao": "max"}
+
+@pytest.fixture
+def preparar(criar_analisador, dados):
+    """Analisador com `dados` carregados cujo modelo simulado devolve `respostas` em sequência"""
+    def preparar(respostas):
+        analisador = criar_analisador(respostas)
+        analisador.carregar_informacoes(dados)
+        return analisador, analisador.gateway.cliente
+    return preparar
+
+def test_consulta_ida_e_volta(dados, preparar, responder, em_fluxo):
+    analisador, cliente = preparar(["```consulta\n" + json.dumps(CONSULTA) + "\n```", "O maior valor foi calculado."])
+    texto, _ = responder(analisador, "Qual o maior valor?", em_fluxo)
+    
+    assert texto == "O maior valor foi calculado."
+    assert len(cliente.chamadas) == 2
+    resultado_enviado = cliente.chamadas[1]["messages"][-1]["content"]
+    assert "calculado localmente" in resultado_enviado
+    assert main.formatar_numero(dados["valor"].max()) in resultado_enviado
+    assert analisador.ultimas_consultas[0]["consulta"] == json.dumps(CONSULTA)
+
+def test_consulta_malformada_volta_ao_modelo_como_erro(preparar, responder, em_fluxo):
+    analisador, cliente = preparar(
+        ['```consulta\n{"operacao": "agregar", "coluna": ["valor"], "agregacao": "max"}\n```', "Sem consulta."]
+    )
+    texto, _ = responder(analisador, "Qual o maior valor?", em_fluxo)
+    
+    assert texto == "Sem consulta."
+    assert cliente.chamadas[1]["messages"][-1]["content"].startswith("Consulta inválida:")
+
+def test_bloco_no_meio_da_resposta_e_tratado_igual_nos_dois_modos(preparar, responder, em_fluxo):
+    resposta_modelo = "Vou calcular. ```consulta\n" + json.dumps(CONSULTA) + "\n```"
+    analisador, cliente = preparar([resposta_modelo, "não deveria ser chamada"])
+    texto, _ = responder(analisador, "Qual o maior valor?", em_fluxo)
+    
+    assert texto == resposta_modelo
+    assert len(cliente.chamadas) == 1
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+QUANTIS = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+def test_esboco_quantis_fica_perto_dos_quantis_exatos():
+    valores = np.random.default_rng(0).lognormal(size=200_000)
+    esboco = main.EsbocoQuantis()
+    for bloco in np.array_split(valores, 20):
+        esboco.adicionar(bloco)
+
+    ordenados = np.sort(valores)
+    assert esboco.total == len(valores)
+    assert (esboco.minimo, esboco.maximo) == (ordenados[0], ordenados[-1])
+    for q in QUANTIS:
+        # Erro medido em posição: que fração dos dados fica abaixo da estimativa
+        posicao = np.searchsorted(ordenados, esboco.quantil(q)) / len(ordenados)
+        assert abs(posicao - q) < 0.01
+        assert esboco.fracao_abaixo(np.quantile(valores, q)) == pytest.approx(q, abs=0.01)
+
+def test_esboco_quantis_mesclado_equivale_ao_unico():
+    aleatorio = np.random.default_rng(1)
+    primeira, segunda = aleatorio.normal(0, 1, 50_000), aleatorio.normal(5, 1, 50_000)
+    mesclado, unico = main.EsbocoQuantis(), main.EsbocoQuantis()
+    mesclado.adicionar(primeira)
+    outro = main.EsbocoQuantis()
+    outro.adicionar(segunda)
+    mesclado.mesclar(outro)
+    unico.adicionar(np.concatenate([primeira, segunda]))
+
+    assert mesclado.valores.size <= mesclado.capacidade
+    for q in QUANTIS:
+        assert mesclado.quantil(q) == pytest.approx(unico.quantil(q), abs=0.1)
+
+def test_esboco_cardinalidade_exato_ate_k():
+    esboco = main.EsbocoCardinalidade(k=1024)
+    esboco.adicionar(pd.Series(np.arange(1000).repeat(3)))
+    esboco.adicionar(pd.Series([None, np.nan]))
+    assert esboco.exato and esboco.estimar() == 1000
+
+@pytest.mark.parametrize("distintos", [5_000, 300_000])
+def test_esboco_cardinalidade_estima_com_erro_pequeno(distintos):
+    valores = pd.Series([f"id-{i}" for i in range(distintos)])
+    esboco, mesclado = main.EsbocoCardinalidade(), main.EsbocoCardinalidade()
+    for bloco in np.array_split(np.arange(distintos), 7):
+        esboco.adicionar(valores.iloc[bloco])
+        parcial = main.EsbocoCardinalidade()
+        parcial.adicionar(valores.iloc[bloco])
+        mesclado.mesclar(parcial)
+    # Repetir valores já vistos não muda a estimativa
+    esboco.adicionar(valores.iloc[:1000])
+
+    assert not esboco.exato
+    assert esboco.estimar() == mesclado.estimar()
+    assert abs(esboco.estimar() - distintos) / distintos < 0.1  # ~3 erros-padrão com k=1024
+
+def test_amostra_reservatorio_tem_tamanho_fixo_e_e_uniforme():
+    total, capacidade = 200_000, 4_000
+    reservatorio = main.AmostraReservatorio(capacidade=capacidade, semente=7)
+    for bloco in np.array_split(np.arange(total), 29):
+        reservatorio.adicionar(pd.DataFrame({"linha": bloco}))
+
+    linhas = reservatorio.amostra["linha"].to_numpy()
+    assert reservatorio.vistos == total
+    assert len(linhas) == capacidade and len(np.unique(linhas)) == capacidade
+    # Cada décimo do fluxo deve ter ~10% da amostra, inclusive o início e o fim
+    proporcoes = np.bincount(linhas * 10 // total, minlength=10) / capacidade
+    assert np.all(np.abs(proporcoes - 0.1) < 0.02)
+
+def test_amostra_reservatorio_guarda_tudo_abaixo_da_capacidade():
+    reservatorio = main.AmostraReservatorio(capacidade=100)
+    reservatorio.adicionar(pd.DataFrame({"linha": range(60)}))
+    reservatorio.adicionar(pd.DataFrame({"linha": range(60, 90)}))
+    assert reservatorio.amostra["linha"].tolist() == list(range(90))
+
+def test_coluna_vazia_no_primeiro_bloco_que_traz_texto_depois(criar_analisador, tmp_path):
+    linhas = 20_000
+    caminho = tmp_path / "esparso.csv"
+    pd.DataFrame({
+        "valor": np.arange(linhas, dtype=float),
+        "late": [None] * (linhas // 2) + [f"t{i % 7}" for i in range(linhas // 2)],
+    }).to_csv(caminho, index=False)
+
+    analisador = criar_analisador()
+    analisador.carregar_informacoes_em_blocos(caminho, tamanho_bloco=linhas // 2)
+    estatisticas = analisador.estatisticas_fluxo
+    assert "late" in estatisticas.categoricas and "late" not in estatisticas.numericas
+    assert estatisticas.ausentes["late"] == linhas // 2
+    assert estatisticas.categoricas["late"].distintos.estimar() == 7
+    resumo = analisador.perfil_dados.resumos_colunas["late"]
+    assert "float64" not in resumo and "7 valores distintos" in resumo and "ausentes=50.0%" in resumo
+
+def test_coluna_numerica_com_texto_depois_fica_com_contagem_incompleta():
+    estatisticas = main.EstatisticasIncrementais()
+    estatisticas.adicionar_bloco(pd.DataFrame({"codigo": [1.0, 2.0, np.nan]}))
+    estatisticas.adicionar_bloco(pd.DataFrame({"codigo": ["x", "3", None]}))
+    contador = estatisticas.categoricas["codigo"]
+    assert contador.podado  # Os números do primeiro bloco não entraram nas contagens
+    assert estatisticas.ausentes["codigo"] == 2
+    assert estatisticas.perfilar()[0].empty
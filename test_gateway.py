@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+from groq import APIStatusError, Groq
+
+import main
+from simulacao import RESPOSTA_PADRAO, ServidorLLMSimulado
+
+MENSAGENS = [{"role": "user", "content": "Olá"}]
+
+def criar_gateway(servidor, **opcoes):
+    cliente = Groq(api_key="chave-teste", base_url=servidor.url, max_retries=0)
+    opcoes = {"requisicoes_por_minuto": None, "espera_base": 0.01, "espera_maxima": 0.05, **opcoes}
+    return main.GatewayLLM(cliente, **opcoes)
+
+def completar(gateway):
+    resposta = gateway.completar(messages=MENSAGENS, model="modelo-teste")
+    return resposta.choices[0].message.content
+
+def test_repete_falhas_transitorias_ate_conseguir():
+    with ServidorLLMSimulado(falhas_iniciais=2) as servidor:
+        gateway = criar_gateway(servidor)
+        assert completar(gateway) == RESPOSTA_PADRAO
+    assert servidor.requisicoes == 3
+    assert gateway.repeticoes == 2
+
+def test_respeita_retry_after():
+    with ServidorLLMSimulado(falhas_iniciais=1, retry_after=0.3) as servidor:
+        gateway = criar_gateway(servidor)
+        inicio = time.monotonic()
+        assert completar(gateway) == RESPOSTA_PADRAO
+        assert time.monotonic() - inicio >= 0.3
+    assert servidor.requisicoes == 2
+
+def test_desiste_apos_esgotar_tentativas():
+    with ServidorLLMSimulado(falhas_iniciais=100) as servidor:
+        gateway = criar_gateway(servidor, max_tentativas=3)
+        with pytest.raises(main.ErroGatewayLLM, match="HTTP 429"):
+            completar(gateway)
+    assert servidor.requisicoes == 3
+
+def test_nao_repete_erros_definitivos():
+    with ServidorLLMSimulado(falhas_iniciais=1, status_falha=400) as servidor:
+        gateway = criar_gateway(servidor)
+        with pytest.raises(APIStatusError):
+            completar(gateway)
+    assert servidor.requisicoes == 1
+    assert gateway.repeticoes == 0
+
+def test_retry_after_alem_do_prazo_falha_sem_esperar():
+    with ServidorLLMSimulado(falhas_iniciais=1, retry_after=30) as servidor:
+        gateway = criar_gateway(servidor, prazo_segundos=1.0)
+        inicio = time.monotonic()
+        with pytest.raises(main.ErroGatewayLLM):
+            completar(gateway)
+        assert time.monotonic() - inicio < 1.0
+
+def test_limita_chamadas_simultaneas():
+    with ServidorLLMSimulado(latencia=0.1) as servidor:
+        gateway = criar_gateway(servidor, max_concorrencia=2)
+        respostas = []
+        threads = [threading.Thread(target=lambda: respostas.append(completar(gateway))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert respostas == [RESPOSTA_PADRAO] * 8
+    assert servidor.pico_simultaneas == 2
+
+def test_fluxo_repete_a_abertura_e_entrega_o_texto():
+    with ServidorLLMSimulado(falhas_iniciais=1) as servidor:
+        gateway = criar_gateway(servidor)
+        partes = [
+            pedaco.choices[0].delta.content
+            for pedaco in gateway.fluxo(messages=MENSAGENS, model="modelo-teste")
+            if pedaco.choices and pedaco.choices[0].delta.content
+        ]
+    assert "".join(partes) == RESPOSTA_PADRAO
+    assert gateway.repeticoes == 1
+
+def test_balde_de_fichas_espaca_as_requisicoes():
+    balde = main.BaldeFichas(taxa=20, capacidade=1)
+    inicio = time.monotonic()
+    for _ in range(3):
+        assert balde.adquirir(inicio + 5)
+    assert time.monotonic() - inicio >= 0.09
+    assert not balde.adquirir(time.monotonic())
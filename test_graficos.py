@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+@pytest.fixture
+def dados_com_identificador():
+    """Primeira coluna de texto é um ID único: fica como string, sem contagens no índice"""
+    aleatorio = np.random.default_rng(3)
+    linhas = 25_000  # Acima de LIMITE_PONTOS_DISPERSAO: a dispersão é amostrada por estrato
+    x = aleatorio.normal(size=linhas)
+    return pd.DataFrame({
+        "cliente": [f"c{i:06d}" for i in range(linhas)],
+        "regiao": aleatorio.choice(["norte", "sul", "leste"], linhas),
+        "x": x,
+        "y": 2 * x + aleatorio.normal(size=linhas),
+    })
+
+@pytest.mark.parametrize("pergunta, tipo", [
+    ("Compare as categorias", "categorias"),
+    ("Me fale sobre os dados", "categorias"),
+    ("Existe correlação entre x e y?", "relacao"),
+])
+def test_graficos_ignoram_texto_de_alta_cardinalidade(criar_analisador, dados_com_identificador, pergunta, tipo):
+    analisador = criar_analisador()
+    analisador.carregar_informacoes(dados_com_identificador)
+    assert "cliente" not in analisador.indice.contagens
+
+    especificacao = analisador._escolher_grafico(pergunta, analisador.conjunto_dados, analisador.indice)
+    assert especificacao[0] == tipo and "cliente" not in especificacao[1]
+    imagem, _ = analisador._iniciar_visualizacao(pergunta).result()
+    assert imagem is not None
+
+def test_grafico_usa_os_dados_do_momento_do_pedido(criar_analisador, dados, monkeypatch):
+    """Trocar o dataset enquanto o gráfico espera no executor não pode misturar dados e impressão"""
+    analisador = criar_analisador()
+    analisador.carregar_informacoes(dados, impressao_digital="grafico-antigo")
+    desenhados = []
+    renderizar_grafico = analisador._renderizar_grafico
+    monkeypatch.setattr(
+        analisador, "_renderizar_grafico",
+        lambda tipo, colunas, dados, indice: desenhados.append(dados) or renderizar_grafico(tipo, colunas, dados, indice),
+    )
+    antigos = analisador.conjunto_dados
+    liberar = main.threading.Event()
+    # Ocupa todos os workers para o gráfico só rodar depois da troca de dataset
+    bloqueios = [main.EXECUTOR_GRAFICOS.submit(liberar.wait) for _ in range(main.EXECUTOR_GRAFICOS._max_workers)]
+    try:
+        futuro = analisador._iniciar_visualizacao("Compare as categorias")
+        analisador.carregar_informacoes(dados.assign(valor=dados["valor"] * 10), impressao_digital="grafico-novo")
+    finally:
+        liberar.set()
+    imagem, _ = futuro.result()
+
+    assert all(bloqueio.result() for bloqueio in bloqueios)
+    assert imagem is not None and desenhados == [antigos]
+    impressoes = [chave[0] for chave in main.CACHE_GRAFICOS._itens]
+    assert "grafico-antigo" in impressoes and "grafico-novo" not in impressoes
+
+def passeio_aleatorio(n, semente):
+    return np.cumsum(np.random.default_rng(semente).normal(size=n))
+
+@pytest.mark.parametrize("n, baldes", [(10_000, 100), (10_007, 64), (5, 10)])
+def test_decimar_min_max_guarda_extremos_de_cada_balde(n, baldes):
+    y = passeio_aleatorio(n, n)
+    indices = main.decimar_min_max(y, baldes)
+    assert len(indices) <= 2 * (baldes + 1)
+    assert np.all(np.diff(indices) > 0)
+    assert y.argmin() in indices and y.argmax() in indices
+
+def test_decimar_lttb_mantem_pontas_e_limite():
+    x = np.arange(50_000, dtype=float)
+    indices = main.decimar_lttb(x, passeio_aleatorio(50_000, 1), 500)
+    assert len(indices) == 500
+    assert indices[0] == 0 and indices[-1] == 49_999
+    assert np.all(np.diff(indices) > 0)
+    assert np.array_equal(main.decimar_lttb(x[:100], x[:100], 500), np.arange(100))
+
+@pytest.mark.parametrize("semente", range(10))
+@pytest.mark.parametrize("n", [5_000, 100_000])
+def test_reduzir_serie_inclui_o_minimo_e_o_maximo_globais(n, semente):
+    y = passeio_aleatorio(n, semente)
+    y[semente * 97] += 1_000  # Pico isolado, que o LTTB sozinho pode descartar
+    indices = main.reduzir_serie(y, limite=main.LIMITE_PONTOS_LINHA)
+    assert len(indices) <= main.LIMITE_PONTOS_LINHA + 2
+    assert np.all(np.diff(indices) > 0)
+    assert y.argmin() in indices and y.argmax() in indices
+
+def test_reduzir_serie_curta_fica_inteira():
+    assert np.array_equal(main.reduzir_serie(np.arange(10.0), limite=100), np.arange(10))
+
+def test_amostrar_linhas_mantem_as_proporcoes_dos_estratos():
+    aleatorio = np.random.default_rng(5)
+    grupos = aleatorio.choice(["a", "b", "c"], 100_000, p=[0.7, 0.25, 0.05])
+    dados = pd.DataFrame({"grupo": grupos, "valor": aleatorio.normal(size=100_000)})
+
+    amostra = main.amostrar_linhas(dados, 2_000, estrato="grupo")
+    assert abs(len(amostra) - 2_000) <= 3  # Arredondamento por estrato
+    pd.testing.assert_series_equal(
+        amostra["grupo"].value_counts(normalize=True), dados["grupo"].value_counts(normalize=True), atol=0.002
+    )
+    assert len(main.amostrar_linhas(dados, 500)) == 500
+    pequeno = dados.head(10)
+    assert main.amostrar_linhas(pequeno, 500) is pequeno
@@ -0,0 +1,112 @@
+import gzip
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as pa_feather
+import pytest
+
+import main
+
+@pytest.fixture
+def tabela():
+    aleatorio = np.random.default_rng(0)
+    return pd.DataFrame({"valor": aleatorio.normal(size=50_000), "codigo": np.arange(50_000)})
+
+def bytes_csv(dataframe):
+    return dataframe.to_csv(index=False).encode()
+
+def bytes_parquet(dataframe):
+    saida = io.BytesIO()
+    dataframe.to_parquet(saida, index=False)
+    return saida.getvalue()
+
+def bytes_arrow(dataframe):
+    saida = io.BytesIO()
+    pa_feather.write_feather(pa.Table.from_pandas(dataframe, preserve_index=False), saida, compression="uncompressed")
+    return saida.getvalue()
+
+@pytest.mark.parametrize("gerar, nome, esperado", [
+    (bytes_parquet, "dados.csv", ("parquet", None)),
+    (bytes_arrow, "dados.csv", ("arrow", None)),
+    (lambda dataframe: gzip.compress(bytes_csv(dataframe)), "dados.csv", ("csv", "gzip")),
+    (lambda dataframe: b"\x28\xb5\x2f\xfd" + bytes_csv(dataframe), "dados.csv", ("csv", "zstd")),
+    (bytes_csv, "dados.parquet", ("csv", None)),
+    (bytes_csv, "DADOS.CSV.GZ", ("csv", "gzip")),
+    (bytes_csv, None, ("csv", None)),
+])
+def test_identificar_usa_a_assinatura_antes_da_extensao(tabela, gerar, nome, esperado):
+    assert main.LeitorDatasets.identificar(gerar(tabela.head()), nome) == esperado
+
+@pytest.mark.parametrize("gerar, nome", [
+    (bytes_csv, "dados.csv"),
+    (lambda dataframe: gzip.compress(bytes_csv(dataframe)), "dados.csv"),
+    (bytes_parquet, "dados.parquet"),
+    (bytes_arrow, "dados.feather"),
+])
+def test_leitura_de_cada_formato(tabela, gerar, nome):
+    lido = main.LeitorDatasets()(gerar(tabela), nome)
+    pd.testing.assert_frame_equal(lido.astype("float64"), tabela.astype("float64"))
+
+def test_arrow_e_gravado_uma_vez_e_lido_por_memory_map(tabela, tmp_path, monkeypatch):
+    mapeados = []
+    memory_map = pa.memory_map
+    monkeypatch.setattr(pa, "memory_map", lambda caminho, modo: mapeados.append(caminho) or memory_map(caminho, modo))
+    leitor = main.LeitorDatasets(str(tmp_path))
+    conteudo = bytes_arrow(tabela)
+    primeiro = leitor(conteudo, "dados.feather", "abc")
+    caminho = tmp_path / "abc.arrow"
+    assert caminho.read_bytes() == conteudo
+    assert not list(tmp_path.glob("*.parcial"))
+
+    os.utime(caminho, (0, 0))
+    segundo = leitor(conteudo, "dados.feather", "abc")
+    assert mapeados == [str(caminho)] * 2
+    assert caminho.stat().st_mtime > 0  # Leitura conta como uso para a limpeza LRU
+    pd.testing.assert_frame_equal(primeiro, segundo)
+
+def test_guardar_original_de_bytes_e_de_arquivo(tmp_path):
+    leitor = main.LeitorDatasets(str(tmp_path))
+    conteudo = b"a,b\n1,2\n"
+    chave = leitor.guardar_original(conteudo)
+    assert leitor.guardar_original(io.BytesIO(conteudo)) == chave
+    assert open(leitor.localizar_original(chave), "rb").read() == conteudo
+    assert leitor.localizar_original("inexistente") is None
+
+def test_limpar_cache_remove_os_menos_usados_ate_caber(tmp_path):
+    leitor = main.LeitorDatasets(str(tmp_path), limite_bytes_cache=2500)
+    for i, nome in enumerate(["a.arrow", "b.parquet", "c.original", "d.arrow"]):
+        caminho = tmp_path / nome
+        caminho.write_bytes(b"x" * 1000)
+        os.utime(caminho, (i, i))
+    (tmp_path / "outro.txt").write_bytes(b"x" * 5000)  # Fora do cache: nunca é removido
+
+    leitor.limpar_cache(preservar=str(tmp_path / "a.arrow"))
+    assert sorted(os.listdir(tmp_path)) == ["a.arrow", "d.arrow", "outro.txt"]
+
+def test_gravacao_aplica_o_limite_do_cache(tmp_path):
+    leitor = main.LeitorDatasets(str(tmp_path), limite_bytes_cache=1)
+    leitor.guardar_original(b"antigo")
+    chave = leitor.guardar_original(b"novo")
+    # Só o arquivo recém-gravado fica, mesmo acima do limite
+    assert os.listdir(tmp_path) == [chave + ".original"]
+
+def test_sem_pyarrow_nem_zstandard_zstd_nao_e_oferecido(monkeypatch):
+    monkeypatch.setattr(main, "pa", None)
+    monkeypatch.setattr(main, "TEM_ZSTANDARD", False)
+    assert main.LeitorDatasets.extensoes_suportadas() == ("csv", "gz")
+    with pytest.raises(ValueError, match="zstd"):
+        main.LeitorDatasets()(b"\x28\xb5\x2f\xfd" + b"conteudo", "dados.csv")
+    with pytest.raises(ValueError, match="pyarrow"):
+        main.LeitorDatasets()(b"PAR1conteudo", "dados.parquet")
+
+def test_armazem_otimiza_os_tipos_uma_unica_vez(monkeypatch):
+    chamadas = []
+    otimizar_tipos = main.otimizar_tipos
+    monkeypatch.setattr(main, "otimizar_tipos", lambda dataframe: chamadas.append(1) or otimizar_tipos(dataframe))
+    conteudo = bytes_csv(pd.DataFrame({"id": [f"id{i}" for i in range(100)], "grupo": ["a", "b"] * 50}))
+    _, dados = main.ArmazemDatasets().carregar(conteudo, "dados.csv")
+    assert len(chamadas) == 1
+    assert isinstance(dados["grupo"].dtype, pd.CategoricalDtype) and not isinstance(dados["id"].dtype, pd.CategoricalDtype)
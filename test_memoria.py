@@ -0,0 +1,115 @@
+import main
+
+RESPOSTA = (
+    "A distribuição mostra uma tendência de alta e uma correlação forte entre as colunas. "
+    "Portanto, o padrão é sazonal."
+)
+
+def test_memoria_e_restaurada_de_outra_instancia(persistencia):
+    id_sessao = persistencia.criar_sessao()
+    memoria = main.SistemaMemoria(persistencia=persistencia, id_sessao=id_sessao)
+    memoria.registrar_analise("Qual a distribuição dos valores?", RESPOSTA)
+    memoria.registrar_analise("Há correlação entre as colunas?", RESPOSTA)
+    memoria.adicionar_padrao("tendencia", "alta", {"coluna": "valor"})
+    memoria.adicionar_conclusao("Valores crescem ao longo do tempo", "alto")
+
+    restaurada = main.SistemaMemoria(persistencia=persistencia, id_sessao=id_sessao)
+    assert restaurada.contador_interacoes == 2
+    assert [registro.pergunta for registro in restaurada.historico_analises] == [
+        registro.pergunta for registro in memoria.historico_analises
+    ]
+    assert [registro.chave for registro in restaurada.insights_coletados] == [
+        registro.chave for registro in memoria.insights_coletados
+    ]
+    assert len(restaurada.padroes_detectados) == 1
+    assert restaurada.obter_resumo_conclusoes() == memoria.obter_resumo_conclusoes()
+
+def test_restauracao_traz_so_o_que_cabe_nos_buffers(persistencia):
+    id_sessao = persistencia.criar_sessao()
+    memoria = main.SistemaMemoria(capacidade_historico=3, persistencia=persistencia, id_sessao=id_sessao)
+    for i in range(10):
+        memoria.registrar_analise(f"Pergunta {i}", "Sem destaques.")
+
+    restaurada = main.SistemaMemoria(capacidade_historico=3, persistencia=persistencia, id_sessao=id_sessao)
+    assert restaurada.contador_interacoes == 10
+    assert [registro.pergunta for registro in restaurada.historico_analises] == ["Pergunta 7", "Pergunta 8", "Pergunta 9"]
+
+def test_sessoes_nao_compartilham_memoria(persistencia):
+    primeira, segunda = persistencia.criar_sessao(), persistencia.criar_sessao()
+    main.SistemaMemoria(persistencia=persistencia, id_sessao=primeira).registrar_analise("Pergunta", RESPOSTA)
+    assert main.SistemaMemoria(persistencia=persistencia, id_sessao=segunda).contador_interacoes == 0
+
+def test_recarregar_o_mesmo_dataset_mantem_a_memoria(persistencia, criar_analisador, dados):
+    id_sessao = persistencia.criar_sessao()
+    analisador = criar_analisador(id_sessao=id_sessao)
+    analisador.carregar_informacoes(dados)
+    analisador.memoria.registrar_analise("Qual a distribuição dos valores?", RESPOSTA)
+    insights = len(analisador.memoria.insights_coletados)
+    conclusoes = len(analisador.memoria.conclusoes_gerais)
+
+    # Processo reiniciado: nova instância da sessão, que recarrega o mesmo conteúdo
+    restaurado = criar_analisador(id_sessao=id_sessao)
+    restaurado.carregar_informacoes(dados.copy())
+    assert restaurado.memoria.contador_interacoes == 1
+    assert len(restaurado.memoria.insights_coletados) == insights
+    assert len(restaurado.memoria.conclusoes_gerais) == conclusoes
+
+    # Outro dataset: a memória recomeça, inclusive em disco
+    restaurado.carregar_informacoes(dados.assign(valor=dados["valor"] * 2))
+    assert restaurado.memoria.contador_interacoes == 0
+    assert criar_analisador(id_sessao=id_sessao).memoria.contador_interacoes == 0
+
+def test_descricao_do_dataset_acompanha_a_sessao(persistencia, criar_analisador, dados):
+    id_sessao = persistencia.criar_sessao()
+    analisador = criar_analisador(id_sessao=id_sessao)
+    analisador.carregar_informacoes(dados)
+    descricao = {"arquivo": "abc", "nome": "dados.csv", "modo": "memoria", "tamanho_bloco": None, "anexos": []}
+    analisador.memoria.associar_dataset(analisador.memoria.impressao_dataset, descricao)
+
+    restaurada = main.SistemaMemoria(persistencia=persistencia, id_sessao=id_sessao)
+    assert restaurada.impressao_dataset == analisador.perfil_dados.impressao_digital
+    assert restaurada.descricao_dataset == descricao
+
+def test_conversa_e_paginada_a_partir_do_disco(persistencia):
+    id_sessao = persistencia.criar_sessao()
+    conversa = main.GerenciadorConversa(persistencia, id_sessao)
+    for i in range(12):
+        conversa.adicionar_mensagem("usuario", f"mensagem {i}")
+
+    restaurada = main.GerenciadorConversa(persistencia, id_sessao, tamanho_pagina=5)
+    assert restaurada.total_mensagens == 12
+    assert [registro["conteudo"] for registro in restaurada.registros] == [f"mensagem {i}" for i in range(7, 12)]
+    restaurada.carregar_anteriores()
+    assert len(restaurada.registros) == 10 and restaurada.ha_mensagens_anteriores
+
+def test_duas_abas_na_mesma_sessao_nao_colidem(persistencia):
+    id_sessao = persistencia.criar_sessao()
+    primeira = main.GerenciadorConversa(persistencia, id_sessao)
+    segunda = main.GerenciadorConversa(persistencia, id_sessao)
+    for i in range(3):
+        primeira.adicionar_mensagem("usuario", f"aba 1, mensagem {i}")
+        segunda.adicionar_mensagem("usuario", f"aba 2, mensagem {i}")
+    assert primeira.total_mensagens == 5 and segunda.total_mensagens == 6
+
+    restaurada = main.GerenciadorConversa(persistencia, id_sessao)
+    assert [registro["conteudo"] for registro in restaurada.registros] == [
+        f"aba {aba}, mensagem {i}" for i in range(3) for aba in (1, 2)
+    ]
+    assert [registro["ordem"] for registro in restaurada.registros] == list(range(6))
+
+def test_indice_por_tipo_acompanha_o_historico():
+    memoria = main.SistemaMemoria(capacidade_historico=3)
+    perguntas = ["Há correlação entre as colunas?"] + [f"Pergunta {i}" for i in range(3)] + ["Há correlação de novo?"]
+    for pergunta in perguntas:
+        memoria.registrar_analise(pergunta, "Sem destaques.")
+
+    tipo_correlacao = main.ANALISADOR_TEXTO.classificar(perguntas[0])
+    assert tipo_correlacao != "geral"
+    # A primeira análise de correlação saiu do histórico e, com ela, do índice por tipo
+    assert [registro.pergunta for registro in memoria.obter_historico_por_tipo(tipo_correlacao)] == ["Há correlação de novo?"]
+    assert [registro.pergunta for registro in memoria.obter_historico_por_tipo("geral")] == ["Pergunta 1", "Pergunta 2"]
+    assert sum(map(len, memoria._analises_por_tipo.values())) == len(memoria.historico_analises) == 3
+
+    for i in range(3):
+        memoria.registrar_analise(f"Outra {i}", "Sem destaques.")
+    assert list(memoria._analises_por_tipo) == ["geral"]  # Tipos sem análises no histórico são removidos
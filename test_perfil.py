@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+import main
+
+def test_segunda_sessao_reaproveita_o_perfil_de_outliers(criar_analisador, dados, monkeypatch):
+    chamadas = []
+    perfilar_colunas = main.perfilar_colunas
+    monkeypatch.setattr(main, "perfilar_colunas", lambda *args, **kwargs: chamadas.append(args) or perfilar_colunas(*args, **kwargs))
+    impressao = main.calcular_impressao_digital(dados) + "-perfil"
+    indice = main.IndiceDataset(dados)
+
+    primeira, segunda = criar_analisador(), criar_analisador()
+    primeira.carregar_informacoes(dados, impressao_digital=impressao, indice=indice)
+    segunda.carregar_informacoes(dados, impressao_digital=impressao, indice=indice)
+    assert len(chamadas) == 1
+    assert segunda.perfil_colunas is primeira.perfil_colunas
+    assert segunda.perfil_dados is primeira.perfil_dados
+
+def test_ausentes_do_indice_conferem_com_o_dataframe():
+    aleatorio = np.random.default_rng(2)
+    dados = pd.DataFrame({"x": aleatorio.normal(size=1000), "texto": aleatorio.choice(["a", "b"], 1000)})
+    dados.loc[aleatorio.choice(1000, 120, replace=False), "x"] = np.nan
+    dados.loc[:49, "texto"] = None
+
+    perfil, taxa_ausentes = main.perfilar_colunas(dados, ["x"], main.IndiceDataset(dados).ausentes)
+    esperado, _ = main.perfilar_colunas(dados, ["x"])
+    pd.testing.assert_series_equal(taxa_ausentes, dados.isna().mean())
+    pd.testing.assert_frame_equal(perfil, esperado)
+    assert perfil.loc["x", "taxa_ausentes"] == 0.12